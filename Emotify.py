@@ -1,35 +1,20 @@
-import streamlit as st
-import google.generativeai as genai
-import requests
-from nrclex import NRCLex
-import plotly.graph_objects as go
-import plotly.express as px
+import time
+_render_started = time.perf_counter()
+
 import json
+import logging
+import streamlit as st
 import os
 from dotenv import load_dotenv
-import nltk
-import re
-
-# Download required NLTK data
-try:
-    nltk.data.find('tokenizers/punkt')
-except LookupError:
-    nltk.download('punkt')
-
-try:
-    nltk.data.find('corpora/stopwords')
-except LookupError:
-    nltk.download('stopwords')
-
-try:
-    nltk.data.find('taggers/averaged_perceptron_tagger')
-except LookupError:
-    nltk.download('averaged_perceptron_tagger')
-
-try:
-    nltk.data.find('corpora/brown')
-except LookupError:
-    nltk.download('brown')
+from analysis_cache import get_analysis_cache
+import emotify_core as core
+import http_client
+from pipeline import AnalysisRun
+from session_results import AnalysisResult, ResultHistory
+from thumbnails import get_thumbnail_cache
+from tracing import get_tracer
+
+logger = logging.getLogger("emotify")
 
 # Load environment variables
 load_dotenv()
@@ -38,6 +23,11 @@ load_dotenv()
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 GENIUS_API_KEY = os.getenv('GENIUS_API_KEY')
 
+tracer = get_tracer()
+
+# Stage timings are shown with EMOTIFY_DEBUG_PANEL=1 or by opening the app with ?debug=1
+DEBUG_PANEL = os.getenv('EMOTIFY_DEBUG_PANEL', '').lower() in ('1', 'true', 'yes') or st.query_params.get('debug') == '1'
+
 # Page configuration
 st.set_page_config(
     page_title="Emotify - Song Emotion Detector",
@@ -244,125 +234,161 @@ with col3:
 
 st.markdown('</div>', unsafe_allow_html=True)
 
-def search_song_genius(artist, song, api_key):
-    """Search for a song on Genius API with better matching"""
+def resolve_song(run):
+    """Resolve a song from the local index or the Genius API"""
     try:
-        search_url = "https://api.genius.com/search"
-        headers = {"Authorization": f"Bearer {api_key}"}
-        params = {"q": f"{artist} {song}"}
-        
-        response = requests.get(search_url, headers=headers, params=params)
-        data = response.json()
-        
-        if data['response']['hits']:
-            best_match = None
-            best_score = 0
-            
-            for hit in data['response']['hits'][:5]:
-                result = hit['result']
-                title = result['title'].lower()
-                artist_name = result['primary_artist']['name'].lower()
-                
-                title_match = song.lower() in title or title in song.lower()
-                artist_match = artist.lower() in artist_name or artist_name in artist.lower()
-                
-                score = (2 if title_match else 0) + (1 if artist_match else 0)
-                
-                if score > best_score:
-                    best_score = score
-                    best_match = result
-            
-            if best_match:
-                return {
-                    'title': best_match['title'],
-                    'artist': best_match['primary_artist']['name'],
-                    'url': best_match['url'],
-                    'thumbnail': best_match['song_art_image_thumbnail_url'],
-                    'id': best_match['id'],
-                    'full_title': best_match['full_title']
-                }
-        return None
+        return run.resolve()
     except Exception as e:
         st.error(f"Error searching song: {str(e)}")
-        return None
+        return None, False
 
-def analyze_with_gemini(song_info, api_key):
-    """Use Gemini to provide comprehensive song analysis"""
+def song_thumbnail(url):
+    """Album art from the local thumbnail cache, or the Genius URL if it can't be fetched"""
     try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')
+        return get_thumbnail_cache().get(url)
+    except Exception as e:
+        logger.warning("Serving thumbnail from Genius instead of the cache: %s", e)
+        return url
+
+def build_gemini_layout():
+    """Lay out the Gemini analysis sections and return a placeholder for each field"""
+    st.markdown("## 🎭 Comprehensive Emotion Analysis")
+    slots = {'cache_status': st.empty()}
+    
+    # Metrics in cards
+    metric_col1, metric_col2, metric_col3 = st.columns(3)
+    with metric_col1:
+        slots['mood'] = st.empty()
+    with metric_col2:
+        slots['tempo_energy'] = st.empty()
+    with metric_col3:
+        slots['valence'] = st.empty()
+    
+    st.markdown("---")
+    
+    # Detailed analysis
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.markdown("### 🔍 Overall Tone")
+        slots['overall_tone'] = st.empty()
         
-        prompt = f"""You are an expert music analyst. Analyze the song "{song_info['title']}" by {song_info['artist']}.
-
-Provide a DETAILED and ACCURATE emotional analysis based on your knowledge of this specific song. Do NOT provide generic responses.
-
-Return a JSON object with this EXACT structure:
-{{
-    "overall_tone": "A detailed 2-3 sentence description of the song's emotional atmosphere",
-    "primary_emotions": [
-        {{"emotion": "Emotion1", "intensity": 0-10, "description": "Specific evidence from the song"}},
-        {{"emotion": "Emotion2", "intensity": 0-10, "description": "Specific evidence from the song"}},
-        {{"emotion": "Emotion3", "intensity": 0-10, "description": "Specific evidence from the song"}},
-        {{"emotion": "Emotion4", "intensity": 0-10, "description": "Specific evidence from the song"}}
-    ],
-    "mood": "Specific mood classification",
-    "themes": "Detailed description of thematic elements (3-4 sentences)",
-    "emotional_keywords": ["keyword1", "keyword2", "keyword3", "keyword4", "keyword5", "keyword6", "keyword7", "keyword8", "keyword9", "keyword10", "keyword11", "keyword12", "keyword13", "keyword14", "keyword15"],
-    "tempo_energy": "slow/medium/fast",
-    "valence": "positive/negative/mixed",
-    "lyrical_themes": ["theme1", "theme2", "theme3"],
-    "emotional_arc": "Description of how emotions change throughout the song",
-    "musical_elements": "Description of how instrumentation/production affects emotions"
-}}
-
-Be specific to THIS song. Include actual details about the lyrics' themes, the musical production, and emotional journey."""
-
-        response = model.generate_content(prompt)
-        response_text = response.text.strip()
+        st.markdown("### 🎨 Thematic Elements")
+        slots['themes'] = st.empty()
         
-        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-        if json_match:
-            result = json.loads(json_match.group())
-        else:
-            result = json.loads(response_text)
+        st.markdown("### 🎵 Musical Elements")
+        slots['musical_elements'] = st.empty()
+    
+    with col2:
+        st.markdown("### 💭 Primary Emotions Detected")
+        slots['primary_emotions'] = st.empty()
         
-        return result
-    except json.JSONDecodeError as e:
+        st.markdown("### 📖 Lyrical Themes")
+        slots['lyrical_themes'] = st.empty()
+    
+    st.markdown("### 🌊 Emotional Arc")
+    slots['emotional_arc'] = st.empty()
+    return slots
+
+def fill_gemini_section(slots, key, value):
+    """Render one completed Gemini field into its placeholder"""
+    slot = slots.get(key)
+    if slot is None:
+        return
+    
+    if key == 'mood':
+        slot.metric("💭 Mood", value)
+    elif key == 'tempo_energy':
+        slot.metric("⚡ Tempo/Energy", value.capitalize())
+    elif key == 'valence':
+        slot.metric("🎨 Valence", value.capitalize())
+    elif key == 'overall_tone':
+        slot.info(value)
+    elif key == 'primary_emotions':
+        with slot.container():
+            for emotion_data in value:
+                intensity = emotion_data.get('intensity', 5)
+                emotion_name = emotion_data.get('emotion', 'Unknown')
+                description = emotion_data.get('description', 'No description')
+                
+                with st.expander(f"**{emotion_name}** - Intensity: {intensity}/10"):
+                    st.write(description)
+    elif key == 'lyrical_themes':
+        with slot.container():
+            for theme in value:
+                st.markdown(f"• {theme}")
+    else:
+        slot.write(value)
+
+def stream_gemini_analysis(run, slots):
+    """Stream the Gemini analysis into the layout, rendering each section as it completes"""
+    analysis = {}
+    try:
+        for key, value in run.stream_analysis():
+            analysis[key] = value
+            fill_gemini_section(slots, key, value)
+    except core.GeminiResponseError as e:
         st.error(f"Error parsing Gemini response: {str(e)}")
-        st.code(response_text)
+        st.code(e.response_text)
+        return None
+    except TimeoutError as e:
+        st.error(f"Gemini took too long to respond, please try again: {str(e)}")
         return None
     except Exception as e:
         st.error(f"Error with Gemini analysis: {str(e)}")
         return None
+    
+    fill_missing_sections(slots, analysis)
+    return analysis
+
+def fill_missing_sections(slots, analysis):
+    """Mark the sections Gemini left out as N/A"""
+    for key in ('mood', 'tempo_energy', 'valence', 'overall_tone', 'themes', 'musical_elements', 'emotional_arc'):
+        if key not in analysis:
+            fill_gemini_section(slots, key, 'N/A')
+
+def draw_gemini_analysis(analysis):
+    """Redraw a finished Gemini analysis into a fresh layout"""
+    slots = build_gemini_layout()
+    for key, value in analysis.items():
+        fill_gemini_section(slots, key, value)
+    fill_missing_sections(slots, analysis)
+    return slots
 
 def analyze_emotions_nrclex(keywords):
     """Analyze emotions using NRCLex with improved accuracy"""
     try:
-        text = ' '.join(keywords)
-        emotion_obj = NRCLex(text)
-        raw_scores = emotion_obj.raw_emotion_scores
-        
-        if raw_scores:
-            total = sum(raw_scores.values())
-            if total > 0:
-                normalized_scores = {k: (v / total) * 100 for k, v in raw_scores.items()}
-            else:
-                normalized_scores = raw_scores
-        else:
-            normalized_scores = {}
-        
-        affect_dict = emotion_obj.affect_dict
-        
-        return {
-            'raw_scores': raw_scores,
-            'normalized_scores': normalized_scores,
-            'affect_dict': affect_dict,
-            'word_count': len(emotion_obj.words)
-        }
+        return core.analyze_emotions_nrclex(keywords)
     except Exception as e:
         st.error(f"Error with NRCLex: {str(e)}")
         return None
 
+def find_similar_songs(result):
+    """Remember this song's emotion vector and look up the closest songs analyzed so far"""
+    try:
+        core.store_emotion_vector(result.song_info, result.nrc_results, result.gemini_analysis)
+        result.set_similar(core.similar_songs(result.song_info['id'], k=5))
+    except Exception as e:
+        result.similar_error = str(e)
+
+def show_similar_songs(result):
+    """List the songs that feel most like this one"""
+    if result.similar_error:
+        st.warning(f"Could not search for similar songs: {result.similar_error}")
+        return
+    
+    if not result.similar:
+        st.caption("Analyze more songs to discover ones that feel like this")
+        return
+    
+    for info, similarity in result.similar:
+        st.markdown(f"**[{info['title']}]({info['url']})** by {info['artist']} · {similarity * 100:.0f}% emotional match")
+
+def plot_chart(name, build_figure, *args):
+    """Build and draw one chart, timed as its own pipeline stage"""
+    with tracer.span(f'chart.{name}'):
+        st.plotly_chart(build_figure(*args), use_container_width=True)
+
 def create_emotion_visualizations(nrc_results, gemini_analysis):
     """Create comprehensive visualizations"""
     
@@ -370,96 +396,267 @@ def create_emotion_visualizations(nrc_results, gemini_analysis):
         st.warning("No emotion data available for visualization")
         return
     
+    # Plotly is only needed once there are results, so keep it off the first render
+    import charts
+    
     normalized_scores = nrc_results['normalized_scores']
     
     col1, col2 = st.columns(2)
     
     with col1:
-        emotions = list(normalized_scores.keys())
-        scores = list(normalized_scores.values())
-        
-        fig_radar = go.Figure()
-        fig_radar.add_trace(go.Scatterpolar(
-            r=scores,
-            theta=emotions,
-            fill='toself',
-            name='Emotion Intensity',
-            line_color='#667eea',
-            fillcolor='rgba(102, 126, 234, 0.4)'
-        ))
-        
-        fig_radar.update_layout(
-            polar=dict(
-                radialaxis=dict(
-                    visible=True, 
-                    range=[0, max(scores) if scores else 100],
-                    tickfont=dict(size=10)
-                )
-            ),
-            showlegend=False,
-            title="Emotion Distribution (NRCLex)",
-            height=400,
-            font=dict(size=12)
-        )
-        
-        st.plotly_chart(fig_radar, use_container_width=True)
+        plot_chart('radar', charts.build_radar_figure, normalized_scores)
     
     with col2:
-        sorted_emotions = sorted(normalized_scores.items(), key=lambda x: x[1], reverse=True)
-        
-        emotions_list = [e[0].capitalize() for e in sorted_emotions]
-        scores_list = [e[1] for e in sorted_emotions]
-        
-        colors = ['#667eea', '#764ba2', '#f093fb', '#4facfe', '#00f2fe', 
-                  '#43e97b', '#fa709a', '#fee140', '#30cfd0', '#a8edea']
-        
-        fig_bar = go.Figure(data=[
-            go.Bar(
-                x=emotions_list,
-                y=scores_list,
-                marker_color=colors[:len(emotions_list)],
-                text=[f'{s:.1f}%' for s in scores_list],
-                textposition='outside'
-            )
-        ])
-        
-        fig_bar.update_layout(
-            title='Emotion Intensity Rankings',
-            xaxis_title='Emotion',
-            yaxis_title='Intensity (%)',
-            height=400,
-            showlegend=False
-        )
-        
-        st.plotly_chart(fig_bar, use_container_width=True)
+        plot_chart('ranking', charts.build_ranking_figure, normalized_scores)
     
     if gemini_analysis and 'primary_emotions' in gemini_analysis:
         st.markdown("### 🎭 AI-Detected Primary Emotions")
         
-        gemini_emotions = gemini_analysis['primary_emotions']
-        emotion_names = [e['emotion'] for e in gemini_emotions]
-        intensities = [e.get('intensity', 5) for e in gemini_emotions]
-        
-        fig_gemini = go.Figure(data=[
-            go.Bar(
-                y=emotion_names,
-                x=intensities,
-                orientation='h',
-                marker_color='#764ba2',
-                text=[f'{i}/10' for i in intensities],
-                textposition='outside'
+        plot_chart('gemini_intensity', charts.build_gemini_intensity_figure, gemini_analysis['primary_emotions'])
+
+def score_emotion_timeline(run, result):
+    """Wait for the lyric timeline and keep it with the result"""
+    try:
+        result.set_timeline(run.timeline())
+    except Exception as e:
+        result.timeline_error = str(e)
+
+def create_emotion_timeline(result):
+    """Plot how lyric emotions move from section to section"""
+    if result.timeline_error:
+        st.warning(f"Could not build the lyric emotion timeline: {result.timeline_error}")
+        return
+    
+    timeline = result.timeline
+    if not timeline:
+        st.warning("No lyrics found on the Genius page for this song")
+        return
+    
+    import charts
+    
+    plot_chart('timeline', charts.build_timeline_figure, timeline)
+    
+    repeated = sum(1 for point in timeline if point['repeat'])
+    st.caption(f"{len(timeline)} sections scored from the lyrics ({repeated} repeated sections reused)")
+
+def render_debug_panel(run_trace):
+    """Show where the last analysis spent its time, plus the exported metrics"""
+    with st.expander("🛠️ Performance Debug Panel", expanded=run_trace is not None):
+        if run_trace is None:
+            st.caption("Run an analysis to see its stage timings")
+        else:
+            st.caption(f"Trace {run_trace.trace_id[:8]} finished in {run_trace.duration * 1000:.0f} ms")
+            st.dataframe(
+                [
+                    {
+                        'Stage': span.name,
+                        'Parent': span.parent or '',
+                        'Duration (ms)': round(span.duration * 1000, 1),
+                        'Details': ', '.join(f"{key}={value}" for key, value in span.attrs.items()),
+                        'Error': span.error or ''
+                    }
+                    for span in run_trace.spans
+                ],
+                use_container_width=True
+            )
+            st.download_button(
+                "⬇️ Download trace (JSONL)",
+                json.dumps(run_trace.to_dict()) + "\n",
+                file_name=f"emotify_trace_{run_trace.trace_id[:8]}.jsonl",
+                mime="application/jsonl"
             )
-        ])
         
-        fig_gemini.update_layout(
-            title='Gemini AI Emotion Intensity Ratings',
-            xaxis_title='Intensity (0-10)',
-            yaxis_title='Emotion',
-            height=300,
-            showlegend=False
+        metrics = tracer.prometheus_text()
+        st.download_button("⬇️ Download metrics (Prometheus)", metrics, file_name="emotify_metrics.prom", mime="text/plain")
+        st.code(metrics, language="text")
+
+def render_song_card(result):
+    """Show which song was found and its album art"""
+    song_info = result.song_info
+    st.success(f"✅ Found: **{song_info['title']}** by **{song_info['artist']}**")
+    for note in result.notes:
+        st.caption(note)
+    
+    st.markdown("---")
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        if song_info['thumbnail']:
+            st.image(song_thumbnail(song_info['thumbnail']), width=200)
+    with col2:
+        st.markdown(f"### {song_info['title']}")
+        st.markdown(f"**Artist:** {song_info['artist']}")
+        st.markdown(f"[🔗 View on Genius]({song_info['url']})")
+    
+    st.markdown("---")
+
+def render_emotion_details(result):
+    """Show the NRCLex metrics, the summary and similar songs of a finished analysis"""
+    gemini_analysis = result.gemini_analysis
+    nrc_results = result.nrc_results
+    
+    st.markdown("---")
+    st.markdown("## 📊 Detailed Emotion Metrics")
+    
+    emotional_keywords = gemini_analysis.get('emotional_keywords', [])
+    if emotional_keywords:
+        if nrc_results and nrc_results.get('normalized_scores'):
+            with st.expander("🔑 Emotional Keywords Analyzed"):
+                st.write(", ".join(emotional_keywords))
+                st.caption(f"Total words analyzed: {nrc_results.get('word_count', 0)}")
+            
+            create_emotion_visualizations(nrc_results, gemini_analysis)
+            
+            st.markdown("### 📋 Detailed Emotion Breakdown")
+            
+            scores_sorted = sorted(
+                nrc_results['normalized_scores'].items(), 
+                key=lambda x: x[1], 
+                reverse=True
+            )
+            
+            cols = st.columns(4)
+            for idx, (emotion, score) in enumerate(scores_sorted):
+                with cols[idx % 4]:
+                    raw_score = nrc_results['raw_scores'].get(emotion, 0)
+                    st.metric(
+                        emotion.capitalize(), 
+                        f"{score:.1f}%",
+                        f"{raw_score} words"
+                    )
+        else:
+            st.warning("Could not calculate NRCLex scores")
+    else:
+        st.warning("No emotional keywords available for analysis")
+    
+    # Summary section
+    st.markdown("---")
+    st.markdown("## 📋 Analysis Summary")
+    
+    summary_col1, summary_col2 = st.columns(2)
+    
+    with summary_col1:
+        st.markdown("### 🎯 Key Takeaways")
+        st.write(f"**Primary Mood:** {gemini_analysis.get('mood', 'N/A')}")
+        st.write(f"**Emotional Valence:** {gemini_analysis.get('valence', 'N/A').capitalize()}")
+        st.write(f"**Energy Level:** {gemini_analysis.get('tempo_energy', 'N/A').capitalize()}")
+    
+    with summary_col2:
+        st.markdown("### 🏆 Top 3 Emotions")
+        if nrc_results and nrc_results.get('normalized_scores'):
+            top_3 = sorted(
+                nrc_results['normalized_scores'].items(),
+                key=lambda x: x[1],
+                reverse=True
+            )[:3]
+            for i, (emotion, score) in enumerate(top_3, 1):
+                st.write(f"{i}. **{emotion.capitalize()}**: {score:.1f}%")
+    
+    st.markdown("---")
+    st.markdown("## 🎧 Songs That Feel Like This")
+    show_similar_songs(result)
+
+def render_timeline_heading():
+    """Start the lyric timeline section"""
+    st.markdown("---")
+    st.markdown("## 🎼 Lyric Emotion Timeline")
+
+def analyze_song(artist, song, run_trace):
+    """Run the pipeline for a song, drawing each section as it completes
+    
+    Returns the finished AnalysisResult, or None if the song wasn't found or Gemini failed.
+    """
+    run = AnalysisRun(artist, song, GENIUS_API_KEY, GEMINI_API_KEY)
+    with st.spinner("🔍 Searching for song..."):
+        song_info, from_index = resolve_song(run)
+    
+    if not song_info:
+        st.error("❌ Song not found. Please check the artist and song name.")
+        return None
+    
+    # Gemini and the lyric timeline run in the background while the page renders
+    run.start_analysis()
+    
+    notes = []
+    genius_latency = http_client.latency_stats('api.genius.com')
+    if from_index:
+        notes.append("Resolved from the local song index")
+    elif genius_latency['count']:
+        notes.append(f"Genius lookup took {genius_latency['last_ms']:.0f} ms")
+    if run.speculation_kept:
+        notes.append("Gemini started analyzing your query while Genius was still searching")
+    
+    result = AnalysisResult(song_info, notes)
+    result.trace = run_trace
+    render_song_card(result)
+    
+    # Analyze with Gemini, filling in each section as soon as its field arrives
+    with st.spinner("🤖 Analyzing emotions with Gemini AI..."):
+        analysis_area = st.empty()
+        with analysis_area.container():
+            gemini_slots = build_gemini_layout()
+        result.gemini_analysis = stream_gemini_analysis(run, gemini_slots)
+    
+    if not result.gemini_analysis:
+        analysis_area.empty()
+    else:
+        cache_stats = get_analysis_cache().stats()
+        result.cache_status = (
+            f"⚡ Analysis cache: {cache_stats['hits']} hits / {cache_stats['stale_hits']} refreshing / "
+            f"{cache_stats['misses']} misses "
+            f"({cache_stats['entries']} songs stored)"
         )
+        gemini_slots['cache_status'].caption(result.cache_status)
         
-        st.plotly_chart(fig_gemini, use_container_width=True)
+        emotional_keywords = result.gemini_analysis.get('emotional_keywords', [])
+        if emotional_keywords:
+            with st.spinner("📈 Calculating emotion scores..."):
+                result.set_nrc_results(analyze_emotions_nrclex(emotional_keywords))
+        find_similar_songs(result)
+        render_emotion_details(result)
+    
+    render_timeline_heading()
+    with st.spinner("🎼 Scoring lyrics section by section..."):
+        score_emotion_timeline(run, result)
+    create_emotion_timeline(result)
+    return result if result.gemini_analysis else None
+
+def render_result(result):
+    """Redraw a finished analysis from session state without calling any API"""
+    render_song_card(result)
+    slots = draw_gemini_analysis(result.gemini_analysis)
+    slots['cache_status'].caption(result.cache_status)
+    render_emotion_details(result)
+    render_timeline_heading()
+    create_emotion_timeline(result)
+
+def render_history(history):
+    """Let the user switch between this session's recent analyses"""
+    entries = history.entries()
+    if len(entries) < 2:
+        return
+    
+    labels = {result.song_info['id']: result.label for result in entries}
+    if history.current_id in labels:
+        st.session_state['history_choice'] = history.current_id
+        index = 0
+    else:
+        st.session_state.pop('history_choice', None)
+        index = None
+    st.selectbox(
+        "🕘 Recent analyses",
+        list(labels),
+        index=index,
+        format_func=labels.get,
+        key='history_choice',
+        placeholder="Switch to an earlier song",
+        on_change=lambda: history.select(st.session_state['history_choice'])
+    )
+
+# Results live in session state, so widget reruns redraw them instead of dropping or recomputing them
+history = ResultHistory(st.session_state)
+history_area = st.container()
+result = None
+run_trace = None
 
 if analyze_button:
     if not GEMINI_API_KEY:
@@ -469,140 +666,30 @@ if analyze_button:
     elif not artist_name or not song_name:
         st.error("⚠️ Please enter both artist name and song title")
     else:
-        with st.spinner("🔍 Searching for song..."):
-            song_info = search_song_genius(artist_name, song_name, GENIUS_API_KEY)
-        
-        if song_info:
-            st.success(f"✅ Found: **{song_info['title']}** by **{song_info['artist']}**")
-            
-            # Song info card
-            st.markdown("---")
-            col1, col2 = st.columns([1, 3])
-            with col1:
-                st.image(song_info['thumbnail'], width=200)
-            with col2:
-                st.markdown(f"### {song_info['title']}")
-                st.markdown(f"**Artist:** {song_info['artist']}")
-                st.markdown(f"[🔗 View on Genius]({song_info['url']})")
-            
-            st.markdown("---")
-            
-            # Analyze with Gemini
-            with st.spinner("🤖 Analyzing emotions with Gemini AI..."):
-                gemini_analysis = analyze_with_gemini(song_info, GEMINI_API_KEY)
-            
-            if gemini_analysis:
-                st.markdown("## 🎭 Comprehensive Emotion Analysis")
-                
-                # Metrics in cards
-                metric_col1, metric_col2, metric_col3 = st.columns(3)
-                with metric_col1:
-                    st.metric("💭 Mood", gemini_analysis.get('mood', 'N/A'))
-                with metric_col2:
-                    st.metric("⚡ Tempo/Energy", gemini_analysis.get('tempo_energy', 'N/A').capitalize())
-                with metric_col3:
-                    st.metric("🎨 Valence", gemini_analysis.get('valence', 'N/A').capitalize())
-                
-                st.markdown("---")
-                
-                # Detailed analysis
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    st.markdown("### 🔍 Overall Tone")
-                    st.info(gemini_analysis.get('overall_tone', 'N/A'))
-                    
-                    st.markdown("### 🎨 Thematic Elements")
-                    st.write(gemini_analysis.get('themes', 'N/A'))
-                    
-                    st.markdown("### 🎵 Musical Elements")
-                    st.write(gemini_analysis.get('musical_elements', 'N/A'))
-                
-                with col2:
-                    st.markdown("### 💭 Primary Emotions Detected")
-                    for emotion_data in gemini_analysis.get('primary_emotions', []):
-                        intensity = emotion_data.get('intensity', 5)
-                        emotion_name = emotion_data.get('emotion', 'Unknown')
-                        description = emotion_data.get('description', 'No description')
-                        
-                        with st.expander(f"**{emotion_name}** - Intensity: {intensity}/10"):
-                            st.write(description)
-                    
-                    st.markdown("### 📖 Lyrical Themes")
-                    themes = gemini_analysis.get('lyrical_themes', [])
-                    if themes:
-                        for theme in themes:
-                            st.markdown(f"• {theme}")
-                
-                st.markdown("### 🌊 Emotional Arc")
-                st.write(gemini_analysis.get('emotional_arc', 'N/A'))
-                
-                # NRCLex analysis
-                st.markdown("---")
-                st.markdown("## 📊 Detailed Emotion Metrics")
-                
-                emotional_keywords = gemini_analysis.get('emotional_keywords', [])
-                if emotional_keywords:
-                    with st.spinner("📈 Calculating emotion scores..."):
-                        nrc_results = analyze_emotions_nrclex(emotional_keywords)
-                    
-                    if nrc_results and nrc_results.get('normalized_scores'):
-                        with st.expander("🔑 Emotional Keywords Analyzed"):
-                            st.write(", ".join(emotional_keywords))
-                            st.caption(f"Total words analyzed: {nrc_results.get('word_count', 0)}")
-                        
-                        create_emotion_visualizations(nrc_results, gemini_analysis)
-                        
-                        st.markdown("### 📋 Detailed Emotion Breakdown")
-                        
-                        scores_sorted = sorted(
-                            nrc_results['normalized_scores'].items(), 
-                            key=lambda x: x[1], 
-                            reverse=True
-                        )
-                        
-                        cols = st.columns(4)
-                        for idx, (emotion, score) in enumerate(scores_sorted):
-                            with cols[idx % 4]:
-                                raw_score = nrc_results['raw_scores'].get(emotion, 0)
-                                st.metric(
-                                    emotion.capitalize(), 
-                                    f"{score:.1f}%",
-                                    f"{raw_score} words"
-                                )
-                    else:
-                        st.warning("Could not calculate NRCLex scores")
-                else:
-                    st.warning("No emotional keywords available for analysis")
-                
-                # Summary section
-                st.markdown("---")
-                st.markdown("## 📋 Analysis Summary")
-                
-                summary_col1, summary_col2 = st.columns(2)
-                
-                with summary_col1:
-                    st.markdown("### 🎯 Key Takeaways")
-                    st.write(f"**Primary Mood:** {gemini_analysis.get('mood', 'N/A')}")
-                    st.write(f"**Emotional Valence:** {gemini_analysis.get('valence', 'N/A').capitalize()}")
-                    st.write(f"**Energy Level:** {gemini_analysis.get('tempo_energy', 'N/A').capitalize()}")
-                
-                with summary_col2:
-                    st.markdown("### 🏆 Top 3 Emotions")
-                    if nrc_results and nrc_results.get('normalized_scores'):
-                        top_3 = sorted(
-                            nrc_results['normalized_scores'].items(),
-                            key=lambda x: x[1],
-                            reverse=True
-                        )[:3]
-                        for i, (emotion, score) in enumerate(top_3, 1):
-                            st.write(f"{i}. **{emotion.capitalize()}**: {score:.1f}%")
+        run_trace = tracer.start_trace('analyze', artist=artist_name, song=song_name)
+        result = analyze_song(artist_name, song_name, run_trace)
+        tracer.finish_trace(run_trace)
+        if result is not None:
+            history.add(result)
         else:
-            st.error("❌ Song not found. Please check the artist and song name.")
+            history.clear_selection()
+else:
+    result = history.current()
+    if result is not None:
+        run_trace = result.trace
+        render_result(result)
+
+with history_area:
+    render_history(history)
+
+if DEBUG_PANEL:
+    render_debug_panel(run_trace)
 
 # Footer
 st.markdown("""
 <div class="footer">
     <p style='font-size: 0.85rem; color: #a0aec0;'>Powered by advanced AI emotion detection technology</p>
 </div>
-""", unsafe_allow_html=True)
\ No newline at end of file
+""", unsafe_allow_html=True)
+
+logger.info("Script run finished in %.1f ms", (time.perf_counter() - _render_started) * 1000)
\ No newline at end of file
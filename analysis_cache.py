@@ -0,0 +1,168 @@
+"""Persistent on-disk cache for Gemini song analyses.
+
+Analyses are stored in a small SQLite database, one row per Genius song id.
+Each row is tagged with the analysis version that produced it and a
+fingerprint of the model name, prompt and response schema. A row is fresh
+while its fingerprint matches the current one and it is younger than the
+TTL; otherwise it is stale. Stale rows are still returned, so callers can
+show them immediately and regenerate them in the background instead of
+making the user wait because the prompt was edited. The least recently
+used rows are evicted once the cache grows past its size bound.
+"""
+
+import collections
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = os.getenv(
+    'EMOTIFY_CACHE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.emotify_cache', 'analyses.sqlite3')
+)
+DEFAULT_MAX_ENTRIES = int(os.getenv('EMOTIFY_CACHE_MAX_ENTRIES', '5000'))
+DEFAULT_TTL_SECONDS = int(os.getenv('EMOTIFY_CACHE_TTL_SECONDS', str(30 * 24 * 3600)))
+
+CachedAnalysis = collections.namedtuple('CachedAnalysis', ['analysis', 'fresh', 'version'])
+StaleEntry = collections.namedtuple('StaleEntry', ['song_id', 'song_info', 'version', 'created_at'])
+
+
+class AnalysisCache:
+    """SQLite-backed LRU cache of versioned analyses with hit/miss accounting"""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # Streamlit serves each session from its own thread, so one connection is shared behind a lock
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS song_analyses (
+                song_id INTEGER PRIMARY KEY,
+                value TEXT NOT NULL,
+                song_info TEXT,
+                version INTEGER NOT NULL,
+                fingerprint TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_song_analyses_last_access ON song_analyses (last_access)')
+        self._migrate()
+        self._conn.commit()
+
+    def _migrate(self):
+        # Earlier versions keyed rows by "<song id>:<hash of model and prompt>". Keep the newest
+        # row per song as a stale version-0 entry so it is still served while it is regenerated.
+        legacy = self._conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'analyses'").fetchone()
+        if legacy is None:
+            return
+        self._conn.execute("""
+            INSERT OR IGNORE INTO song_analyses (song_id, value, song_info, version, fingerprint, created_at, last_access)
+            SELECT CAST(substr(key, 1, instr(key, ':') - 1) AS INTEGER), value, NULL, 0, '', created_at, last_access
+            FROM analyses WHERE instr(key, ':') > 1 ORDER BY created_at DESC
+        """)
+        self._conn.execute('DROP TABLE analyses')
+
+    def get(self, song_id, fingerprint):
+        """Return a CachedAnalysis for the song, or None; stale analyses are returned with fresh=False"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value, version, fingerprint, created_at FROM song_analyses WHERE song_id = ?', (song_id,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._conn.execute('UPDATE song_analyses SET last_access = ? WHERE song_id = ?', (now, song_id))
+            self._conn.commit()
+            fresh = row[2] == fingerprint and now - row[3] <= self.ttl_seconds
+            if fresh:
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+            return CachedAnalysis(json.loads(row[0]), fresh, row[1])
+
+    def contains(self, song_id):
+        """Whether any analysis of the song is cached, fresh or stale; not counted as a lookup"""
+        with self._lock:
+            return self._conn.execute('SELECT 1 FROM song_analyses WHERE song_id = ?', (song_id,)).fetchone() is not None
+
+    def set(self, song_id, value, version, fingerprint, song_info=None):
+        """Store a song's analysis and evict the least recently used entries"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO song_analyses '
+                '(song_id, value, song_info, version, fingerprint, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (song_id, json.dumps(value), json.dumps(song_info) if song_info else None, version, fingerprint, now, now)
+            )
+            self._conn.execute("""
+                DELETE FROM song_analyses WHERE song_id IN (
+                    SELECT song_id FROM song_analyses ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+            self._conn.commit()
+
+    def stale_entries(self, fingerprint, older_than_version=None, limit=None):
+        """Return StaleEntry rows that need regenerating, oldest first
+
+        With older_than_version, only rows from earlier versions are returned;
+        otherwise every row that is not fresh under the current fingerprint.
+        """
+        if older_than_version is not None:
+            where, params = 'version < ?', [older_than_version]
+        else:
+            where, params = 'fingerprint != ? OR created_at < ?', [fingerprint, time.time() - self.ttl_seconds]
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT song_id, song_info, version, created_at FROM song_analyses WHERE {where} '
+                'ORDER BY created_at LIMIT ?', params + [-1 if limit is None else limit]
+            ).fetchall()
+        return [
+            StaleEntry(song_id, json.loads(song_info) if song_info else None, version, created_at)
+            for song_id, song_info, version, created_at in rows
+        ]
+
+    def clear(self):
+        """Remove every cached analysis"""
+        with self._lock:
+            self._conn.execute('DELETE FROM song_analyses')
+            self._conn.commit()
+
+    def stats(self):
+        """Return hit/miss counters for this process and the current entry count"""
+        with self._lock:
+            size = self._conn.execute('SELECT COUNT(*) FROM song_analyses').fetchone()[0]
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+            'entries': size,
+            'max_entries': self.max_entries,
+        }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_analysis_cache():
+    """Return the process-wide analysis cache, creating it on first use"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = AnalysisCache()
+        return _default_cache
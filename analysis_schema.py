@@ -0,0 +1,161 @@
+"""Response schema and typed validation for Gemini song analyses.
+
+The schema is sent with every request so Gemini's JSON mode returns exactly
+these fields; the per-field descriptions carry the guidance that used to be
+spelled out in the prompt. Responses are still validated field by field,
+since a truncated or partially malformed response should only cost a retry
+of the fields that are missing, not a whole new analysis.
+"""
+
+import hashlib
+import json
+
+TEMPO_VALUES = ('slow', 'medium', 'fast')
+VALENCE_VALUES = ('positive', 'negative', 'mixed')
+
+
+def _text(description):
+    return {'type': 'string', 'description': description}
+
+
+def _enum(values, description):
+    return {'type': 'string', 'format': 'enum', 'enum': list(values), 'description': description}
+
+
+FIELD_SCHEMAS = {
+    'overall_tone': _text("The song's emotional atmosphere in 2 sentences"),
+    'primary_emotions': {
+        'type': 'array',
+        'description': "The 4 strongest emotions in the song",
+        'items': {
+            'type': 'object',
+            'properties': {
+                'emotion': _text("One-word emotion name"),
+                'intensity': {'type': 'integer', 'description': "Intensity from 0 to 10"},
+                'description': _text("One sentence of evidence from the song")
+            },
+            'required': ['emotion', 'intensity', 'description']
+        }
+    },
+    'mood': _text("Mood in 1-3 words"),
+    'themes': _text("Thematic elements in 2-3 sentences"),
+    'emotional_keywords': {
+        'type': 'array',
+        'description': "15 single emotional words that describe the song",
+        'items': {'type': 'string'}
+    },
+    'tempo_energy': _enum(TEMPO_VALUES, "Tempo and energy"),
+    'valence': _enum(VALENCE_VALUES, "Overall emotional valence"),
+    'lyrical_themes': {
+        'type': 'array',
+        'description': "3 short lyrical themes",
+        'items': {'type': 'string'}
+    },
+    'emotional_arc': _text("How the emotions change through the song, in 1-2 sentences"),
+    'musical_elements': _text("How instrumentation and production shape the emotions, in 1-2 sentences")
+}
+
+FIELDS = tuple(FIELD_SCHEMAS)
+
+
+def schema_for(fields=FIELDS):
+    """Response schema requesting only the given fields"""
+    fields = [field for field in FIELDS if field in fields]
+    return {
+        'type': 'object',
+        'properties': {field: FIELD_SCHEMAS[field] for field in fields},
+        'required': fields
+    }
+
+
+ANALYSIS_SCHEMA = schema_for()
+# Part of the analysis cache key, so editing the schema invalidates old analyses
+SCHEMA_FINGERPRINT = hashlib.sha256(json.dumps(ANALYSIS_SCHEMA, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def _string(value):
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError("expected a non-empty string")
+    return value.strip()
+
+
+def _string_list(value):
+    if not isinstance(value, list):
+        raise ValueError("expected a list of strings")
+    items = [item.strip() for item in value if isinstance(item, str) and item.strip()]
+    if not items:
+        raise ValueError("expected at least one non-empty string")
+    return items
+
+
+def _choice(values):
+    def validate(value):
+        value = _string(value).lower()
+        if value not in values:
+            raise ValueError(f"expected one of {', '.join(values)}")
+        return value
+    return validate
+
+
+def _intensity(value):
+    if isinstance(value, str):
+        value = value.strip().split('/')[0]
+    try:
+        value = round(float(value))
+    except (TypeError, ValueError, OverflowError) as e:
+        raise ValueError("expected a number from 0 to 10") from e
+    return min(10, max(0, value))
+
+
+def _primary_emotions(value):
+    if not isinstance(value, list):
+        raise ValueError("expected a list of emotions")
+    emotions = []
+    for item in value:
+        if not isinstance(item, dict):
+            continue
+        try:
+            emotions.append({
+                'emotion': _string(item.get('emotion')),
+                'intensity': _intensity(item.get('intensity')),
+                'description': item.get('description').strip() if isinstance(item.get('description'), str) else ''
+            })
+        except ValueError:
+            continue
+    if not emotions:
+        raise ValueError("expected at least one emotion with an intensity")
+    return emotions
+
+
+VALIDATORS = {
+    'overall_tone': _string,
+    'primary_emotions': _primary_emotions,
+    'mood': _string,
+    'themes': _string,
+    'emotional_keywords': _string_list,
+    'tempo_energy': _choice(TEMPO_VALUES),
+    'valence': _choice(VALENCE_VALUES),
+    'lyrical_themes': _string_list,
+    'emotional_arc': _string,
+    'musical_elements': _string
+}
+
+
+def validate_field(field, value):
+    """Return the field's value coerced to its schema type; raises ValueError if malformed"""
+    validator = VALIDATORS.get(field)
+    if validator is None:
+        raise ValueError(f"unknown field {field!r}")
+    return validator(value)
+
+
+def validate_analysis(data):
+    """Split a parsed response into (valid fields, names of missing or malformed fields)"""
+    valid = {}
+    for field in FIELDS:
+        if field in data:
+            try:
+                valid[field] = validate_field(field, data[field])
+            except ValueError:
+                pass
+    return valid, [field for field in FIELDS if field not in valid]
@@ -0,0 +1,264 @@
+"""Headless JSON API for song analysis.
+
+Serves the same search -> Gemini -> NRC pipeline as the Streamlit UI over
+plain HTTP, without Streamlit's per-session script reruns. An asyncio server
+handles the connections (with keep-alive) and hands each analysis to a
+bounded thread pool, since the pipeline itself is blocking network I/O.
+
+Endpoints:
+    GET  /analyze?artist=...&song=...[&timeline=1][&deadline_ms=...]
+    POST /analyze                 {"artist": "...", "song": "...", "timeline": false, "deadline_ms": 30000}
+    GET  /similar?song_id=...[&k=10]
+    GET  /healthz
+    GET  /metrics                 Prometheus text format
+
+Usage:
+    python api_server.py --host 0.0.0.0 --port 8000 --workers 16
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlparse
+
+import requests
+from dotenv import load_dotenv
+
+import emotify_core as core
+from hedging import GEMINI_DEADLINE, deadline
+from lyrics_timeline import build_emotion_timeline
+from rate_limiter import RateLimitTimeout, get_rate_limiter
+from tracing import get_tracer
+
+logger = logging.getLogger("emotify.api")
+
+DEFAULT_WORKERS = int(os.getenv('EMOTIFY_API_WORKERS', '16'))
+# Requests beyond this many in flight are turned away with 503 instead of queueing forever
+DEFAULT_MAX_PENDING = int(os.getenv('EMOTIFY_API_MAX_PENDING', '256'))
+KEEPALIVE_TIMEOUT = 15.0
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 64 * 1024
+
+
+class APIError(Exception):
+    """An error response with a status code and a message for the client"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _truthy(value):
+    return str(value).lower() in ('1', 'true', 'yes')
+
+
+def analyze_request(artist, song, include_timeline, genius_api_key, gemini_api_key, deadline_seconds=GEMINI_DEADLINE):
+    """Run the pipeline for one request; runs on a worker thread"""
+    with get_tracer().trace('api.analyze', artist=artist, song=song), deadline(deadline_seconds):
+        try:
+            result = core.analyze_song(artist, song, genius_api_key, gemini_api_key)
+        except core.GeminiResponseError as e:
+            raise APIError(HTTPStatus.BAD_GATEWAY, f"Gemini returned an unparseable analysis: {e}") from e
+        except RateLimitTimeout as e:
+            # Our own quota for Genius or Gemini ran out before the deadline; nothing was sent
+            raise APIError(HTTPStatus.SERVICE_UNAVAILABLE, f"API quota exhausted, try again shortly: {e}") from e
+        except TimeoutError as e:
+            raise APIError(HTTPStatus.GATEWAY_TIMEOUT, f"Analysis did not finish in time: {e}") from e
+        except requests.RequestException as e:
+            raise APIError(HTTPStatus.BAD_GATEWAY, f"Genius request failed: {e}") from e
+
+        if result is None:
+            raise APIError(HTTPStatus.NOT_FOUND, "Song not found")
+
+        if include_timeline:
+            try:
+                result['lyrics_timeline'] = build_emotion_timeline(result['song_info']['url'])
+            except requests.RequestException as e:
+                result['lyrics_timeline'] = None
+                result['lyrics_timeline_error'] = str(e)
+        return result
+
+
+class AnalysisAPI:
+    """Routes HTTP requests and runs analyses on a worker pool"""
+
+    def __init__(self, genius_api_key, gemini_api_key, workers=DEFAULT_WORKERS, max_pending=DEFAULT_MAX_PENDING):
+        self.genius_api_key = genius_api_key
+        self.gemini_api_key = gemini_api_key
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='emotify-api')
+        self.max_pending = max_pending
+        self.pending = 0
+
+    async def handle(self, method, target, body):
+        """Return (status, payload) for one request"""
+        url = urlparse(target)
+        if url.path == '/healthz':
+            return HTTPStatus.OK, {'status': 'ok', 'pending': self.pending, 'rate_limit_queue': get_rate_limiter().queued()}
+        if url.path == '/metrics':
+            return HTTPStatus.OK, get_tracer().prometheus_text()
+        if url.path == '/similar':
+            # May build the IVF index, which would stall every connection on the event loop
+            loop = asyncio.get_running_loop()
+            return HTTPStatus.OK, await loop.run_in_executor(self.executor, self.similar, parse_qs(url.query))
+        if url.path != '/analyze':
+            raise APIError(HTTPStatus.NOT_FOUND, f"No route for {url.path}")
+
+        if method == 'GET':
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        elif method == 'POST':
+            try:
+                params = json.loads(body or b'{}')
+            except json.JSONDecodeError as e:
+                raise APIError(HTTPStatus.BAD_REQUEST, f"Invalid JSON body: {e}") from e
+            if not isinstance(params, dict):
+                raise APIError(HTTPStatus.BAD_REQUEST, "JSON body must be an object")
+        else:
+            raise APIError(HTTPStatus.METHOD_NOT_ALLOWED, f"{method} is not supported")
+
+        artist = str(params.get('artist') or '').strip()
+        song = str(params.get('song') or '').strip()
+        if not artist or not song:
+            raise APIError(HTTPStatus.BAD_REQUEST, "Both 'artist' and 'song' are required")
+        try:
+            deadline_seconds = float(params.get('deadline_ms') or GEMINI_DEADLINE * 1000) / 1000
+        except (TypeError, ValueError) as e:
+            raise APIError(HTTPStatus.BAD_REQUEST, "'deadline_ms' must be a number of milliseconds") from e
+        if not math.isfinite(deadline_seconds) or deadline_seconds <= 0:
+            raise APIError(HTTPStatus.BAD_REQUEST, "'deadline_ms' must be a positive, finite number")
+
+        if self.pending >= self.max_pending:
+            raise APIError(HTTPStatus.SERVICE_UNAVAILABLE, "Too many analyses in progress, try again shortly")
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(
+                self.executor, analyze_request, artist, song, _truthy(params.get('timeline', False)),
+                self.genius_api_key, self.gemini_api_key, deadline_seconds
+            )
+        finally:
+            self.pending -= 1
+        return HTTPStatus.OK, result
+
+    def similar(self, query):
+        """Songs in the emotion store closest to an already analyzed song"""
+        try:
+            song_id = int(query['song_id'][-1])
+            k = min(100, max(1, int(query.get('k', ['10'])[-1])))
+        except (KeyError, ValueError) as e:
+            raise APIError(HTTPStatus.BAD_REQUEST, "'song_id' (and optional 'k') must be integers") from e
+        return {
+            'song_id': song_id,
+            'similar': [
+                {'song_info': info, 'similarity': round(similarity, 4)}
+                for info, similarity in core.similar_songs(song_id, k)
+            ]
+        }
+
+    async def serve_connection(self, reader, writer):
+        """Serve HTTP/1.1 requests on one connection until it closes or idles out"""
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), KEEPALIVE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    return
+                except asyncio.LimitOverrunError:
+                    await self._respond(writer, HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, {'error': "Headers too large"}, False)
+                    return
+
+                try:
+                    method, target, version, headers = _parse_head(head)
+                    length = int(headers.get('content-length', '0') or 0)
+                except ValueError:
+                    await self._respond(writer, HTTPStatus.BAD_REQUEST, {'error': "Malformed request"}, False)
+                    return
+
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                if length < 0 or length > MAX_BODY_BYTES:
+                    await self._respond(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {'error': "Body too large"}, False)
+                    return
+                body = await reader.readexactly(length) if length else b''
+
+                try:
+                    status, payload = await self.handle(method, target, body)
+                except APIError as e:
+                    status, payload = e.status, {'error': e.message}
+                except Exception:
+                    logger.exception("Unhandled error serving %s %s", method, target)
+                    status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': "Internal server error"}
+
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    return
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, payload, keep_alive):
+        if isinstance(payload, str):
+            body, content_type = payload.encode('utf-8'), 'text/plain; version=0.0.4; charset=utf-8'
+        else:
+            body, content_type = json.dumps(payload).encode('utf-8'), 'application/json'
+        head = (
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+
+def _parse_head(head):
+    lines = head.decode('latin-1').split('\r\n')
+    method, target, version = lines[0].split(' ')
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    return method.upper(), target, version, headers
+
+
+async def serve(api, host, port):
+    server = await asyncio.start_server(api.serve_connection, host, port, limit=MAX_HEADER_BYTES)
+    addresses = ', '.join(f"{sock.getsockname()[0]}:{sock.getsockname()[1]}" for sock in server.sockets)
+    logger.info("Emotify API listening on %s", addresses)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve Emotify song analyses as a JSON API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="Analyses run concurrently")
+    parser.add_argument('--max-pending', type=int, default=DEFAULT_MAX_PENDING,
+                        help="Analyses accepted before new requests get 503")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    genius_api_key = os.getenv('GENIUS_API_KEY')
+    gemini_api_key = os.getenv('GEMINI_API_KEY')
+    if not genius_api_key or not gemini_api_key:
+        parser.error("GEMINI_API_KEY and GENIUS_API_KEY must be set (environment or .env file)")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    api = AnalysisAPI(genius_api_key, gemini_api_key, workers=max(1, args.workers), max_pending=max(1, args.max_pending))
+    try:
+        asyncio.run(serve(api, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,383 @@
+"""Durable, resumable backfill of whole artist discographies.
+
+Enqueuing an artist resolves it on Genius and lists its songs page by page
+into a SQLite job queue, with one task per song. Each page's tasks and the
+listing cursor are committed together, so an interrupted listing resumes at
+the next page. Tasks are keyed by Genius song id, which makes enqueuing
+idempotent: overlapping artists or repeated runs never queue a song twice.
+
+Workers claim tasks under a lease and run the Gemini -> NRC pipeline for
+each in the rate limiter's batch lane. A task is marked done as soon as its
+analysis is cached, so a run lost halfway only redoes the songs that were in
+flight. Their leases are reclaimed when they expire, or immediately when the
+worker that held them is a dead process on this host. An analysis still
+missing fields after repair is not cached, so it counts as a failed attempt.
+Failed tasks are retried with backoff up to ``--max-attempts`` times.
+
+Usage:
+    python backfill.py enqueue "Johnny Cash" "Nine Inch Nails"
+    python backfill.py work --workers 4
+    python backfill.py work --workers 4 --follow    # keep polling for new artists
+    python backfill.py status
+    python backfill.py retry                        # requeue songs that used up their attempts
+"""
+
+import argparse
+import collections
+import contextlib
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+
+from dotenv import load_dotenv
+
+import emotify_core as core
+from rate_limiter import lane
+from song_index import get_song_index
+from tracing import get_tracer
+
+DEFAULT_QUEUE_PATH = os.getenv(
+    'EMOTIFY_JOB_QUEUE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.emotify_cache', 'jobs.sqlite3')
+)
+# A task held longer than this is assumed lost with its worker and handed to another
+LEASE_SECONDS = 600.0
+MAX_ATTEMPTS = 3
+# Seconds before a failed task's first retry; doubles with every further attempt
+RETRY_BACKOFF = 30.0
+POLL_INTERVAL = 2.0
+
+Task = collections.namedtuple('Task', ['song_id', 'song_info', 'attempts'])
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobQueue:
+    """Artists to list and songs to analyze, shared by every worker through one SQLite file"""
+
+    def __init__(self, path=DEFAULT_QUEUE_PATH, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS artists (
+                artist_id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                next_page INTEGER,
+                enqueued_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                song_id INTEGER PRIMARY KEY,
+                artist_id INTEGER NOT NULL,
+                song_info TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                not_before REAL NOT NULL DEFAULT 0,
+                worker TEXT,
+                lease_expires REAL,
+                error TEXT,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute('CREATE INDEX IF NOT EXISTS tasks_ready ON tasks (status, not_before)')
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # IMMEDIATE takes the write lock up front, so two workers can never claim the same task
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    def add_artist(self, artist_id, name):
+        """Queue an artist's discography for listing; re-adding one lists it again to pick up new songs"""
+        with self._transaction() as conn:
+            conn.execute(
+                'INSERT INTO artists (artist_id, name, next_page, enqueued_at) VALUES (?, ?, 1, ?) '
+                'ON CONFLICT (artist_id) DO UPDATE SET name = excluded.name, next_page = 1',
+                (artist_id, name, time.time())
+            )
+
+    def unlisted_artists(self):
+        """Return (artist_id, name, next_page) for every artist whose listing hasn't finished"""
+        with self._lock:
+            return self._conn.execute(
+                'SELECT artist_id, name, next_page FROM artists WHERE next_page IS NOT NULL ORDER BY enqueued_at'
+            ).fetchall()
+
+    def add_page(self, artist_id, songs, next_page):
+        """Queue one listed page of songs and move the artist's cursor past it, atomically"""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.executemany(
+                'INSERT OR IGNORE INTO tasks (song_id, artist_id, song_info, updated_at) VALUES (?, ?, ?, ?)',
+                [(song['id'], artist_id, json.dumps(song), now) for song in songs]
+            )
+            conn.execute('UPDATE artists SET next_page = ? WHERE artist_id = ?', (next_page, artist_id))
+
+    def claim(self, worker):
+        """Lease the next ready task to a worker, or return None when nothing is ready"""
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("""
+                SELECT song_id, song_info, attempts FROM tasks
+                WHERE (status = 'pending' AND not_before <= ?) OR (status = 'running' AND lease_expires < ?)
+                ORDER BY not_before, song_id LIMIT 1
+            """, (now, now)).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE tasks SET status = 'running', attempts = attempts + 1, worker = ?, lease_expires = ?, "
+                "updated_at = ? WHERE song_id = ?",
+                (worker, now + self.lease_seconds, now, row[0])
+            )
+        return Task(row[0], json.loads(row[1]), row[2] + 1)
+
+    def complete(self, song_id):
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE tasks SET status = 'done', worker = NULL, lease_expires = NULL, error = NULL, updated_at = ? "
+                "WHERE song_id = ?", (time.time(), song_id)
+            )
+
+    def fail(self, song_id, error):
+        """Schedule a retry with backoff, or give up once the task has used all its attempts"""
+        now = time.time()
+        with self._transaction() as conn:
+            attempts = conn.execute('SELECT attempts FROM tasks WHERE song_id = ?', (song_id,)).fetchone()[0]
+            if attempts >= self.max_attempts:
+                status, not_before = 'failed', 0
+            else:
+                status, not_before = 'pending', now + RETRY_BACKOFF * 2 ** (attempts - 1)
+            conn.execute(
+                'UPDATE tasks SET status = ?, not_before = ?, worker = NULL, lease_expires = NULL, error = ?, '
+                'updated_at = ? WHERE song_id = ?', (status, not_before, error, now, song_id)
+            )
+
+    def release_dead_workers(self):
+        """Requeue tasks held by workers on this host whose process has died; returns how many"""
+        host = socket.gethostname()
+        with self._transaction() as conn:
+            held = conn.execute("SELECT DISTINCT worker FROM tasks WHERE status = 'running' AND worker LIKE ?",
+                                (f"{host}:%",)).fetchall()
+            dead = [worker for (worker,) in held if not _pid_alive(int(worker.rsplit(':', 1)[1]))]
+            released = 0
+            for worker in dead:
+                released += conn.execute(
+                    "UPDATE tasks SET status = 'pending', worker = NULL, lease_expires = NULL WHERE status = 'running' "
+                    "AND worker = ?", (worker,)
+                ).rowcount
+        return released
+
+    def retry_failed(self):
+        """Give every task that used up its attempts a fresh set; returns how many"""
+        with self._transaction() as conn:
+            return conn.execute(
+                "UPDATE tasks SET status = 'pending', attempts = 0, not_before = 0, updated_at = ? WHERE status = 'failed'",
+                (time.time(),)
+            ).rowcount
+
+    def outstanding(self):
+        """Number of tasks not yet done or failed, plus artists still being listed"""
+        with self._lock:
+            tasks = self._conn.execute("SELECT COUNT(*) FROM tasks WHERE status IN ('pending', 'running')").fetchone()[0]
+            artists = self._conn.execute('SELECT COUNT(*) FROM artists WHERE next_page IS NOT NULL').fetchone()[0]
+        return tasks + artists
+
+    def progress(self):
+        """Per-artist task counts by status, with whether the listing has finished"""
+        with self._lock:
+            artists = self._conn.execute('SELECT artist_id, name, next_page FROM artists ORDER BY enqueued_at').fetchall()
+            counts = self._conn.execute('SELECT artist_id, status, COUNT(*) FROM tasks GROUP BY artist_id, status').fetchall()
+        by_artist = collections.defaultdict(dict)
+        for artist_id, status, count in counts:
+            by_artist[artist_id][status] = count
+        return [
+            {'artist_id': artist_id, 'name': name, 'listed': next_page is None, **by_artist[artist_id]}
+            for artist_id, name, next_page in artists
+        ]
+
+
+def list_discography(queue, artist_id, name, genius_api_key, page=1):
+    """List an artist's songs into the queue from `page` on, checkpointing after every page"""
+    listed = 0
+    while page is not None:
+        with lane('batch'):
+            songs, next_page = core.list_artist_songs(artist_id, genius_api_key, page)
+        queue.add_page(artist_id, songs, next_page)
+        listed += len(songs)
+        page = next_page
+    print(f"Listed {listed} songs by {name}", file=sys.stderr)
+    return listed
+
+
+def run_task(task, gemini_api_key):
+    """Analyze one queued song; raises unless its analysis was cached"""
+    with lane('batch'), get_tracer().trace('backfill.analyze', song_id=task.song_id, attempt=task.attempts):
+        result = core.analyze_song_info(task.song_info, gemini_api_key)
+    core.require_complete(result['gemini_analysis'])
+    # Later searches for the song resolve locally instead of asking Genius again
+    get_song_index().add(task.song_info)
+
+
+class Progress:
+    """Tasks finished by this process, reported to stderr"""
+
+    def __init__(self, report_every=10):
+        self.started = time.perf_counter()
+        self.report_every = report_every
+        self.counts = {'done': 0, 'failed_attempts': 0}
+        self._lock = threading.Lock()
+
+    def record(self, result):
+        with self._lock:
+            self.counts[result] += 1
+            finished = sum(self.counts.values())
+        if finished % self.report_every == 0:
+            print(self.line(), file=sys.stderr)
+
+    def line(self):
+        elapsed = time.perf_counter() - self.started
+        rate = self.counts['done'] / elapsed if elapsed > 0 else 0.0
+        return f"{self.counts['done']} songs done in {elapsed:.1f}s ({rate:.2f} songs/sec) | {self.counts['failed_attempts']} failed attempts"
+
+
+def work_loop(queue, worker, gemini_api_key, progress, stop, follow=False):
+    """Claim and run tasks until the queue is drained (or, with follow, until stopped)"""
+    while not stop.is_set():
+        task = queue.claim(worker)
+        if task is None:
+            # Tasks failing elsewhere may come back for a retry, so only leave once nothing is outstanding
+            if not follow and not queue.outstanding():
+                return
+            stop.wait(POLL_INTERVAL)
+            continue
+        try:
+            run_task(task, gemini_api_key)
+        except Exception as e:
+            queue.fail(task.song_id, f"{type(e).__name__}: {e}")
+            print(f"Song {task.song_id} ({task.song_info.get('full_title')}) attempt {task.attempts} failed: "
+                  f"{type(e).__name__}: {e}", file=sys.stderr)
+            progress.record('failed_attempts')
+        else:
+            queue.complete(task.song_id)
+            progress.record('done')
+
+
+def run_workers(queue, genius_api_key, gemini_api_key, workers, follow=False):
+    """Resume unfinished listings, then work the queue with `workers` threads"""
+    released = queue.release_dead_workers()
+    if released:
+        print(f"Requeued {released} songs left running by a stopped worker", file=sys.stderr)
+
+    progress = Progress()
+    stop = threading.Event()
+    worker = worker_name()
+    threads = [
+        threading.Thread(target=work_loop, args=(queue, worker, gemini_api_key, progress, stop, follow), daemon=True)
+        for _ in range(workers)
+    ]
+    try:
+        for artist_id, name, page in queue.unlisted_artists():
+            list_discography(queue, artist_id, name, genius_api_key, page)
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(0.5)
+            if follow:
+                for artist_id, name, page in queue.unlisted_artists():
+                    list_discography(queue, artist_id, name, genius_api_key, page)
+    except KeyboardInterrupt:
+        # Songs in flight finish first; a second interrupt abandons them to the next run
+        print("Stopping after the songs in flight (interrupt again to quit now)", file=sys.stderr)
+        stop.set()
+        for thread in threads:
+            if thread.is_alive():
+                thread.join()
+
+    print(progress.line(), file=sys.stderr)
+    return progress
+
+
+def print_status(queue):
+    for artist in queue.progress():
+        listing = 'listed' if artist['listed'] else 'listing'
+        print(f"{artist['name']} ({listing}): {artist.get('done', 0)} done, {artist.get('pending', 0)} pending, "
+              f"{artist.get('running', 0)} running, {artist.get('failed', 0)} failed")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backfill analyses of whole artist discographies")
+    parser.add_argument('--queue', default=DEFAULT_QUEUE_PATH, help="SQLite job queue file")
+    commands = parser.add_subparsers(dest='command', required=True)
+    enqueue = commands.add_parser('enqueue', help="Queue every song by the given artists")
+    enqueue.add_argument('artists', nargs='+', help="Artist names as on Genius")
+    work = commands.add_parser('work', help="Analyze queued songs until the queue is drained")
+    work.add_argument('-w', '--workers', type=int, default=4, help="Songs analyzed concurrently")
+    work.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS, help="Tries per song before giving up")
+    work.add_argument('--follow', action='store_true', help="Keep waiting for new work instead of exiting")
+    commands.add_parser('status', help="Show progress per artist")
+    commands.add_parser('retry', help="Requeue songs that used up their attempts")
+    args = parser.parse_args(argv)
+
+    queue = JobQueue(args.queue, max_attempts=getattr(args, 'max_attempts', MAX_ATTEMPTS))
+    if args.command == 'status':
+        print_status(queue)
+        return 0
+    if args.command == 'retry':
+        print(f"Requeued {queue.retry_failed()} songs", file=sys.stderr)
+        return 0
+
+    load_dotenv()
+    genius_api_key = os.getenv('GENIUS_API_KEY')
+    gemini_api_key = os.getenv('GEMINI_API_KEY')
+    if not genius_api_key or (args.command == 'work' and not gemini_api_key):
+        parser.error("GEMINI_API_KEY and GENIUS_API_KEY must be set (environment or .env file)")
+
+    if args.command == 'enqueue':
+        missing = 0
+        for name in args.artists:
+            artist = core.search_artist_genius(name, genius_api_key)
+            if artist is None:
+                print(f"No artist on Genius matches {name!r}", file=sys.stderr)
+                missing += 1
+                continue
+            queue.add_artist(artist['id'], artist['name'])
+            list_discography(queue, artist['id'], artist['name'], genius_api_key)
+        return 1 if missing else 0
+
+    progress = run_workers(queue, genius_api_key, gemini_api_key, max(1, args.workers), args.follow)
+    return 0 if progress.counts['failed_attempts'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""Headless batch analysis for playlists and CSV/JSONL catalogs.
+
+Reads (artist, song) pairs, runs the search -> Gemini -> NRC pipeline for
+each with bounded asyncio concurrency, and appends one JSON line per song to
+the output file as soon as it finishes.
+
+Usage:
+    python batch_analyze.py catalog.csv -o results.jsonl --concurrency 8
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+import emotify_core as core
+from rate_limiter import lane
+from tracing import get_tracer
+
+
+def read_songs(path):
+    """Yield (artist, song) pairs from a CSV with artist/song columns or a JSONL file"""
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.lower().endswith(('.jsonl', '.ndjson')):
+            for line in f:
+                line = line.strip()
+                if line:
+                    row = json.loads(line)
+                    yield row['artist'], row['song']
+        else:
+            reader = csv.DictReader(f)
+            fields = {name.strip().lower(): name for name in reader.fieldnames or []}
+            if 'artist' not in fields or 'song' not in fields:
+                raise ValueError(f"{path} must have 'artist' and 'song' columns")
+            for row in reader:
+                yield row[fields['artist']].strip(), row[fields['song']].strip()
+
+
+def analyze_one(artist, song, genius_api_key, gemini_api_key):
+    """Analyze a single song and return the JSON record written to the output"""
+    start = time.perf_counter()
+    record = {'artist': artist, 'song': song}
+    try:
+        # The batch lane yields Gemini/Genius quota to interactive sessions sharing the keys
+        with lane('batch'), get_tracer().trace('batch.analyze', artist=artist, song=song):
+            result = core.analyze_song(artist, song, genius_api_key, gemini_api_key)
+        if result is None:
+            record['status'] = 'not_found'
+        else:
+            record['status'] = 'ok'
+            record.update(result)
+    except Exception as e:
+        record['status'] = 'error'
+        record['error'] = f"{type(e).__name__}: {e}"
+    record['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 1)
+    return record
+
+
+class Progress:
+    """Running counters for the batch, reported periodically to stderr"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.done = 0
+        self.counts = {'ok': 0, 'not_found': 0, 'error': 0}
+
+    def record(self, status):
+        self.done += 1
+        self.counts[status] += 1
+
+    def line(self):
+        elapsed = time.perf_counter() - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        return (f"{self.done} songs in {elapsed:.1f}s ({rate:.2f} songs/sec) | "
+                f"ok={self.counts['ok']} not_found={self.counts['not_found']} error={self.counts['error']}")
+
+
+async def run_batch(songs, output_path, concurrency, genius_api_key, gemini_api_key, report_every=2.0):
+    """Analyze songs with at most `concurrency` in flight, streaming results to output_path"""
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=concurrency))
+
+    # A small bounded queue keeps memory flat however large the catalog is
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    progress = Progress()
+
+    async def producer():
+        for artist, song in songs:
+            await queue.put((artist, song))
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def worker(out):
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            record = await asyncio.to_thread(analyze_one, *item, genius_api_key, gemini_api_key)
+            out.write(json.dumps(record) + '\n')
+            out.flush()
+            progress.record(record['status'])
+
+    async def reporter():
+        while True:
+            await asyncio.sleep(report_every)
+            print(progress.line(), file=sys.stderr)
+
+    with open(output_path, 'a', encoding='utf-8') as out:
+        report_task = asyncio.create_task(reporter())
+        try:
+            await asyncio.gather(producer(), *(worker(out) for _ in range(concurrency)))
+        finally:
+            report_task.cancel()
+
+    print(progress.line(), file=sys.stderr)
+    return progress
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch-analyze songs from a CSV or JSONL catalog")
+    parser.add_argument('input', help="CSV with artist,song columns or JSONL with artist/song keys")
+    parser.add_argument('-o', '--output', default='results.jsonl', help="JSONL file results are appended to")
+    parser.add_argument('-c', '--concurrency', type=int, default=8, help="Songs analyzed concurrently")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    genius_api_key = os.getenv('GENIUS_API_KEY')
+    gemini_api_key = os.getenv('GEMINI_API_KEY')
+    if not genius_api_key or not gemini_api_key:
+        parser.error("GEMINI_API_KEY and GENIUS_API_KEY must be set (environment or .env file)")
+
+    progress = asyncio.run(run_batch(
+        read_songs(args.input), args.output, max(1, args.concurrency), genius_api_key, gemini_api_key
+    ))
+    return 0 if progress.counts['error'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
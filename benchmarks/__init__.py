@@ -0,0 +1 @@
+"""Benchmarks for the Emotify analysis pipeline"""
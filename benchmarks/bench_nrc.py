@@ -0,0 +1,131 @@
+"""Throughput and memory of multiprocess NRC scoring as workers are added.
+
+Scores a synthetic lyric corpus in-process and then with ``NRCPool`` at each
+requested worker count, reporting records/sec and each worker's resident
+memory split into private (anonymous) and shared file-backed pages. With the
+memory-mapped lexicon the private part should stay flat per worker.
+
+    python -m benchmarks.bench_nrc --records 200000 --workers 1,2,4,8
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import emotify_core as core
+from nrc_engine import get_engine
+from nrc_parallel import NRCPool
+
+
+def synthetic_corpus(records, words_per_record, seed=0):
+    """Lyric-like texts: lexicon words mixed with words the lexicon doesn't know"""
+    rng = random.Random(seed)
+    vocab = get_engine().vocab.tolist()
+    filler = ['the', 'and', 'you', 'baby', 'oh', 'yeah', 'night', 'tonight', 'we', 'la']
+    return [
+        [' '.join(rng.choice(vocab) if rng.random() < 0.3 else rng.choice(filler) for _ in range(words_per_record))]
+        for _ in range(records)
+    ]
+
+
+def process_memory():
+    """(pid, private KiB, file-backed KiB) of the calling process, from /proc"""
+    fields = {}
+    with open('/proc/self/status', encoding='ascii') as f:
+        for line in f:
+            name, _, value = line.partition(':')
+            if name in ('RssAnon', 'RssFile'):
+                fields[name] = int(value.split()[0])
+    return os.getpid(), fields.get('RssAnon'), fields.get('RssFile')
+
+
+def _probe(_):
+    time.sleep(0.05)
+    return process_memory()
+
+
+def worker_memory(pool):
+    """Memory of each pool worker, sampled after the pool has done its scoring"""
+    samples = {}
+    for pid, private_kib, file_kib in pool.executor.map(_probe, range(4 * pool.workers)):
+        samples[pid] = (private_kib, file_kib)
+    return samples
+
+
+def run_benchmark(records=50000, words_per_record=200, worker_counts=(1, 2, 4), chunk_size=256):
+    corpus = synthetic_corpus(records, words_per_record)
+
+    started = time.perf_counter()
+    core.analyze_emotions_nrclex_batch(corpus)
+    elapsed = time.perf_counter() - started
+    results = {
+        'records': records,
+        'words_per_record': words_per_record,
+        'cpu_count': os.cpu_count(),
+        'in_process': {'seconds': round(elapsed, 3), 'records_per_sec': round(records / elapsed)},
+        'pool': []
+    }
+
+    for workers in worker_counts:
+        with NRCPool(workers=workers, chunk_size=chunk_size) as pool:
+            # Warm the workers up so spawn time isn't counted as scoring time
+            list(pool.score(corpus[:workers * chunk_size]))
+            started = time.perf_counter()
+            for _ in pool.score(corpus):
+                pass
+            elapsed = time.perf_counter() - started
+            memory = worker_memory(pool) if sys.platform.startswith('linux') else {}
+
+        private = [kib for kib, _ in memory.values() if kib is not None]
+        results['pool'].append({
+            'workers': workers,
+            'seconds': round(elapsed, 3),
+            'records_per_sec': round(records / elapsed),
+            'worker_private_kib_max': max(private, default=None),
+            'worker_private_kib_total': sum(private) if private else None
+        })
+    return results
+
+
+def print_report(results):
+    print(f"{results['records']} records x {results['words_per_record']} words, {results['cpu_count']} CPUs")
+    print(f"in-process: {results['in_process']['records_per_sec']:>9} records/sec")
+    base = None
+    for run in results['pool']:
+        base = base or run['records_per_sec']
+        memory = ''
+        if run['worker_private_kib_max'] is not None:
+            memory = f"  private/worker {run['worker_private_kib_max'] / 1024:.1f} MiB"
+        print(
+            f"{run['workers']:>3} workers: {run['records_per_sec']:>9} records/sec "
+            f"(x{run['records_per_sec'] / base:.2f}){memory}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark multiprocess NRC scoring.")
+    parser.add_argument('--records', type=int, default=50000)
+    parser.add_argument('--words', type=int, default=200, help="Words per record")
+    parser.add_argument('--workers', default='1,2,4', help="Comma-separated worker counts")
+    parser.add_argument('--chunk-size', type=int, default=256)
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(
+        records=args.records,
+        words_per_record=args.words,
+        worker_counts=[int(w) for w in args.workers.split(',')],
+        chunk_size=args.chunk_size
+    )
+    print_report(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,239 @@
+"""End-to-end benchmark of the analysis pipeline against local stubs.
+
+Runs the real pipeline functions (Genius search, Gemini analysis, NRC
+scoring, lyric timeline and chart construction) with Genius replaced by a
+local HTTP server and Gemini by an in-process stand-in, so timings reflect
+Emotify's own overhead plus whatever latency the stubs are told to add.
+
+    python -m benchmarks.bench_pipeline --iterations 100 --output bench.json
+    python -m benchmarks.bench_pipeline --baseline bench.json
+
+With ``--baseline`` the run exits non-zero when any stage's p95 regresses
+by more than ``--tolerance``.
+"""
+
+import argparse
+import json
+import platform
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+
+import analysis_cache
+import charts
+import emotify_core as core
+import rate_limiter
+import song_index
+from benchmarks.stubs import StubGemini, StubGeniusServer
+from lyrics_timeline import build_emotion_timeline
+
+ARTIST = 'Johnny Cash'
+SONG = 'Hurt'
+
+
+def _search(state):
+    state['song_info'] = core.search_song_genius(ARTIST, SONG, state['genius_key'])
+
+
+def _gemini_cold(state):
+    analysis_cache.get_analysis_cache().clear()
+    state['gemini_analysis'] = core.analyze_with_gemini(state['song_info'], state['gemini_key'])
+
+
+def _gemini_cached(state):
+    core.analyze_with_gemini(state['song_info'], state['gemini_key'])
+
+
+def _nrc(state):
+    state['nrc_results'] = core.analyze_emotions_nrclex(state['gemini_analysis']['emotional_keywords'])
+
+
+def _lyrics_timeline(state):
+    state['timeline'] = build_emotion_timeline(state['song_info']['url'])
+
+
+def _build_figures(state):
+    scores = state['nrc_results']['normalized_scores']
+    state['figures'] = [
+        charts.build_radar_figure(scores),
+        charts.build_ranking_figure(scores),
+        charts.build_gemini_intensity_figure(state['gemini_analysis']['primary_emotions']),
+        charts.build_timeline_figure(state['timeline'])
+    ]
+
+
+def _figures_cold(state):
+    charts.get_figure_cache().clear()
+    _build_figures(state)
+
+
+def _figures_cached(state):
+    _build_figures(state)
+
+
+def _figure_json(state):
+    # Streamlit serializes every figure before sending it to the browser
+    for fig in state['figures']:
+        fig.to_json()
+
+
+STAGES = [
+    ('search', _search),
+    ('gemini_cold', _gemini_cold),
+    ('gemini_cached', _gemini_cached),
+    ('nrc', _nrc),
+    ('lyrics_timeline', _lyrics_timeline),
+    ('figures_cold', _figures_cold),
+    ('figures_cached', _figures_cached),
+    ('figure_json', _figure_json)
+]
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of samples"""
+    ordered = sorted(samples)
+    rank = min(len(ordered) - 1, max(0, -(-pct * len(ordered) // 100) - 1))
+    return ordered[int(rank)]
+
+
+def summarize(samples):
+    ms = [s * 1000 for s in samples]
+    return {
+        'count': len(ms),
+        'mean_ms': round(statistics.fmean(ms), 3),
+        'p50_ms': round(percentile(ms, 50), 3),
+        'p95_ms': round(percentile(ms, 95), 3),
+        'p99_ms': round(percentile(ms, 99), 3),
+        'max_ms': round(max(ms), 3)
+    }
+
+
+def run_iteration(state, timings):
+    """Run every stage once, appending each stage's duration to timings"""
+    started = time.perf_counter()
+    for stage, func in STAGES:
+        stage_started = time.perf_counter()
+        func(state)
+        timings.setdefault(stage, []).append(time.perf_counter() - stage_started)
+    timings.setdefault('end_to_end', []).append(time.perf_counter() - started)
+
+
+def measure_memory(state):
+    """Peak traced allocation (KiB) of each stage in a separate, untimed pass"""
+    peaks = {}
+    tracemalloc.start()
+    try:
+        for stage, func in STAGES:
+            base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            func(state)
+            peaks[stage] = round((tracemalloc.get_traced_memory()[1] - base) / 1024, 1)
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def max_rss_kib():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and KiB everywhere else
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of stages whose p95 regressed beyond the tolerance"""
+    regressions = []
+    for stage, summary in results['stages'].items():
+        previous = baseline.get('stages', {}).get(stage)
+        if not previous or not previous['p95_ms']:
+            continue
+        change = summary['p95_ms'] / previous['p95_ms'] - 1
+        if change > tolerance:
+            regressions.append((stage, previous['p95_ms'], summary['p95_ms'], change))
+    return regressions
+
+
+def run_benchmark(iterations=50, warmup=3, genius_latency=0.0, gemini_latency=0.0):
+    """Benchmark the pipeline against fresh stubs and in-memory stores"""
+    analysis_cache._default_cache = analysis_cache.AnalysisCache(':memory:')
+    song_index._default_index = song_index.SongIndex(':memory:')
+    # The stubs have no quota; keep the limiter's bookkeeping out of the timings
+    rate_limiter._default_limiter = rate_limiter.RateLimiter(None, limits={})
+
+    gemini = StubGemini(latency=gemini_latency)
+    gemini.install(core)
+    with StubGeniusServer(latency=genius_latency) as genius:
+        genius.install(core)
+        state = {'genius_key': 'bench-genius-key', 'gemini_key': 'bench-gemini-key'}
+
+        for _ in range(warmup):
+            run_iteration(state, {})
+        timings = {}
+        for _ in range(iterations):
+            run_iteration(state, timings)
+        memory = measure_memory(state)
+
+    return {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {
+            'iterations': iterations,
+            'warmup': warmup,
+            'genius_latency_ms': genius_latency * 1000,
+            'gemini_latency_ms': gemini_latency * 1000
+        },
+        'stages': {stage: summarize(samples) for stage, samples in timings.items()},
+        'memory_peak_kib': memory,
+        'max_rss_kib': max_rss_kib()
+    }
+
+
+def print_report(results):
+    print(f"{'stage':<16}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'mean ms':>10}{'peak KiB':>11}")
+    for stage, summary in results['stages'].items():
+        peak = results['memory_peak_kib'].get(stage, '')
+        print(
+            f"{stage:<16}{summary['p50_ms']:>10.3f}{summary['p95_ms']:>10.3f}"
+            f"{summary['p99_ms']:>10.3f}{summary['mean_ms']:>10.3f}{peak:>11}"
+        )
+    print(f"max RSS: {results['max_rss_kib'] / 1024:.1f} MiB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Emotify pipeline against local Genius/Gemini stubs.")
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--genius-latency-ms', type=float, default=0.0, help="Delay added to every stub Genius response")
+    parser.add_argument('--gemini-latency-ms', type=float, default=0.0, help="Delay added to every stub Gemini response")
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    parser.add_argument('--baseline', help="Compare against a previous results file")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed p95 slowdown before failing (default: 0.2)")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(
+        iterations=args.iterations,
+        warmup=args.warmup,
+        genius_latency=args.genius_latency_ms / 1000,
+        gemini_latency=args.gemini_latency_ms / 1000
+    )
+    print_report(results)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for stage, before, after, change in regressions:
+            print(f"REGRESSION {stage}: p95 {before:.3f} ms -> {after:.3f} ms (+{change:.0%})", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
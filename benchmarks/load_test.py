@@ -0,0 +1,483 @@
+"""Concurrent-session load test of one Streamlit replica against local stubs.
+
+Starts ``Emotify.py`` under a real Streamlit server in a child process, with
+Gemini replaced by the benchmark stub, and drives N simulated browser
+sessions at it over Streamlit's websocket protocol. Each session loads the
+page, then repeatedly types an artist and song, clicks Analyze and
+interacts with the page once more, the way a user opening an expander
+would. The Genius stub runs in this process, so its work isn't billed to
+the replica.
+
+Concurrency is ramped through the requested levels. For each level the
+report gives throughput, p50/p99 latency of analyses and redraws, the
+replica's CPU time per analysis and cores in use, its memory per
+connected session, and the level past which more sessions stop adding
+throughput. Replica settings such as ``EMOTIFY_PIPELINE_WORKERS`` are
+passed through from the environment.
+
+    python -m benchmarks.load_test --levels 1,2,4,8,16 --duration 30
+    python -m benchmarks.load_test --gemini-latency-ms 3000 --hot-ratio 0.3 --output load.json
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from benchmarks.bench_pipeline import percentile
+from benchmarks.stubs import StubGeniusServer
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(REPO_ROOT, 'Emotify.py')
+ARTIST = 'Johnny Cash'
+HOT_SONG = 'Hurt'
+
+
+def serve(port, genius_url, gemini_latency):
+    """Run the app under Streamlit with Gemini stubbed and Genius pointed at genius_url"""
+    os.environ.setdefault('GEMINI_API_KEY', 'load-test-gemini-key')
+    os.environ.setdefault('GENIUS_API_KEY', 'load-test-genius-key')
+
+    import analysis_cache
+    import emotify_core as core
+    import emotion_store
+    import rate_limiter
+    import song_index
+    import thumbnails
+    from benchmarks.stubs import StubGemini
+    from streamlit.web import bootstrap
+
+    StubGemini(latency=gemini_latency).install(core)
+    core.GENIUS_SEARCH_URL = f"{genius_url}/search"
+
+    workdir = tempfile.mkdtemp(prefix='emotify-load-')
+    analysis_cache._default_cache = analysis_cache.AnalysisCache(':memory:')
+    song_index._default_index = song_index.SongIndex(':memory:')
+    emotion_store._default_store = emotion_store.EmotionStore(os.path.join(workdir, 'emotions'))
+    thumbnails._default_cache = thumbnails.ThumbnailCache(os.path.join(workdir, 'thumbnails'))
+    # The stubs have no quota; keep the limiter's bookkeeping out of the measurements
+    rate_limiter._default_limiter = rate_limiter.RateLimiter(None, limits={})
+
+    # Mirrors `streamlit run`, which loads flag options before starting the server
+    flag_options = {
+        'server_port': port,
+        'server_headless': True,
+        'server_fileWatcherType': 'none',
+        'browser_gatherUsageStats': False,
+        'logger_level': 'error'
+    }
+    bootstrap.load_config_options(flag_options)
+    bootstrap.run(APP_PATH, False, [], flag_options)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Replica:
+    """The app under a Streamlit server in a child process"""
+
+    def __init__(self, genius_url, gemini_latency, startup_timeout=60):
+        self.port = free_port()
+        self.log = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(
+            [
+                sys.executable, '-m', 'benchmarks.load_test', '--serve', str(self.port),
+                '--genius-url', genius_url, '--gemini-latency-ms', str(gemini_latency * 1000)
+            ],
+            cwd=REPO_ROOT, stdout=self.log, stderr=subprocess.STDOUT
+        )
+        self._wait_healthy(startup_timeout)
+
+    @property
+    def stream_url(self):
+        return f"ws://127.0.0.1:{self.port}/_stcore/stream"
+
+    def _wait_healthy(self, timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                break
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{self.port}/_stcore/health", timeout=1) as response:
+                    if response.status == 200:
+                        return
+            except (urllib.error.URLError, OSError):
+                pass
+            time.sleep(0.2)
+        self.stop()
+        self.log.seek(0)
+        raise RuntimeError(f"Streamlit replica did not start:\n{self.log.read().decode(errors='replace')[-2000:]}")
+
+    def cpu_seconds(self):
+        """User plus system CPU the replica has used, or None off Linux"""
+        try:
+            with open(f'/proc/{self.process.pid}/stat', encoding='ascii') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def rss_kib(self):
+        """The replica's resident memory, or None off Linux"""
+        try:
+            with open(f'/proc/{self.process.pid}/statm', encoding='ascii') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+        except (OSError, ValueError):
+            return None
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+class BrowserSession:
+    """One browser tab: a websocket speaking Streamlit's protobuf protocol"""
+
+    def __init__(self, url, timeout):
+        self.url = url
+        self.timeout = timeout
+        self.ws = None
+        self.song = ''
+        self.artist_id = self.song_id = self.button_id = None
+
+    async def connect(self):
+        import websockets
+
+        origin = self.url.replace('ws://', 'http://').split('/_stcore')[0]
+        self.ws = await websockets.connect(self.url, subprotocols=['streamlit'], origin=origin, max_size=None)
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+
+    async def _rerun(self, widgets):
+        """Ask for a script run with these widget states; returns (seconds, failed, elements)"""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        message = BackMsg()
+        message.rerun_script.query_string = ''
+        for widget in widgets:
+            message.rerun_script.widget_states.widgets.add().CopyFrom(widget)
+
+        started = time.perf_counter()
+        await self.ws.send(message.SerializeToString())
+        elements = []
+        failed = False
+        async with asyncio.timeout(self.timeout):
+            while True:
+                forward = ForwardMsg()
+                forward.ParseFromString(await self.ws.recv())
+                kind = forward.WhichOneof('type')
+                if kind == 'delta' and forward.delta.WhichOneof('type') == 'new_element':
+                    element = forward.delta.new_element
+                    elements.append(element)
+                    element_kind = element.WhichOneof('type')
+                    # Error alerts are how the app reports a failed stage
+                    if element_kind == 'exception' or (element_kind == 'alert' and element.alert.format == 1):
+                        failed = True
+                elif kind == 'script_finished':
+                    failed = failed or forward.script_finished not in (
+                        ForwardMsg.FINISHED_SUCCESSFULLY, ForwardMsg.FINISHED_FRAGMENT_RUN_SUCCESSFULLY
+                    )
+                    return time.perf_counter() - started, failed, elements
+
+    def _widgets(self, click):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        return [
+            WidgetState(id=self.artist_id, string_value=ARTIST),
+            WidgetState(id=self.song_id, string_value=self.song),
+            WidgetState(id=self.button_id, trigger_value=click)
+        ]
+
+    async def load(self):
+        elapsed, failed, elements = await self._rerun([])
+        text_inputs = [element.text_input.id for element in elements if element.WhichOneof('type') == 'text_input']
+        buttons = [element.button.id for element in elements if element.WhichOneof('type') == 'button']
+        self.artist_id, self.song_id = text_inputs[:2]
+        self.button_id = buttons[0]
+        return elapsed, failed
+
+    async def analyze(self, song):
+        self.song = song
+        elapsed, failed, _ = await self._rerun(self._widgets(click=True))
+        return elapsed, failed
+
+    async def redraw(self):
+        # Any widget interaction reruns the whole script, which should redraw from session state
+        elapsed, failed, _ = await self._rerun(self._widgets(click=False))
+        return elapsed, failed
+
+
+class LevelRecorder:
+    """Latencies and failures collected by every session of one level"""
+
+    def __init__(self):
+        self.samples = {'load': [], 'analyze': [], 'redraw': []}
+        self.failures = {'load': 0, 'analyze': 0, 'redraw': 0}
+        self.crashes = []
+
+    def add(self, kind, result):
+        elapsed, failed = result
+        self.samples[kind].append(elapsed)
+        self.failures[kind] += failed
+
+
+def summarize(samples):
+    ms = [s * 1000 for s in samples]
+    if not ms:
+        return {'count': 0, 'p50_ms': None, 'p99_ms': None, 'max_ms': None}
+    return {
+        'count': len(ms),
+        'p50_ms': round(percentile(ms, 50), 1),
+        'p99_ms': round(percentile(ms, 99), 1),
+        'max_ms': round(max(ms), 1)
+    }
+
+
+async def _open_session(replica, recorder, timeout):
+    session = BrowserSession(replica.stream_url, timeout)
+    try:
+        await session.connect()
+        recorder.add('load', await session.load())
+        return session
+    except Exception as e:
+        recorder.crashes.append(f"{type(e).__name__}: {e}")
+        await session.close()
+        return None
+
+
+async def _session_loop(session, recorder, deadline, next_song, think_time):
+    try:
+        while time.monotonic() < deadline:
+            recorder.add('analyze', await session.analyze(next_song()))
+            recorder.add('redraw', await session.redraw())
+            if think_time:
+                await asyncio.sleep(think_time)
+    except Exception as e:
+        recorder.crashes.append(f"{type(e).__name__}: {e}")
+
+
+async def run_level(replica, concurrency, duration, next_song, think_time=0.0, timeout=120):
+    """Run `concurrency` sessions in a closed loop for `duration` seconds"""
+    recorder = LevelRecorder()
+    rss_before = replica.rss_kib()
+    # Every session loads its page before the clock starts, then they all run together
+    sessions = await asyncio.gather(*(_open_session(replica, recorder, timeout) for _ in range(concurrency)))
+    sessions = [session for session in sessions if session is not None]
+
+    started = time.perf_counter()
+    cpu_before = replica.cpu_seconds()
+    deadline = time.monotonic() + duration
+    await asyncio.gather(*(_session_loop(session, recorder, deadline, next_song, think_time) for session in sessions))
+    wall = time.perf_counter() - started
+    cpu_after = replica.cpu_seconds()
+    # Sampled while the sessions are still connected, so their state is still held
+    rss_after = replica.rss_kib()
+    await asyncio.gather(*(session.close() for session in sessions))
+
+    analyses = len(recorder.samples['analyze'])
+    cpu = cpu_after - cpu_before if cpu_before is not None and cpu_after is not None else None
+    return {
+        'sessions': concurrency,
+        'seconds': round(wall, 2),
+        'analyses': analyses,
+        'analyses_per_sec': round(analyses / wall, 3) if wall else 0.0,
+        'failures': recorder.failures,
+        'crashes': recorder.crashes,
+        'page_load': summarize(recorder.samples['load']),
+        'analyze': summarize(recorder.samples['analyze']),
+        'redraw': summarize(recorder.samples['redraw']),
+        'replica_cpu_ms_per_analysis': round(cpu * 1000 / analyses, 1) if cpu is not None and analyses else None,
+        'replica_cpu_cores': round(cpu / wall, 2) if cpu is not None and wall else None,
+        'replica_kib_per_session': (
+            round((rss_after - rss_before) / concurrency) if rss_before is not None and rss_after is not None else None
+        )
+    }
+
+
+def find_saturation(levels, min_gain=0.1, p99_limit_ms=None):
+    """Return (capacity, reason): the largest level that still scaled, and why the next one didn't
+
+    A level saturates when it adds less than min_gain throughput over the
+    previous level, fails any request or, with p99_limit_ms, breaks that
+    analysis latency objective.
+    """
+    capacity = None
+    previous = None
+    for level in levels:
+        failures = sum(level['failures'].values()) + len(level['crashes'])
+        p99 = level['analyze']['p99_ms']
+        if failures:
+            return capacity, f"{level['sessions']} sessions: {failures} failed requests"
+        if p99_limit_ms is not None and p99 is not None and p99 > p99_limit_ms:
+            return capacity, f"{level['sessions']} sessions: analyze p99 {p99:.0f} ms over {p99_limit_ms:.0f} ms"
+        if previous is not None and previous['analyses_per_sec']:
+            gain = level['analyses_per_sec'] / previous['analyses_per_sec'] - 1
+            if gain < min_gain:
+                return capacity, f"{level['sessions']} sessions: throughput {gain:+.0%} over {previous['sessions']}"
+        capacity = level['sessions']
+        previous = level
+    return capacity, None
+
+
+def song_picker(hot_ratio, seed=0):
+    """Return a callable naming the next song to analyze
+
+    A hot_ratio share of requests ask for the same popular song, so they hit
+    the caches; the rest are songs nobody has analyzed yet.
+    """
+    rng = random.Random(seed)
+    counter = itertools.count(1)
+    lock = threading.Lock()
+
+    def next_song():
+        with lock:
+            if rng.random() < hot_ratio:
+                return HOT_SONG
+            return f"Load Song {next(counter)}"
+    return next_song
+
+
+async def _warm_up(replica, timeout):
+    # One untimed analysis loads the lexicon, plotly and the chart templates in the replica
+    recorder = LevelRecorder()
+    session = await _open_session(replica, recorder, timeout)
+    if session is None:
+        raise RuntimeError(f"Could not open a session: {recorder.crashes}")
+    await session.analyze('Warm Up')
+    await session.close()
+
+
+async def _run_levels(replica, levels, duration, next_song, think_time, timeout):
+    await _warm_up(replica, timeout)
+    results = []
+    for concurrency in levels:
+        level = await run_level(replica, concurrency, duration, next_song, think_time, timeout)
+        results.append(level)
+        print_level(level)
+    return results
+
+
+def run_load_test(levels=(1, 2, 4, 8), duration=20.0, genius_latency=0.1, gemini_latency=1.0,
+                  hot_ratio=0.0, think_time=0.0, timeout=120, min_gain=0.1, p99_limit_ms=None):
+    results = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'cpu_count': os.cpu_count(),
+        'config': {
+            'duration_s': duration,
+            'genius_latency_ms': genius_latency * 1000,
+            'gemini_latency_ms': gemini_latency * 1000,
+            'hot_ratio': hot_ratio,
+            'think_time_ms': think_time * 1000
+        }
+    }
+    with StubGeniusServer(latency=genius_latency, echo_titles=True) as genius:
+        replica = Replica(genius.base_url, gemini_latency)
+        try:
+            results['levels'] = asyncio.run(
+                _run_levels(replica, levels, duration, song_picker(hot_ratio), think_time, timeout)
+            )
+        finally:
+            replica.stop()
+
+    capacity, reason = find_saturation(results['levels'], min_gain, p99_limit_ms)
+    results['saturation'] = {'capacity_sessions': capacity, 'reason': reason}
+    return results
+
+
+def print_header():
+    print(
+        f"{'sessions':>8}{'analyses/s':>12}{'analyze p50':>13}{'p99 ms':>9}{'redraw p50':>12}{'p99 ms':>9}"
+        f"{'CPU ms/an':>11}{'cores':>7}{'KiB/session':>13}{'failed':>8}"
+    )
+
+
+def print_level(level):
+    def fmt(value, width, spec='.0f'):
+        return f"{'-' if value is None else format(value, spec):>{width}}"
+
+    failed = sum(level['failures'].values()) + len(level['crashes'])
+    print(
+        f"{level['sessions']:>8}{level['analyses_per_sec']:>12.2f}"
+        f"{fmt(level['analyze']['p50_ms'], 13)}{fmt(level['analyze']['p99_ms'], 9)}"
+        f"{fmt(level['redraw']['p50_ms'], 12)}{fmt(level['redraw']['p99_ms'], 9)}"
+        f"{fmt(level['replica_cpu_ms_per_analysis'], 11)}{fmt(level['replica_cpu_cores'], 7, '.2f')}"
+        f"{fmt(level['replica_kib_per_session'], 13)}{failed:>8}",
+        flush=True
+    )
+    for crash in level['crashes'][:3]:
+        print(f"  session crashed: {crash}", file=sys.stderr)
+
+
+def print_saturation(results):
+    saturation = results['saturation']
+    if saturation['reason'] is None:
+        print(f"No saturation up to {saturation['capacity_sessions']} sessions; try higher --levels")
+    elif saturation['capacity_sessions'] is None:
+        print(f"Saturated at the first level ({saturation['reason']})")
+    else:
+        print(f"Capacity: {saturation['capacity_sessions']} concurrent sessions (saturated at {saturation['reason']})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test one Streamlit replica with concurrent simulated sessions.")
+    parser.add_argument('--levels', default='1,2,4,8', help="Comma-separated concurrent session counts to ramp through")
+    parser.add_argument('--duration', type=float, default=20, help="Seconds each level runs")
+    parser.add_argument('--genius-latency-ms', type=float, default=100, help="Delay added to every stub Genius response")
+    parser.add_argument('--gemini-latency-ms', type=float, default=1000, help="Delay added to every stub Gemini response")
+    parser.add_argument('--hot-ratio', type=float, default=0.0, help="Share of analyses asking for an already cached song")
+    parser.add_argument('--think-time-ms', type=float, default=0, help="Pause between a session's analyses")
+    parser.add_argument('--timeout', type=float, default=120, help="Seconds before a single script run counts as hung")
+    parser.add_argument('--min-gain', type=float, default=0.1, help="Throughput gain below which a level is saturated")
+    parser.add_argument('--p99-limit-ms', type=float, help="Analyze p99 above which a level is saturated")
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    # Used by the harness itself to start the replica
+    parser.add_argument('--serve', type=int, metavar='PORT', help=argparse.SUPPRESS)
+    parser.add_argument('--genius-url', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        serve(args.serve, args.genius_url, args.gemini_latency_ms / 1000)
+        return 0
+
+    print_header()
+    results = run_load_test(
+        levels=[int(level) for level in args.levels.split(',')],
+        duration=args.duration,
+        genius_latency=args.genius_latency_ms / 1000,
+        gemini_latency=args.gemini_latency_ms / 1000,
+        hot_ratio=args.hot_ratio,
+        think_time=args.think_time_ms / 1000,
+        timeout=args.timeout,
+        min_gain=args.min_gain,
+        p99_limit_ms=args.p99_limit_ms
+    )
+    print_saturation(results)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
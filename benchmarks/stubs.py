@@ -0,0 +1,221 @@
+"""Local stand-ins for Genius and Gemini used by the benchmarks.
+
+``StubGeniusServer`` is a real HTTP server on localhost that answers
+``/search`` and serves lyrics pages and album art, so the pooled HTTP
+client, retries and JSON/HTML parsing all run for real. ``StubGemini``
+replaces the Gemini SDK in-process and returns a canned analysis after a
+configurable delay.
+"""
+
+import http.server
+import io
+import json
+import threading
+import time
+import zlib
+from urllib.parse import parse_qs, urlparse
+
+SAMPLE_ANALYSIS = {
+    "overall_tone": "A haunting, confessional atmosphere of regret and self-reckoning.",
+    "primary_emotions": [
+        {"emotion": "Regret", "intensity": 9, "description": "Looking back on a life of mistakes"},
+        {"emotion": "Sadness", "intensity": 8, "description": "Grief over lost relationships"},
+        {"emotion": "Despair", "intensity": 7, "description": "Feeling that nothing can be undone"},
+        {"emotion": "Longing", "intensity": 6, "description": "Wishing for another chance"}
+    ],
+    "mood": "Melancholic",
+    "themes": "Mortality, addiction and the weight of memory.",
+    "emotional_keywords": [
+        "regret", "pain", "sorrow", "empire", "dirt", "hurt", "lonely", "loss",
+        "memory", "broken", "crown", "thorns", "liar", "friend", "forgive"
+    ],
+    "tempo_energy": "slow",
+    "valence": "negative",
+    "lyrical_themes": ["regret", "mortality", "self-destruction"],
+    "emotional_arc": "Quiet reflection builds to an anguished climax before fading.",
+    "musical_elements": "Sparse acoustic guitar and piano that swell into a heavy final chorus."
+}
+
+SAMPLE_LYRICS = """[Verse 1]
+I hurt myself today
+To see if I still feel
+I focus on the pain
+The only thing that's real
+[Chorus]
+What have I become
+My sweetest friend
+Everyone I know goes away in the end
+[Verse 2]
+I wear this crown of thorns
+Upon my liar's chair
+Full of broken thoughts
+I cannot repair
+[Chorus]
+What have I become
+My sweetest friend
+Everyone I know goes away in the end"""
+
+
+def lyrics_page(lyrics=SAMPLE_LYRICS):
+    """Render lyrics the way a Genius song page embeds them"""
+    body = '<br/>'.join(lyrics.splitlines())
+    return (
+        '<html><body><div class="header">Song page</div>'
+        f'<div data-lyrics-container="true">{body}</div>'
+        '</body></html>'
+    )
+
+
+def album_art(size=600):
+    """A JPEG about the size of a Genius thumbnail"""
+    from PIL import Image
+
+    image = Image.linear_gradient('L').resize((size, size)).convert('RGB')
+    out = io.BytesIO()
+    image.save(out, format='JPEG', quality=90)
+    return out.getvalue()
+
+
+class StubGeniusServer:
+    """Local HTTP server that imitates the Genius search API, song pages and album art
+
+    With echo_titles, a query for "<artist> <anything>" finds a song titled
+    <anything> with an id of its own, so every distinct query is a distinct
+    song, as in real traffic.
+    """
+
+    def __init__(self, latency=0.0, hits=5, lyrics=SAMPLE_LYRICS, artist='Johnny Cash', title='Hurt', echo_titles=False):
+        self.latency = latency
+        self.hits = hits
+        self.lyrics = lyrics
+        self.artist = artist
+        self.title = title
+        self.echo_titles = echo_titles
+        self.requests = 0
+        self._art = None
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def search_payload(self, query=''):
+        song_title, first_id = self.title, 1000
+        prefix = f"{self.artist} "
+        if self.echo_titles and query.startswith(prefix) and query[len(prefix):].strip():
+            song_title = query[len(prefix):].strip()
+            first_id = 1_000_000 + zlib.crc32(song_title.encode('utf-8'))
+
+        hits = []
+        for i in range(self.hits):
+            # The first hit is the stub's song; the rest are unrelated filler
+            song_id = first_id if i == 0 else 1000 + i
+            title, artist = (song_title, self.artist) if i == 0 else (f"Other Song {i}", f"Other Artist {i}")
+            hits.append({'result': {
+                'id': song_id,
+                'title': title,
+                'full_title': f"{title} by {artist}",
+                'url': f"{self.base_url}/songs/{song_id}",
+                'song_art_image_thumbnail_url': f"{self.base_url}/images/{song_id}.jpg",
+                'primary_artist': {'name': artist}
+            }})
+        return {'response': {'hits': hits}}
+
+    def start(self):
+        stub = self
+        self._art = album_art()
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body go out as separate writes; without this, delayed ACKs add ~40 ms per request
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                stub.requests += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+                url = urlparse(self.path)
+                if url.path == '/search':
+                    query = parse_qs(url.query).get('q', [''])[0]
+                    body, content_type = json.dumps(stub.search_payload(query)).encode(), 'application/json'
+                elif url.path.startswith('/songs/'):
+                    body, content_type = lyrics_page(stub.lyrics).encode(), 'text/html'
+                elif url.path.startswith('/images/'):
+                    body, content_type = stub._art, 'image/jpeg'
+                else:
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def install(self, core):
+        """Point emotify_core's Genius search at this server"""
+        core.GENIUS_SEARCH_URL = f"{self.base_url}/search"
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class StubGemini:
+    """In-process stand-in for the Gemini SDK with configurable latency and payload"""
+
+    def __init__(self, latency=0.0, analysis=SAMPLE_ANALYSIS, chunks=8):
+        self.latency = latency
+        self.analysis = analysis
+        self.chunks = chunks
+        self.calls = 0
+
+    def configure(self, **kwargs):
+        pass
+
+    def generate_content(self, prompt, stream=False, generation_config=None, **kwargs):
+        self.calls += 1
+        config = generation_config or {}
+        if config.get('response_mime_type') == 'application/json':
+            # JSON mode: bare JSON holding only the fields the schema asks for
+            fields = config['response_schema']['properties']
+            text = json.dumps({key: value for key, value in self.analysis.items() if key in fields}, indent=2)
+        else:
+            text = "```json\n" + json.dumps(self.analysis, indent=2) + "\n```"
+        if not stream:
+            time.sleep(self.latency)
+            return _Chunk(text)
+        return self._stream(text)
+
+    def _stream(self, text):
+        size = max(1, len(text) // self.chunks)
+        for start in range(0, len(text), size):
+            time.sleep(self.latency / self.chunks)
+            yield _Chunk(text[start:start + size])
+
+    def install(self, core):
+        """Route emotify_core's Gemini calls to this stand-in"""
+        core._gemini_model = lambda: (self, self)
@@ -0,0 +1,220 @@
+"""Plotly figure construction for the emotion visualizations.
+
+Building the figures is kept separate from drawing them with Streamlit so
+it can be reused and measured outside the app.
+
+Figures are described as plain dict specs and turned into ``go.Figure``
+objects without Plotly's per-property validation, which dominates the cost
+of building them. The specs are hard-coded and always valid, so validating
+them on every rerun buys nothing. The built figures are also kept in a
+bounded LRU cache keyed by a hash of the chart's input data, so identical
+score sets (reruns, popular songs, other sessions) skip building entirely.
+Cached figures are shared, so callers must not modify them.
+"""
+
+import collections
+import hashlib
+import json
+import os
+import threading
+
+import plotly.graph_objects as go
+
+from nrc_engine import EMOTIONS
+from tracing import get_tracer
+
+BAR_COLORS = ['#667eea', '#764ba2', '#f093fb', '#4facfe', '#00f2fe',
+              '#43e97b', '#fa709a', '#fee140', '#30cfd0', '#a8edea']
+
+DEFAULT_MAX_ENTRIES = int(os.getenv('EMOTIFY_FIGURE_CACHE_SIZE', '256'))
+
+
+class FigureCache:
+    """Bounded LRU of built figures keyed by chart kind and input data"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._figures = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(kind, data):
+        payload = json.dumps([kind, data], sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get_or_build(self, kind, build_spec, data):
+        """Return the figure for this chart and data, building it on a miss"""
+        key = self.make_key(kind, data)
+        with self._lock:
+            figure = self._figures.get(key)
+            if figure is not None:
+                self._figures.move_to_end(key)
+                self.hits += 1
+        get_tracer().incr('emotify_cache_events_total', cache='figures', result='miss' if figure is None else 'hit')
+        if figure is not None:
+            return figure
+
+        figure = figure_from_spec(build_spec(data))
+        with self._lock:
+            self.misses += 1
+            self._figures[key] = figure
+            self._figures.move_to_end(key)
+            while len(self._figures) > self.max_entries:
+                self._figures.popitem(last=False)
+        return figure
+
+    def clear(self):
+        with self._lock:
+            self._figures.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._figures), 'hits': self.hits, 'misses': self.misses}
+
+
+_figure_cache = FigureCache()
+
+
+def get_figure_cache():
+    """Return the process-wide figure cache"""
+    return _figure_cache
+
+
+def figure_from_spec(spec):
+    """Build a Figure from a trusted spec dict without Plotly's property validation"""
+    return go.Figure(spec, _validate=False)
+
+
+def _cached_figure(kind, build_spec, data):
+    return _figure_cache.get_or_build(kind, build_spec, data)
+
+
+def radar_spec(normalized_scores):
+    emotions = list(normalized_scores.keys())
+    scores = list(normalized_scores.values())
+    return {
+        'data': [{
+            'type': 'scatterpolar',
+            'r': scores,
+            'theta': emotions,
+            'fill': 'toself',
+            'name': 'Emotion Intensity',
+            'line': {'color': '#667eea'},
+            'fillcolor': 'rgba(102, 126, 234, 0.4)'
+        }],
+        'layout': {
+            'polar': {
+                'radialaxis': {
+                    'visible': True,
+                    'range': [0, max(scores) if scores else 100],
+                    'tickfont': {'size': 10}
+                }
+            },
+            'showlegend': False,
+            'title': {'text': "Emotion Distribution (NRCLex)"},
+            'height': 400,
+            'font': {'size': 12}
+        }
+    }
+
+
+def ranking_spec(normalized_scores):
+    sorted_emotions = sorted(normalized_scores.items(), key=lambda x: x[1], reverse=True)
+
+    emotions_list = [e[0].capitalize() for e in sorted_emotions]
+    scores_list = [e[1] for e in sorted_emotions]
+
+    return {
+        'data': [{
+            'type': 'bar',
+            'x': emotions_list,
+            'y': scores_list,
+            'marker': {'color': BAR_COLORS[:len(emotions_list)]},
+            'text': [f'{s:.1f}%' for s in scores_list],
+            'textposition': 'outside'
+        }],
+        'layout': {
+            'title': {'text': 'Emotion Intensity Rankings'},
+            'xaxis': {'title': {'text': 'Emotion'}},
+            'yaxis': {'title': {'text': 'Intensity (%)'}},
+            'height': 400,
+            'showlegend': False
+        }
+    }
+
+
+def gemini_intensity_spec(primary_emotions):
+    emotion_names = [e['emotion'] for e in primary_emotions]
+    intensities = [e.get('intensity', 5) for e in primary_emotions]
+
+    return {
+        'data': [{
+            'type': 'bar',
+            'y': emotion_names,
+            'x': intensities,
+            'orientation': 'h',
+            'marker': {'color': '#764ba2'},
+            'text': [f'{i}/10' for i in intensities],
+            'textposition': 'outside'
+        }],
+        'layout': {
+            'title': {'text': 'Gemini AI Emotion Intensity Ratings'},
+            'xaxis': {'title': {'text': 'Intensity (0-10)'}},
+            'yaxis': {'title': {'text': 'Emotion'}},
+            'height': 300,
+            'showlegend': False
+        }
+    }
+
+
+def timeline_spec(timeline):
+    section_labels = [f"{point['position']}. {point['section']}" for point in timeline]
+
+    data = []
+    for emotion in EMOTIONS:
+        if emotion in ('positive', 'negative'):
+            continue
+        data.append({
+            'type': 'scatter',
+            'x': section_labels,
+            'y': [point['normalized_scores'][emotion] for point in timeline],
+            'mode': 'lines+markers',
+            'name': emotion.capitalize()
+        })
+
+    return {
+        'data': data,
+        'layout': {
+            'title': {'text': 'Emotion Timeline by Lyric Section'},
+            'xaxis': {'title': {'text': 'Section'}},
+            'yaxis': {'title': {'text': 'Share of Section Emotions (%)'}},
+            'height': 450
+        }
+    }
+
+
+def build_radar_figure(normalized_scores):
+    """Radar chart of the NRC emotion distribution"""
+    return _cached_figure('radar', radar_spec, normalized_scores)
+
+
+def build_ranking_figure(normalized_scores):
+    """Bar chart of NRC emotions ranked by intensity"""
+    return _cached_figure('ranking', ranking_spec, normalized_scores)
+
+
+def build_gemini_intensity_figure(primary_emotions):
+    """Horizontal bar chart of Gemini's primary emotion intensities"""
+    return _cached_figure('gemini_intensity', gemini_intensity_spec, primary_emotions)
+
+
+def build_timeline_figure(timeline):
+    """Line chart of per-section lyric emotions"""
+    # Only the labels and scores reach the chart, so key the cache on those alone
+    data = [
+        {'position': point['position'], 'section': point['section'], 'normalized_scores': point['normalized_scores']}
+        for point in timeline
+    ]
+    return _cached_figure('timeline', timeline_spec, data)
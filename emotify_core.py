@@ -0,0 +1,696 @@
+"""Song analysis pipeline shared by the Streamlit UI and headless tools.
+
+The functions here raise on failure instead of reporting through Streamlit,
+so they can be called from batch jobs and worker threads. ``Emotify.py``
+wraps them to surface errors in the page.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import http_client
+from analysis_cache import get_analysis_cache
+from analysis_schema import FIELDS, SCHEMA_FINGERPRINT, schema_for, validate_analysis, validate_field
+from emotion_store import get_emotion_store
+from hedging import DeadlineExceeded, HedgedCaller, expires_at, remaining
+from nrc_engine import get_engine
+from rate_limiter import estimate_tokens, get_rate_limiter, lane
+from singleflight import SingleFlight
+from song_index import get_song_index, normalize
+from tracing import get_tracer
+
+GENIUS_SEARCH_URL = "https://api.genius.com/search"
+GENIUS_ARTIST_SONGS_URL = "https://api.genius.com/artists/{artist_id}/songs"
+GEMINI_MODEL = 'gemini-2.0-flash-exp'
+# Bump when a prompt, schema or model change should count as a new generation of analyses;
+# `python reanalyze.py --older-than N` regenerates everything cached by earlier versions
+ANALYSIS_VERSION = 1
+# Threads regenerating stale cached analyses in the background
+REFRESH_WORKERS = int(os.getenv('EMOTIFY_REFRESH_WORKERS', '2'))
+# Follow-up requests for fields that came back missing or malformed
+GEMINI_REPAIR_ATTEMPTS = int(os.getenv('EMOTIFY_GEMINI_REPAIR_ATTEMPTS', '2'))
+# Output tokens reserved against the tokens-per-minute limit before a call; corrected from its usage afterwards
+GEMINI_OUTPUT_TOKEN_ESTIMATE = 1024
+
+logger = logging.getLogger("emotify.core")
+
+# Concurrent requests for the same song share one upstream call
+_genius_flights = SingleFlight('genius')
+# Streamed analyses yield (field, value) pairs, so a takeover skips the fields it already has
+_gemini_flights = SingleFlight('gemini', item_key=lambda item: item[0])
+# Speculative analyses have no Genius id yet, so they coalesce on the normalized query instead
+_speculative_flights = SingleFlight('gemini_speculative', item_key=lambda item: item[0])
+# Each kind of Gemini call learns its own timeout; streams are never hedged
+_gemini_calls = HedgedCaller('call')
+_repair_calls = HedgedCaller('repair')
+_stream_calls = HedgedCaller('stream', hedge=False)
+
+
+class GeminiResponseError(ValueError):
+    """Raised when Gemini returns text that cannot be parsed as the analysis JSON"""
+
+    def __init__(self, message, response_text):
+        super().__init__(message)
+        self.response_text = response_text
+
+
+class IncompleteAnalysisError(Exception):
+    """Raised when an analysis came back without every field, so it was not cached"""
+
+
+def require_complete(analysis):
+    """Raise IncompleteAnalysisError unless the analysis has every field, i.e. was cached"""
+    missing = [field for field in FIELDS if field not in analysis]
+    if missing:
+        raise IncompleteAnalysisError(f"Analysis is missing {', '.join(missing)}")
+
+
+class IncrementalJSONObjectParser:
+    """Parse a JSON object as it streams in, one top-level member at a time
+
+    ``feed`` returns the (key, value) pairs whose values were completed by the
+    new text, so callers can act on each field long before the object closes.
+    Anything before the opening brace (such as a Markdown code fence) is skipped.
+    Members that are not valid JSON are skipped and counted in ``malformed``.
+    """
+
+    def __init__(self):
+        self.complete = False
+        self.malformed = 0
+        self._buffer = ''
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member_start = None
+
+    def feed(self, text):
+        self._buffer += text
+        buffer = self._buffer
+        members = []
+        i = self._pos
+
+        while i < len(buffer) and not self.complete:
+            ch = buffer[i]
+            if self._depth == 0:
+                if ch == '{':
+                    self._depth = 1
+                    self._member_start = i + 1
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in '{[':
+                self._depth += 1
+            elif ch in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    members.append(buffer[self._member_start:i])
+                    self.complete = True
+            elif ch == ',' and self._depth == 1:
+                members.append(buffer[self._member_start:i])
+                self._member_start = i + 1
+            i += 1
+
+        self._pos = i
+        fields = []
+        for member in members:
+            if member.strip():
+                try:
+                    fields.extend(json.loads('{' + member + '}').items())
+                except json.JSONDecodeError:
+                    self.malformed += 1
+        return fields
+
+
+def _genius_get(url, params, api_key, stage):
+    """GET a Genius API endpoint within the shared quota and return the decoded JSON"""
+    headers = {"Authorization": f"Bearer {api_key}"}
+
+    get_rate_limiter().acquire('genius', api_key)
+    tracer = get_tracer()
+    with tracer.span(stage) as span:
+        response = http_client.get(url, headers=headers, params=params)
+        span.set(status=response.status_code, bytes=len(response.content))
+        tracer.incr('emotify_payload_bytes_total', len(response.content), stage=stage)
+        response.raise_for_status()
+        return response.json()
+
+
+def _song_info(result):
+    """The fields the app keeps from a Genius song object"""
+    return {
+        'title': result['title'],
+        'artist': result['primary_artist']['name'],
+        'url': result['url'],
+        'thumbnail': result['song_art_image_thumbnail_url'],
+        'id': result['id'],
+        'full_title': result['full_title']
+    }
+
+
+def search_song_genius(artist, song, api_key):
+    """Search for a song on Genius API with better matching"""
+    data = _genius_get(GENIUS_SEARCH_URL, {"q": f"{artist} {song}"}, api_key, 'genius.search')
+
+    if data['response']['hits']:
+        best_match = None
+        best_score = 0
+
+        for hit in data['response']['hits'][:5]:
+            result = hit['result']
+            title = result['title'].lower()
+            artist_name = result['primary_artist']['name'].lower()
+
+            title_match = song.lower() in title or title in song.lower()
+            artist_match = artist.lower() in artist_name or artist_name in artist.lower()
+
+            score = (2 if title_match else 0) + (1 if artist_match else 0)
+
+            if score > best_score:
+                best_score = score
+                best_match = result
+
+        if best_match:
+            return _song_info(best_match)
+    return None
+
+
+def search_artist_genius(artist, api_key):
+    """Find an artist on Genius by name; returns {'id', 'name'} or None"""
+    data = _genius_get(GENIUS_SEARCH_URL, {"q": artist}, api_key, 'genius.search')
+    artists = [hit['result']['primary_artist'] for hit in data['response']['hits']]
+
+    # An exact name beats the looser containment match search_song_genius uses
+    wanted = normalize(artist)
+    for candidate in artists:
+        if normalize(candidate['name']) == wanted:
+            return {'id': candidate['id'], 'name': candidate['name']}
+    for candidate in artists:
+        name = candidate['name'].lower()
+        if artist.lower() in name or name in artist.lower():
+            return {'id': candidate['id'], 'name': candidate['name']}
+    return None
+
+
+def list_artist_songs(artist_id, api_key, page=1, per_page=50):
+    """Return one page of an artist's songs as song_info dicts, and the next page number (None after the last)
+
+    Songs the artist only features on are left out.
+    """
+    data = _genius_get(
+        GENIUS_ARTIST_SONGS_URL.format(artist_id=artist_id), {'page': page, 'per_page': per_page, 'sort': 'title'},
+        api_key, 'genius.artist_songs'
+    )
+    songs = [_song_info(song) for song in data['response']['songs'] if song['primary_artist']['id'] == artist_id]
+    return songs, data['response'].get('next_page')
+
+
+def resolve_song(artist, song, api_key):
+    """Resolve a song from the local index, falling back to Genius on a miss
+
+    Returns (song_info, from_index); song_info is None when nothing matches.
+    """
+    tracer = get_tracer()
+    index = get_song_index()
+    with tracer.span('song_index.lookup') as span:
+        song_info = index.lookup(artist, song)
+        span.set(hit=song_info is not None)
+    tracer.incr('emotify_cache_events_total', cache='song_index', result='hit' if song_info else 'miss')
+    if song_info is not None:
+        return song_info, True
+
+    song_info, _ = _genius_flights.do((normalize(artist), normalize(song)), _search_and_index, artist, song, api_key)
+    return song_info, False
+
+
+def _search_and_index(artist, song, api_key):
+    song_info = search_song_genius(artist, song, api_key)
+    if song_info is not None:
+        get_song_index().add(song_info, artist, song)
+    return song_info
+
+
+def build_analysis_prompt(song_info, fields=None):
+    """Build the Gemini prompt for a song
+
+    The response schema describes every field, so the prompt only names the
+    song. ``fields`` narrows the request when repairing an incomplete analysis.
+    """
+    prompt = (
+        f"Analyze the emotions of the song \"{song_info['title']}\" by {song_info['artist']}. "
+        "Base every field on this specific song's lyrics, production and emotional journey, "
+        "not generic descriptions. Keep text fields concise."
+    )
+    if fields:
+        prompt += f" Return only these fields: {', '.join(fields)}."
+    return prompt
+
+
+def generation_config(fields=FIELDS):
+    """Gemini JSON-mode settings that constrain the response to the schema for fields"""
+    return {'response_mime_type': 'application/json', 'response_schema': schema_for(fields)}
+
+
+def analysis_fingerprint():
+    """Hash of everything that shapes an analysis: the model, prompt template and response schema"""
+    template = build_analysis_prompt({'title': '{title}', 'artist': '{artist}'})
+    return hashlib.sha256(f"{GEMINI_MODEL}\n{template}\n{SCHEMA_FINGERPRINT}".encode('utf-8')).hexdigest()[:16]
+
+
+def _flight_key(song_info):
+    return song_info['id'], analysis_fingerprint()
+
+
+def parse_analysis_json(response_text):
+    """Extract the analysis object from Gemini's response text"""
+    try:
+        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
+        if json_match:
+            return json.loads(json_match.group())
+        return json.loads(response_text)
+    except json.JSONDecodeError as e:
+        raise GeminiResponseError(str(e), response_text) from e
+
+
+def parse_analysis_fields(response_text):
+    """Parse whatever top-level fields of the analysis object are intact
+
+    A truncated or partly malformed response still yields every member that
+    parses on its own, so only the rest has to be requested again.
+    """
+    try:
+        data = parse_analysis_json(response_text)
+        if isinstance(data, dict):
+            return data
+    except GeminiResponseError:
+        pass
+    return dict(IncrementalJSONObjectParser().feed(response_text))
+
+
+def _lookup_cached_analysis(song_info):
+    tracer = get_tracer()
+    with tracer.span('analysis_cache.lookup') as span:
+        cached = get_analysis_cache().get(song_info['id'], analysis_fingerprint())
+        result = 'miss' if cached is None else 'hit' if cached.fresh else 'stale'
+        span.set(hit=cached is not None, result=result)
+    tracer.incr('emotify_cache_events_total', cache='analysis', result=result)
+    return cached
+
+
+def _gemini_model():
+    # Imported lazily: the Gemini SDK is slow to import and cached hits never need it
+    import google.generativeai as genai
+
+    return genai, genai.GenerativeModel(GEMINI_MODEL)
+
+
+def _reserve_gemini(api_key, prompt, expires=None, wait=True):
+    """Wait for room in the Gemini quota for one call with this prompt, but not past `expires`
+
+    With wait=False, raise RateLimitTimeout unless there is room right now.
+    """
+    timeout = 0.0 if not wait else None if expires is None else remaining(expires)
+    return get_rate_limiter().acquire(
+        'gemini', api_key, tokens=estimate_tokens(prompt) + GEMINI_OUTPUT_TOKEN_ESTIMATE, timeout=timeout
+    )
+
+
+class _GeminiRequest:
+    """A request for HedgedCaller: one blocking generate_content call and the quota granted for it
+
+    The grant is settled when the request ends, however it ends, and
+    refunded in full by ``drop`` if the request is abandoned before it is sent.
+    """
+
+    def __init__(self, model, prompt, config, grant):
+        self.model = model
+        self.prompt = prompt
+        self.config = config
+        self.grant = grant
+        self._sent = False
+        self._dropped = False
+        self._lock = threading.Lock()
+
+    def __call__(self, timeout):
+        with self._lock:
+            if self._dropped:
+                raise DeadlineExceeded("Gemini request abandoned before it was sent")
+            self._sent = True
+        response = None
+        try:
+            response = self.model.generate_content(
+                self.prompt, generation_config=self.config, request_options={'timeout': timeout}
+            )
+            # Reading the text here keeps any parsing error inside the timed attempt
+            return response, response.text
+        finally:
+            _settle_gemini(self.grant, response)
+
+    def drop(self):
+        with self._lock:
+            if self._sent or self._dropped:
+                return
+            self._dropped = True
+        get_rate_limiter().refund(self.grant)
+
+
+def _call_gemini(caller, model, prompt, config, grant, api_key, expires):
+    """Send a prompt through a HedgedCaller; returns (response, text)
+
+    Every grant taken for it, the hedge's included, is settled or refunded.
+    """
+    requests = [_GeminiRequest(model, prompt, config, grant)]
+
+    def reserve_hedge():
+        requests.append(_GeminiRequest(model, prompt, config, _reserve_gemini(api_key, prompt, wait=False)))
+        return requests[-1]
+
+    try:
+        return caller.call(requests[0], expires, reserve_hedge)
+    finally:
+        for request in requests:
+            request.drop()
+
+
+def _settle_gemini(grant, response):
+    """Charge a call's actual tokens; a sent call that got no response gets its tokens back"""
+    if response is None:
+        get_rate_limiter().settle(grant, 0)
+        return
+    usage = getattr(response, 'usage_metadata', None)
+    get_rate_limiter().settle(grant, getattr(usage, 'total_token_count', None))
+
+
+def _repair_fields(model, song_info, fields, api_key, expires):
+    """Re-request only the given fields; returns the ones that came back valid"""
+    tracer = get_tracer()
+    repaired = {}
+    for attempt in range(1, GEMINI_REPAIR_ATTEMPTS + 1):
+        missing = [field for field in fields if field not in repaired]
+        if not missing:
+            break
+        prompt = build_analysis_prompt(song_info, missing)
+        with tracer.span('gemini.repair', attempt=attempt, fields=','.join(missing)) as span:
+            try:
+                grant = _reserve_gemini(api_key, prompt, expires)
+                _, response_text = _call_gemini(
+                    _repair_calls, model, prompt, generation_config(missing), grant, api_key, expires
+                )
+            except Exception as e:
+                # The fields already received are still worth showing
+                logger.warning("Gemini repair request failed: %s", e)
+                span.set(error=type(e).__name__)
+                break
+            valid, _ = validate_analysis(parse_analysis_fields(response_text))
+            repaired.update((field, valid[field]) for field in missing if field in valid)
+            span.set(repaired=sum(field in valid for field in missing))
+        tracer.incr('emotify_payload_bytes_total', len(response_text.encode()), stage='gemini.repair')
+
+    for field in fields:
+        tracer.incr('emotify_gemini_field_repairs_total', field=field, result='repaired' if field in repaired else 'failed')
+    return repaired
+
+
+def _finish_analysis(result, song_info, store, response_text):
+    if not result:
+        raise GeminiResponseError("Gemini returned no usable analysis fields", response_text)
+    missing = [field for field in FIELDS if field not in result]
+    if missing:
+        # Incomplete analyses are returned but never cached, so the next run tries again
+        logger.warning("Gemini analysis is missing fields after repair: %s", ', '.join(missing))
+    elif store:
+        store_analysis(song_info, result)
+
+
+def analyze_with_gemini(song_info, api_key):
+    """Use Gemini to provide comprehensive song analysis
+
+    A cached analysis from an older prompt, schema or model is returned
+    immediately and regenerated in the background.
+    """
+    cached = _lookup_cached_analysis(song_info)
+    if cached is not None:
+        if not cached.fresh:
+            refresh_in_background(song_info, api_key)
+        return cached.analysis
+
+    result, _ = _gemini_flights.do(_flight_key(song_info), _generate_analysis, song_info, True, api_key)
+    return result
+
+
+def regenerate_analysis(song_info, api_key):
+    """Generate and cache a new analysis under the current version, whatever is cached
+
+    Raises IncompleteAnalysisError when the new analysis is missing fields,
+    since it was then not cached and the old one is still in place.
+    """
+    result, _ = _gemini_flights.do(_flight_key(song_info), _generate_analysis, song_info, True, api_key)
+    require_complete(result)
+    return result
+
+
+_refresh_executor = None
+_refreshing = set()
+_refresh_lock = threading.Lock()
+
+
+def refresh_in_background(song_info, api_key):
+    """Queue a regeneration of a song's analysis unless one is already queued; returns whether it was"""
+    global _refresh_executor
+    with _refresh_lock:
+        if song_info['id'] in _refreshing:
+            return False
+        _refreshing.add(song_info['id'])
+        if _refresh_executor is None:
+            _refresh_executor = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix='emotify-refresh')
+    _refresh_executor.submit(_refresh, song_info, api_key)
+    return True
+
+
+def _refresh(song_info, api_key):
+    tracer = get_tracer()
+    try:
+        # Refreshes only replace an analysis the user already has, so they yield quota to live requests
+        with lane('batch'), tracer.span('analysis.refresh', song_id=song_info['id']):
+            regenerate_analysis(song_info, api_key)
+        tracer.incr('emotify_analysis_refreshes_total', result='ok')
+    except Exception as e:
+        logger.warning("Background refresh of song %s failed, keeping the stale analysis: %s", song_info['id'], e)
+        tracer.incr('emotify_analysis_refreshes_total', result='error')
+    finally:
+        with _refresh_lock:
+            _refreshing.discard(song_info['id'])
+
+
+def _generate_analysis(song_info, store, api_key):
+    genai, model = _gemini_model()
+    genai.configure(api_key=api_key)
+    prompt = build_analysis_prompt(song_info)
+    expires = expires_at()
+
+    grant = _reserve_gemini(api_key, prompt, expires)
+    tracer = get_tracer()
+    with tracer.span('gemini.call', prompt_chars=len(prompt)) as span:
+        _, response_text = _call_gemini(_gemini_calls, model, prompt, generation_config(), grant, api_key, expires)
+        response_text = response_text.strip()
+        span.set(response_chars=len(response_text))
+    tracer.incr('emotify_payload_bytes_total', len(response_text.encode()), stage='gemini.call')
+    with tracer.span('gemini.parse'):
+        result, invalid = validate_analysis(parse_analysis_fields(response_text))
+
+    if invalid:
+        result.update(_repair_fields(model, song_info, invalid, api_key, expires))
+    _finish_analysis(result, song_info, store, response_text)
+    return result
+
+
+def stream_analysis_with_gemini(song_info, api_key):
+    """Stream a Gemini analysis, yielding (field, value) pairs as each field completes
+
+    Cached analyses are yielded immediately, and stale ones are regenerated
+    in the background. Fields that arrive missing or malformed are
+    re-requested once the stream ends and yielded after the rest. The
+    assembled result is cached once it is complete.
+    """
+    cached = _lookup_cached_analysis(song_info)
+    if cached is not None:
+        if not cached.fresh:
+            refresh_in_background(song_info, api_key)
+        yield from cached.analysis.items()
+        return
+
+    yield from _gemini_flights.stream(_flight_key(song_info), _stream_analysis, song_info, True, api_key)
+
+
+def _stream_analysis(song_info, store, api_key):
+    genai, model = _gemini_model()
+    genai.configure(api_key=api_key)
+    prompt = build_analysis_prompt(song_info)
+
+    # Spans can't stay open across yields, so time only the work done inside this
+    # generator (waiting on Gemini, parsing) and record it once the stream ends
+    tracer = get_tracer()
+    wait_time = parse_time = 0.0
+    first_field_at = None
+    parser = IncrementalJSONObjectParser()
+    chunks = []
+    last_chunk = None
+    result = {}
+
+    expires = expires_at()
+    grant = _reserve_gemini(api_key, prompt, expires)
+    try:
+        # The SDK applies the timeout to the whole stream, which is never hedged
+        timeout = _stream_calls.timeout(expires)
+        started = time.perf_counter()
+        stream = iter(model.generate_content(
+            prompt, generation_config=generation_config(), stream=True, request_options={'timeout': timeout}
+        ))
+        wait_time += time.perf_counter() - started
+        while True:
+            started = time.perf_counter()
+            chunk = next(stream, None)
+            wait_time += time.perf_counter() - started
+            if chunk is None:
+                break
+
+            last_chunk = chunk
+            chunks.append(chunk.text)
+            started = time.perf_counter()
+            fields = []
+            for key, value in parser.feed(chunk.text):
+                try:
+                    fields.append((key, validate_field(key, value)))
+                except ValueError:
+                    pass  # Repaired once the stream ends
+            parse_time += time.perf_counter() - started
+            for key, value in fields:
+                if first_field_at is None:
+                    first_field_at = wait_time + parse_time
+                result[key] = value
+                yield key, value
+
+        _stream_calls.latency.record(wait_time)
+    finally:
+        # Only the final chunk of a stream carries the usage totals; a stream that failed
+        # before its first chunk is refunded
+        _settle_gemini(grant, last_chunk)
+    response_text = ''.join(chunks)
+    tracer.record(
+        'gemini.call', wait_time, prompt_chars=len(prompt), response_chars=len(response_text), chunks=len(chunks),
+        first_field_ms=round(first_field_at * 1000, 3) if first_field_at is not None else None
+    )
+    tracer.incr('emotify_payload_bytes_total', len(response_text.encode()), stage='gemini.call')
+
+    if not parser.complete:
+        # The object never closed cleanly; fall back to parsing the whole response
+        started = time.perf_counter()
+        fallback, _ = validate_analysis(parse_analysis_fields(response_text.strip()))
+        parse_time += time.perf_counter() - started
+        for key, value in fallback.items():
+            if key not in result:
+                result[key] = value
+                yield key, value
+    tracer.record('gemini.parse', parse_time, fallback=not parser.complete, malformed=parser.malformed)
+
+    missing = [field for field in FIELDS if field not in result]
+    if missing:
+        for key, value in _repair_fields(model, song_info, missing, api_key, expires).items():
+            result[key] = value
+            yield key, value
+    _finish_analysis(result, song_info, store, response_text)
+
+
+def stream_speculative_analysis(artist, song, api_key):
+    """Stream an analysis of the raw query before Genius has resolved the song
+
+    Sessions speculating on the same query share one call. Nothing is
+    cached; a caller that keeps the result stores it with store_analysis.
+    """
+    provisional = {'title': song, 'artist': artist}
+    key = normalize(artist), normalize(song), analysis_fingerprint()
+    return _speculative_flights.stream(key, _stream_analysis, provisional, False, api_key)
+
+
+def has_cached_analysis(song_info):
+    """Whether a song has a cached analysis, fresh or stale, without counting a cache lookup"""
+    return get_analysis_cache().contains(song_info['id'])
+
+
+def store_analysis(song_info, analysis):
+    """Cache a complete analysis of a song under the current version"""
+    if all(field in analysis for field in FIELDS):
+        get_analysis_cache().set(song_info['id'], analysis, ANALYSIS_VERSION, analysis_fingerprint(), song_info)
+
+
+def analyze_emotions_nrclex(keywords):
+    """Analyze emotions with the precompiled NRC lexicon engine"""
+    with get_tracer().span('nrc.score', keywords=len(keywords)):
+        return get_engine().score(keywords)
+
+
+def analyze_emotions_nrclex_batch(keyword_lists, workers=1):
+    """Score many keyword lists in one vectorized pass
+
+    With workers > 1 the lists are scored in a process pool sharing a
+    memory-mapped lexicon, which pays off for corpora of many thousands.
+    """
+    if workers <= 1:
+        return get_engine().score_batch(keyword_lists, include_affect_dict=False)
+
+    from nrc_parallel import NRCPool
+
+    with NRCPool(workers=workers) as pool:
+        return list(pool.score(keyword_lists))
+
+
+def store_emotion_vector(song_info, nrc_results, gemini_analysis):
+    """Add a finished analysis to the emotion vector store"""
+    with get_tracer().span('emotion_store.add'):
+        return get_emotion_store().add_analysis(song_info, nrc_results, gemini_analysis)
+
+
+def similar_songs(song_id, k=10):
+    """Return [(song_info, similarity)] for the stored songs that feel most like song_id"""
+    with get_tracer().span('emotion_store.query', k=k):
+        return get_emotion_store().similar_to_song(song_id, k)
+
+
+def analyze_song(artist, song, genius_api_key, gemini_api_key):
+    """Run the full search -> Gemini -> NRC pipeline for one song
+
+    Returns None when Genius has no match for the query.
+    """
+    song_info, _ = resolve_song(artist, song, genius_api_key)
+    if song_info is None:
+        return None
+    return analyze_song_info(song_info, gemini_api_key)
+
+
+def analyze_song_info(song_info, gemini_api_key):
+    """Run the Gemini -> NRC pipeline for a song already resolved on Genius"""
+    gemini_analysis = analyze_with_gemini(song_info, gemini_api_key)
+
+    nrc_results = None
+    emotional_keywords = gemini_analysis.get('emotional_keywords', [])
+    if emotional_keywords:
+        nrc_results = analyze_emotions_nrclex(emotional_keywords)
+    store_emotion_vector(song_info, nrc_results, gemini_analysis)
+
+    return {
+        'song_info': song_info,
+        'gemini_analysis': gemini_analysis,
+        'nrc_results': nrc_results
+    }
@@ -0,0 +1,311 @@
+"""Columnar store of per-song emotion vectors with similarity search.
+
+Every analysis is reduced to a fixed-length, unit-length float32 vector: the
+NRC emotion distribution followed by Gemini's rated primary emotions mapped
+onto the same NRC emotions through the lexicon. Vectors live in one
+memory-mapped ``(songs x dims)`` array on disk and song metadata in SQLite,
+so the store reopens instantly and only the rows a query touches are paged
+in.
+
+Queries are cosine similarity, which for unit vectors is a single
+matrix-vector product followed by a partial sort. That is exact and takes a
+few milliseconds even at 100k+ songs. For much larger corpora an optional
+inverted-file (IVF) index clusters the vectors with spherical k-means and
+only scans the clusters nearest the query.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+from nrc_engine import EMOTIONS, get_engine, tokenize
+
+DEFAULT_STORE_PATH = os.getenv(
+    'EMOTIFY_EMOTION_STORE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.emotify_cache', 'emotions')
+)
+# Above this many songs, queries build and use the approximate IVF index automatically
+DEFAULT_IVF_MIN_ROWS = int(os.getenv('EMOTIFY_IVF_MIN_ROWS', '500000'))
+DEFAULT_NPROBE = 8
+
+VECTOR_DIM = 2 * len(EMOTIONS)
+INITIAL_CAPACITY = 1024
+
+
+def _intensity(emotion):
+    try:
+        return float(emotion.get('intensity', 5))
+    except (TypeError, ValueError):
+        return 5.0
+
+
+def emotion_vector(nrc_results, gemini_analysis):
+    """Combine NRC scores and Gemini's rated emotions into one unit-length vector"""
+    vector = np.zeros(VECTOR_DIM, dtype=np.float32)
+
+    scores = (nrc_results or {}).get('normalized_scores') or {}
+    for i, emotion in enumerate(EMOTIONS):
+        vector[i] = scores.get(emotion, 0.0) / 100
+
+    # Gemini names emotions freely ("Regret", "Longing"), so map each name onto
+    # the NRC emotions it carries and weight it by its rated intensity
+    primary = (gemini_analysis or {}).get('primary_emotions') or []
+    if primary:
+        counts, _ = get_engine().count_batch([tokenize(str(e.get('emotion', ''))) for e in primary])
+        weights = np.array([_intensity(e) / 10 for e in primary])
+        mapped = (counts * weights[:, None]).sum(axis=0)
+        total = mapped.sum()
+        if total > 0:
+            vector[len(EMOTIONS):] = mapped / total
+
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+class IVFIndex:
+    """Spherical k-means partition of the vectors for approximate search"""
+
+    def __init__(self, centroids, assignments, rows):
+        self.centroids = centroids
+        self.rows = rows
+        order = np.argsort(assignments, kind='stable')
+        self.members = order
+        self.offsets = np.searchsorted(assignments[order], np.arange(len(centroids) + 1))
+
+    @classmethod
+    def build(cls, vectors, nlist=None, iterations=10, sample_size=50000, seed=0):
+        """Cluster the first len(vectors) rows into nlist cells (default sqrt(n))"""
+        n = len(vectors)
+        rng = np.random.default_rng(seed)
+        sample = np.asarray(vectors[np.sort(rng.choice(n, min(n, sample_size), replace=False))])
+        nlist = max(1, min(nlist or int(np.sqrt(n)), len(sample)))
+
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            norms = np.linalg.norm(sums, axis=1)
+            filled = norms > 0
+            centroids[filled] = sums[filled] / norms[filled, None]
+
+        assignments = np.empty(n, dtype=np.intp)
+        for start in range(0, n, 65536):
+            chunk = np.asarray(vectors[start:start + 65536])
+            assignments[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+        return cls(centroids, assignments, n)
+
+    def candidates(self, query, nprobe=DEFAULT_NPROBE):
+        """Rows in the nprobe cells whose centroids are closest to the query"""
+        nprobe = min(nprobe, len(self.centroids))
+        cells = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        return np.concatenate([self.members[self.offsets[c]:self.offsets[c + 1]] for c in cells])
+
+
+class EmotionStore:
+    """Memory-mapped emotion vectors plus SQLite song metadata
+
+    ``path`` is a directory; pass None for a purely in-memory store. Several
+    processes may add to the same directory.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH, ivf_min_rows=DEFAULT_IVF_MIN_ROWS):
+        self.path = path
+        self.ivf_min_rows = ivf_min_rows
+        self._lock = threading.Lock()
+        self._ivf = None
+
+        if path is None:
+            self._vectors_path = None
+            self._conn = sqlite3.connect(':memory:', check_same_thread=False, isolation_level=None)
+        else:
+            os.makedirs(path, exist_ok=True)
+            self._vectors_path = os.path.join(path, 'vectors.f32')
+            self._conn = sqlite3.connect(
+                os.path.join(path, 'songs.sqlite3'), check_same_thread=False, isolation_level=None, timeout=10
+            )
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS songs (
+                row INTEGER PRIMARY KEY,
+                song_id INTEGER UNIQUE NOT NULL,
+                info TEXT NOT NULL
+            )
+        """)
+
+        self._row_of = {}
+        self._count = 0
+        self._ids = np.full(INITIAL_CAPACITY, -1, dtype=np.int64)
+        self._vectors = self._open_vectors(INITIAL_CAPACITY)
+        self._load_rows()
+
+    def __len__(self):
+        return self._count
+
+    def _open_vectors(self, capacity):
+        if self._vectors_path is None:
+            vectors = np.zeros((capacity, VECTOR_DIM), dtype=np.float32)
+            if self._count:
+                vectors[:self._count] = self._vectors[:self._count]
+            return vectors
+
+        row_bytes = VECTOR_DIM * np.dtype(np.float32).itemsize
+        with open(self._vectors_path, 'ab') as f:
+            size = f.seek(0, os.SEEK_END)
+            capacity = max(capacity, size // row_bytes)
+            if size < capacity * row_bytes:
+                f.truncate(capacity * row_bytes)
+        return np.memmap(self._vectors_path, dtype=np.float32, mode='r+', shape=(capacity, VECTOR_DIM))
+
+    def _grow(self, count):
+        capacity = len(self._ids)
+        while capacity < count:
+            capacity *= 2
+        if capacity == len(self._ids):
+            return
+        ids = np.full(capacity, -1, dtype=np.int64)
+        ids[:self._count] = self._ids[:self._count]
+        self._vectors = self._open_vectors(capacity)
+        self._ids = ids
+
+    def _load_rows(self):
+        # A row never changes hands once taken, so only rows past the known count can be new
+        rows = self._conn.execute('SELECT row, song_id FROM songs WHERE row >= ?', (self._count,)).fetchall()
+        if not rows:
+            return
+        self._grow(max(row for row, _ in rows) + 1)
+        for row, song_id in rows:
+            self._ids[row] = song_id
+            self._row_of[song_id] = row
+            self._count = max(self._count, row + 1)
+
+    def add(self, song_info, vector):
+        """Insert or replace a song's emotion vector"""
+        song_id = song_info['id']
+        with self._lock:
+            # The write lock makes picking a row atomic across processes sharing the store,
+            # and rows appended by the others since the last add are loaded first
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._load_rows()
+                row = self._row_of.get(song_id)
+                if row is None:
+                    self._grow(self._count + 1)
+                    row = self._count
+                elif self._ivf is not None and row < self._ivf.rows:
+                    # The row may now belong to another cell
+                    self._ivf = None
+
+                self._vectors[row] = vector
+                if self._vectors_path is not None:
+                    # Vector first, metadata second: a committed row always has its vector on disk
+                    self._vectors.flush()
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO songs (row, song_id, info) VALUES (?, ?, ?)',
+                    (row, song_id, json.dumps(song_info))
+                )
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+            self._ids[row] = song_id
+            self._row_of[song_id] = row
+            self._count = max(self._count, row + 1)
+
+    def add_analysis(self, song_info, nrc_results, gemini_analysis):
+        """Store the emotion vector of a finished analysis; returns the vector"""
+        vector = emotion_vector(nrc_results, gemini_analysis)
+        if vector.any():
+            self.add(song_info, vector)
+        return vector
+
+    def vector_of(self, song_id):
+        """Return a stored song's vector, or None"""
+        with self._lock:
+            row = self._row_of.get(song_id)
+            if row is None:
+                self._load_rows()
+                row = self._row_of.get(song_id)
+            return None if row is None else np.array(self._vectors[row])
+
+    def build_index(self, nlist=None):
+        """Build (or rebuild) the approximate IVF index over the current rows"""
+        with self._lock:
+            count, vectors = self._count, self._vectors
+        ivf = IVFIndex.build(vectors[:count], nlist=nlist) if count else None
+        with self._lock:
+            self._ivf = ivf
+        return ivf
+
+    def most_similar(self, vector, k=10, exclude_ids=(), approximate=None, nprobe=DEFAULT_NPROBE):
+        """Return [(song_info, similarity)] for the k songs closest to vector
+
+        approximate=None uses the IVF index once the store reaches ivf_min_rows.
+        """
+        with self._lock:
+            # Pick up songs other processes (the backfill, the app) added since the last look
+            self._load_rows()
+            count, vectors, ids, ivf = self._count, self._vectors, self._ids, self._ivf
+        if not count or k <= 0:
+            return []
+
+        query = np.asarray(vector, dtype=np.float32)
+        if approximate is None:
+            approximate = count >= self.ivf_min_rows
+        # Rebuild once a tenth of the rows arrived after the index was built
+        if approximate and (ivf is None or count - ivf.rows > ivf.rows // 10):
+            ivf = self.build_index()
+
+        if approximate:
+            # Sorted rows keep the memory-mapped reads sequential
+            rows = np.sort(np.concatenate([ivf.candidates(query, nprobe), np.arange(ivf.rows, count)]))
+            similarities = vectors[rows] @ query
+            candidate_ids = ids[rows]
+        else:
+            similarities = np.asarray(vectors[:count] @ query)
+            candidate_ids = ids[:count]
+        if exclude_ids:
+            similarities[np.isin(candidate_ids, list(exclude_ids))] = -np.inf
+
+        k = min(k, len(similarities))
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top], kind='stable')]
+        top = top[np.isfinite(similarities[top])]
+
+        top_ids = [int(candidate_ids[i]) for i in top]
+        infos = self._infos(top_ids)
+        return [(infos[song_id], float(similarities[i])) for song_id, i in zip(top_ids, top)]
+
+    def similar_to_song(self, song_id, k=10, **kwargs):
+        """Return the songs most similar to a stored song, excluding the song itself"""
+        vector = self.vector_of(song_id)
+        if vector is None:
+            return []
+        return self.most_similar(vector, k, exclude_ids=(song_id,), **kwargs)
+
+    def _infos(self, song_ids):
+        if not song_ids:
+            return {}
+        placeholders = ','.join('?' * len(song_ids))
+        with self._lock:
+            found = self._conn.execute(
+                f'SELECT song_id, info FROM songs WHERE song_id IN ({placeholders})', song_ids
+            ).fetchall()
+        return {song_id: json.loads(info) for song_id, info in found}
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_emotion_store():
+    """Return the process-wide emotion store, opening it on first use"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = EmotionStore()
+        return _default_store
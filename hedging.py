@@ -0,0 +1,229 @@
+"""Deadlines, adaptive timeouts and hedging for Gemini calls.
+
+Gemini's latency has a long tail, and a call that never answers would hold
+a session forever. Every call therefore runs on a worker thread under a
+timeout learned from recent latencies (a multiple of the observed p99,
+clamped to configured bounds), and never past the deadline of the request
+that made it. A caller sets that deadline with ``deadline(seconds)``;
+without one, each analysis gets ``EMOTIFY_GEMINI_DEADLINE`` seconds.
+
+With ``EMOTIFY_GEMINI_HEDGE=1``, a call still running after the observed
+p95 gets a duplicate request. The first response wins and the other is
+abandoned. Hedges are capped at a share of all calls
+(``EMOTIFY_GEMINI_HEDGE_BUDGET``), and a hedge is only sent when the rate
+limiter has room for it right away, so the extra cost stays bounded.
+Streamed calls get timeouts and deadlines but are never hedged.
+
+At most ``CALL_WORKERS`` calls run at once per process. A call waits for a
+free worker only while enough of its timeout would be left to send it, and
+is refused with ``DeadlineExceeded`` otherwise, so abandoned requests
+still finishing on the workers cannot pile up a queue of work that would
+time out before it is sent.
+"""
+
+import collections
+import contextlib
+import contextvars
+import math
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from tracing import get_tracer
+
+GEMINI_DEADLINE = float(os.getenv('EMOTIFY_GEMINI_DEADLINE', '90'))
+MIN_TIMEOUT = float(os.getenv('EMOTIFY_GEMINI_MIN_TIMEOUT', '10'))
+MAX_TIMEOUT = float(os.getenv('EMOTIFY_GEMINI_MAX_TIMEOUT', '60'))
+HEDGE = os.getenv('EMOTIFY_GEMINI_HEDGE', '0').lower() in ('1', 'true', 'yes')
+HEDGE_BUDGET = float(os.getenv('EMOTIFY_GEMINI_HEDGE_BUDGET', '0.1'))
+# The timeout is this multiple of the recent p99
+TIMEOUT_MULTIPLIER = 3.0
+# Latencies remembered per call kind, and how many are needed before they are trusted
+WINDOW = 200
+MIN_SAMPLES = 20
+CALL_WORKERS = 32
+
+_deadline = contextvars.ContextVar('emotify_deadline', default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a call outlives its timeout or the request's deadline"""
+
+
+@contextlib.contextmanager
+def deadline(seconds):
+    """Bound the Gemini calls made inside this block to finish within `seconds`; nested deadlines only tighten"""
+    expires = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(expires if current is None else min(current, expires))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def expires_at(seconds=GEMINI_DEADLINE):
+    """Monotonic time by which work started now must finish: `seconds` from now or the caller's deadline, if sooner"""
+    expires = time.monotonic() + seconds
+    current = _deadline.get()
+    return expires if current is None else min(current, expires)
+
+
+def remaining(expires):
+    """Seconds left before `expires`, raising DeadlineExceeded once it has passed"""
+    left = expires - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded("Deadline passed before the Gemini call could start")
+    return left
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+class LatencyTracker:
+    """Recent latencies of one kind of call, and the timeout and hedge delay they suggest"""
+
+    def __init__(self, window=WINDOW, min_samples=MIN_SAMPLES):
+        self.min_samples = min_samples
+        self._latencies = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def percentile(self, p):
+        """The p-th percentile of recent latencies, or None until there are enough of them"""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            return percentile(self._latencies, p)
+
+    def timeout(self):
+        p99 = self.percentile(99)
+        if p99 is None:
+            return MAX_TIMEOUT
+        return min(MAX_TIMEOUT, max(MIN_TIMEOUT, p99 * TIMEOUT_MULTIPLIER))
+
+    def hedge_delay(self):
+        return self.percentile(95)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+# One slot per worker thread, so a submitted attempt never queues behind others
+_slots = threading.BoundedSemaphore(CALL_WORKERS)
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=CALL_WORKERS, thread_name_prefix='emotify-gemini')
+        return _executor
+
+
+class HedgedCaller:
+    """Runs one kind of call under adaptive timeouts, hedging slow calls when enabled"""
+
+    def __init__(self, stage, hedge=HEDGE, hedge_budget=HEDGE_BUDGET):
+        self.stage = stage
+        self.hedge = hedge
+        self.hedge_budget = hedge_budget
+        self.latency = LatencyTracker()
+        self._calls = 0
+        self._hedges = 0
+        self._lock = threading.Lock()
+
+    def timeout(self, expires):
+        """Timeout for a call starting now: the adaptive one, cut short by the deadline"""
+        return min(self.latency.timeout(), remaining(expires))
+
+    def _attempt(self, send, timeout):
+        started = time.monotonic()
+        try:
+            response = send(timeout)
+        except Exception:
+            # A call that ran out its timeout says how slow Gemini is; other errors say nothing
+            if time.monotonic() - started >= timeout * 0.99:
+                self.latency.record(timeout)
+            raise
+        self.latency.record(time.monotonic() - started)
+        return response
+
+    def _submit(self, send, timeout):
+        # Run in a copy of the caller's context so the lane and trace follow the call; the
+        # caller holds a slot for the attempt, given back once it ends or is cancelled
+        future = _get_executor().submit(contextvars.copy_context().run, self._attempt, send, timeout)
+        future.add_done_callback(lambda _: _slots.release())
+        return future
+
+    def _may_hedge(self):
+        with self._lock:
+            if self._hedges >= self.hedge_budget * self._calls:
+                return False
+            self._hedges += 1
+            return True
+
+    def call(self, send, expires, reserve_hedge=None):
+        """Return send(timeout)'s result within the adaptive timeout and the deadline
+
+        ``send`` makes one request, passing ``timeout`` on to the SDK so an
+        abandoned request ends too. ``reserve_hedge`` takes quota for a
+        duplicate and returns the request to send as it, raising
+        TimeoutError if there is no quota right now.
+        """
+        tracer = get_tracer()
+        timeout = self.timeout(expires)
+        ends = time.monotonic() + timeout
+        # Time spent waiting for a worker comes out of the call's own timeout
+        if not _slots.acquire(timeout=max(0.0, timeout - MIN_TIMEOUT)):
+            tracer.incr('emotify_gemini_rejected_total', stage=self.stage)
+            raise DeadlineExceeded(f"Gemini {self.stage} refused: all {CALL_WORKERS} call workers are busy")
+        with self._lock:
+            self._calls += 1
+        primary = self._submit(send, max(0.0, ends - time.monotonic()))
+        pending = {primary}
+        hedge = None
+
+        delay = self.latency.hedge_delay() if self.hedge else None
+        if delay is not None and delay < timeout:
+            done, _ = wait(pending, timeout=delay)
+            if not done and self._may_hedge():
+                if not _slots.acquire(blocking=False):
+                    tracer.incr('emotify_gemini_hedges_total', stage=self.stage, result='no_worker')
+                else:
+                    try:
+                        hedge_send = send if reserve_hedge is None else reserve_hedge()
+                    except TimeoutError:
+                        _slots.release()
+                        tracer.incr('emotify_gemini_hedges_total', stage=self.stage, result='no_quota')
+                    else:
+                        hedge = self._submit(hedge_send, max(0.0, ends - time.monotonic()))
+                        pending.add(hedge)
+                        tracer.incr('emotify_gemini_hedges_total', stage=self.stage, result='fired')
+
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, ends - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    if future is hedge:
+                        tracer.incr('emotify_gemini_hedge_wins_total', stage=self.stage)
+                    return future.result()
+                error = future.exception()
+
+        if not pending:
+            raise error
+        # Still running; they end on their own once the SDK's timeout fires
+        for future in pending:
+            future.cancel()
+        tracer.incr('emotify_gemini_timeouts_total', stage=self.stage)
+        raise DeadlineExceeded(f"Gemini {self.stage} gave no response within {timeout:.1f}s")
@@ -0,0 +1,92 @@
+"""Shared, pooled HTTP client for outbound API calls.
+
+A single module-level ``requests.Session`` keeps TLS connections warm across
+Streamlit sessions and reruns. Every request is bounded by connect/read
+timeouts, and 429/5xx responses are retried with exponential backoff that
+honours ``Retry-After``.
+"""
+
+import collections
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+CONNECT_TIMEOUT = float(os.getenv('EMOTIFY_HTTP_CONNECT_TIMEOUT', '3.05'))
+READ_TIMEOUT = float(os.getenv('EMOTIFY_HTTP_READ_TIMEOUT', '10'))
+POOL_CONNECTIONS = 10
+POOL_MAXSIZE = 20
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+_latencies = collections.deque(maxlen=500)
+
+
+def get_session():
+    """Return the process-wide pooled session, creating it on first use"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total=MAX_RETRIES,
+                backoff_factor=BACKOFF_FACTOR,
+                status_forcelist=RETRY_STATUSES,
+                allowed_methods=frozenset(['GET', 'HEAD']),
+                respect_retry_after_header=True,
+                raise_on_status=False
+            )
+            adapter = HTTPAdapter(
+                pool_connections=POOL_CONNECTIONS,
+                pool_maxsize=POOL_MAXSIZE,
+                max_retries=retry,
+                pool_block=False
+            )
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
+
+
+def get(url, timeout=None, **kwargs):
+    """GET a URL through the shared session and record how long it took"""
+    start = time.perf_counter()
+    status = None
+    try:
+        response = get_session().get(url, timeout=timeout or (CONNECT_TIMEOUT, READ_TIMEOUT), **kwargs)
+        status = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+        host = urlparse(url).netloc
+        _latencies.append((host, elapsed, status))
+        logger.debug("GET %s -> %s in %.1f ms", host, status, elapsed * 1000)
+
+
+def latency_stats(host=None):
+    """Summarise recent request latencies, optionally for a single host"""
+    recent = [elapsed for h, elapsed, _ in list(_latencies) if host is None or h == host]
+    if not recent:
+        return {'count': 0}
+    samples = sorted(recent)
+
+    def percentile(p):
+        return samples[min(len(samples) - 1, int(p / 100 * len(samples)))]
+
+    return {
+        'count': len(samples),
+        'last_ms': recent[-1] * 1000,
+        'p50_ms': percentile(50) * 1000,
+        'p95_ms': percentile(95) * 1000,
+        'max_ms': samples[-1] * 1000,
+    }
@@ -0,0 +1,130 @@
+"""Section-level emotion timeline built from a song's Genius lyrics page.
+
+The lyrics are pulled out of the page's ``data-lyrics-container`` blocks,
+split on their ``[Verse]``/``[Chorus]`` headers and scored section by
+section against the NRC lexicon. Scores are memoized per line and per
+section, so a chorus that repeats four times is only scored once.
+"""
+
+import re
+from html.parser import HTMLParser
+
+import http_client
+from nrc_engine import EMOTIONS, get_engine, tokenize
+from tracing import get_tracer
+
+LYRICS_HEADERS = {'User-Agent': 'Mozilla/5.0 (compatible; Emotify/1.0)'}
+_SECTION_HEADER_RE = re.compile(r'^\[(?P<label>[^\]]+)\]$')
+_VOID_TAGS = {'area', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'wbr'}
+
+
+class _LyricsExtractor(HTMLParser):
+    """Collect the text of every lyrics container, turning <br> into newlines"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._container_depth = 0
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if self._container_depth:
+            if tag in _VOID_TAGS:
+                if tag == 'br' and not self._skip_depth:
+                    self.parts.append('\n')
+            else:
+                self._container_depth += 1
+                # Genius nests non-lyric headers inside the container and flags them like this
+                if self._skip_depth or attrs.get('data-exclude-from-selection') == 'true':
+                    self._skip_depth += 1
+        elif tag == 'div' and attrs.get('data-lyrics-container') == 'true':
+            self._container_depth = 1
+
+    def handle_endtag(self, tag):
+        if not self._container_depth or tag in _VOID_TAGS:
+            return
+        if self._skip_depth:
+            self._skip_depth -= 1
+        self._container_depth -= 1
+        if not self._container_depth:
+            self.parts.append('\n')
+
+    def handle_data(self, data):
+        if self._container_depth and not self._skip_depth:
+            self.parts.append(data)
+
+
+def fetch_lyrics(url):
+    """Download a Genius song page and return its lyrics as plain text"""
+    tracer = get_tracer()
+    with tracer.span('lyrics.fetch') as span:
+        response = http_client.get(url, headers=LYRICS_HEADERS)
+        span.set(status=response.status_code, bytes=len(response.content))
+        tracer.incr('emotify_payload_bytes_total', len(response.content), stage='lyrics.fetch')
+        response.raise_for_status()
+    with tracer.span('lyrics.extract'):
+        extractor = _LyricsExtractor()
+        extractor.feed(response.text)
+        return ''.join(extractor.parts).strip()
+
+
+def split_sections(lyrics):
+    """Split lyrics into [(label, [lines])] using their [Section] headers"""
+    sections = []
+    label, lines = 'Intro', []
+    for raw_line in lyrics.splitlines():
+        line = raw_line.strip()
+        if not line:
+            continue
+        header = _SECTION_HEADER_RE.match(line)
+        if header:
+            if lines:
+                sections.append((label, lines))
+            # "[Chorus: Artist]" -> "Chorus"
+            label, lines = header.group('label').split(':')[0].strip(), []
+        else:
+            lines.append(line)
+    if lines:
+        sections.append((label, lines))
+    return sections
+
+
+def iter_section_emotions(sections):
+    """Yield the emotion scores of each section in order, scoring repeated lines only once"""
+    engine = get_engine()
+    line_counts = {}
+    section_results = {}
+
+    for position, (label, lines) in enumerate(sections, 1):
+        key = tuple(lines)
+        repeat = key in section_results
+        if not repeat:
+            new_lines = [line for line in dict.fromkeys(lines) if line not in line_counts]
+            if new_lines:
+                counts, _ = engine.count_batch([tokenize(line) for line in new_lines])
+                line_counts.update(zip(new_lines, counts))
+            totals = sum(line_counts[line] for line in lines)
+            section_results[key] = totals
+
+        totals = section_results[key]
+        total = int(totals.sum())
+        yield {
+            'position': position,
+            'section': label,
+            'repeat': repeat,
+            'line_count': len(lines),
+            'raw_scores': {emotion: int(totals[i]) for i, emotion in enumerate(EMOTIONS)},
+            'normalized_scores': {
+                emotion: (int(totals[i]) / total) * 100 if total else 0.0 for i, emotion in enumerate(EMOTIONS)
+            }
+        }
+
+
+def build_emotion_timeline(url):
+    """Fetch a song's lyrics and return its per-section emotion time series"""
+    lyrics = fetch_lyrics(url)
+    with get_tracer().span('lyrics.score') as span:
+        timeline = list(iter_section_emotions(split_sections(lyrics)))
+        span.set(sections=len(timeline))
+    return timeline
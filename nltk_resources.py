@@ -0,0 +1,38 @@
+"""Prefetch the NLTK corpora used by TextBlob/NRCLex.
+
+Emotify's own scoring no longer needs them, so nothing downloads them at
+runtime. Run this module to fetch them ahead of time for other TextBlob or
+NRCLex use, e.g. while building a container image:
+
+    python nltk_resources.py [--download-dir /usr/share/nltk_data]
+"""
+
+import argparse
+import sys
+
+NLTK_RESOURCES = (
+    ('tokenizers/punkt', 'punkt'),
+    ('tokenizers/punkt_tab', 'punkt_tab'),
+    ('corpora/stopwords', 'stopwords'),
+    ('taggers/averaged_perceptron_tagger', 'averaged_perceptron_tagger'),
+    ('corpora/brown', 'brown'),
+)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prefetch the NLTK corpora used by TextBlob/NRCLex")
+    parser.add_argument('--download-dir', help="Directory to store the corpora in (defaults to NLTK's own)")
+    args = parser.parse_args(argv)
+
+    import nltk
+
+    for path, package in NLTK_RESOURCES:
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            nltk.download(package, download_dir=args.download_dir)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,167 @@
+"""Precompiled NRC emotion lexicon for vectorized scoring.
+
+The NRC lexicon is compiled once into a sorted vocabulary array and a
+``(words x emotions)`` 0/1 matrix. Scoring a keyword list, or a whole batch
+of them, is then a word-id lookup followed by vectorized prefix-sum
+reductions instead of building an ``NRCLex`` object per call.
+
+The compiled arrays can also be saved as ``.npy`` files and memory-mapped
+read-only, which lets many scoring processes share one copy of the lexicon
+(see ``nrc_parallel.py``).
+"""
+
+import functools
+import os
+import re
+
+import numpy as np
+
+EMOTIONS = (
+    'fear', 'anger', 'anticipation', 'trust', 'surprise',
+    'positive', 'negative', 'sadness', 'disgust', 'joy'
+)
+
+DEFAULT_LEXICON_PATH = os.getenv(
+    'EMOTIFY_NRC_LEXICON_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.emotify_cache', 'nrc_lexicon')
+)
+
+_TOKEN_RE = re.compile(r"[a-z]+(?:['-][a-z]+)*")
+
+
+def tokenize(text):
+    """Split text into lowercase word tokens"""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def load_nrc_lexicon():
+    """Return the NRC lexicon as a {word: [emotions]} dict from the installed NRCLex"""
+    from nrclex import NRCLex
+
+    lexicon = getattr(NRCLex, 'lexicon', None)
+    if lexicon is None:
+        # NRCLex 4.x ships the lexicon as package data instead of a class attribute
+        import json
+        from importlib import resources
+        with resources.files('nrclex.data').joinpath('nrc_en.json').open('r', encoding='utf-8') as f:
+            lexicon = json.load(f)
+    return lexicon
+
+
+class NRCEngine:
+    """NRC lexicon compiled to a vocabulary index and emotion matrix"""
+
+    def __init__(self, vocab, matrix, build_index=True):
+        self.vocab = vocab
+        self.matrix = matrix
+        # The dict is fastest for short keyword lists, but every process would hold its own
+        # copy; memory-mapped engines look words up in the shared sorted vocabulary instead
+        self.index = {word: row for row, word in enumerate(vocab.tolist())} if build_index else None
+
+    @classmethod
+    def from_lexicon(cls, lexicon):
+        """Compile a {word: [emotions]} lexicon"""
+        emotion_index = {emotion: i for i, emotion in enumerate(EMOTIONS)}
+        words = sorted(lexicon)
+        matrix = np.zeros((len(words), len(EMOTIONS)), dtype=np.uint8)
+        for row, word in enumerate(words):
+            for emotion in lexicon[word]:
+                # Older lexicon dumps abbreviate anticipation
+                emotion = 'anticipation' if emotion == 'anticip' else emotion
+                if emotion in emotion_index:
+                    matrix[row, emotion_index[emotion]] = 1
+        return cls(np.array(words), matrix)
+
+    def save(self, path):
+        """Write the compiled lexicon as .npy files that ``load`` can memory-map"""
+        os.makedirs(path, exist_ok=True)
+        for name, array in (('vocab', self.vocab), ('matrix', self.matrix)):
+            # Written aside and renamed, so concurrent loaders never see a partial file
+            tmp_path = os.path.join(path, f'{name}.{os.getpid()}.tmp.npy')
+            np.save(tmp_path, np.asarray(array))
+            os.replace(tmp_path, os.path.join(path, f'{name}.npy'))
+
+    @classmethod
+    def load(cls, path):
+        """Open a saved lexicon read-only and memory-mapped, so processes share its pages"""
+        vocab = np.load(os.path.join(path, 'vocab.npy'), mmap_mode='r')
+        matrix = np.load(os.path.join(path, 'matrix.npy'), mmap_mode='r')
+        return cls(vocab, matrix, build_index=False)
+
+    def lookup(self, tokens):
+        """Map tokens to vocabulary rows; unknown tokens get -1"""
+        index = self.index
+        if index is not None:
+            return np.fromiter((index.get(token, -1) for token in tokens), dtype=np.intp, count=len(tokens))
+        if not tokens:
+            return np.empty(0, dtype=np.intp)
+
+        # Binary search of the sorted vocabulary. Tokens longer than its widest word
+        # would be truncated by the cast, so they are ruled out explicitly.
+        width = self.vocab.dtype.itemsize // np.dtype('U1').itemsize
+        queries = np.array(tokens, dtype=self.vocab.dtype)
+        rows = np.minimum(np.searchsorted(self.vocab, queries), len(self.vocab) - 1)
+        fits = np.fromiter((len(token) <= width for token in tokens), dtype=bool, count=len(tokens))
+        found = fits & (self.vocab[rows] == queries)
+        return np.where(found, rows, -1).astype(np.intp)
+
+    def count_batch(self, token_lists):
+        """Return a (len(token_lists) x emotions) matrix of raw emotion counts"""
+        lengths = np.fromiter((len(tokens) for tokens in token_lists), dtype=np.intp, count=len(token_lists))
+        flat = [token for tokens in token_lists for token in tokens]
+        rows = self.lookup(flat)
+
+        hits = np.zeros((len(flat) + 1, len(EMOTIONS)), dtype=np.int64)
+        known = rows >= 0
+        hits[1:][known] = self.matrix[rows[known]]
+        # Prefix sums turn each list's contiguous token span into a single subtraction
+        cumulative = np.cumsum(hits, axis=0)
+        ends = np.cumsum(lengths)
+        return cumulative[ends] - cumulative[ends - lengths], rows
+
+    def score_batch(self, keyword_lists, include_affect_dict=True):
+        """Score many keyword lists at once, returning one result dict per list"""
+        token_lists = [tokenize(' '.join(keywords)) for keywords in keyword_lists]
+        counts, rows = self.count_batch(token_lists)
+
+        totals = counts.sum(axis=1, keepdims=True)
+        normalized = np.divide(counts * 100.0, totals, out=np.zeros(counts.shape), where=totals > 0)
+
+        results = []
+        offset = 0
+        for tokens, row_counts, row_normalized in zip(token_lists, counts.tolist(), normalized.tolist()):
+            nonzero = [j for j, count in enumerate(row_counts) if count]
+            result = {
+                'raw_scores': {EMOTIONS[j]: row_counts[j] for j in nonzero},
+                'normalized_scores': {EMOTIONS[j]: row_normalized[j] for j in nonzero},
+                'word_count': len(tokens)
+            }
+            if include_affect_dict:
+                token_rows = rows[offset:offset + len(tokens)]
+                result['affect_dict'] = {
+                    token: [EMOTIONS[j] for j in np.flatnonzero(self.matrix[row])]
+                    for token, row in zip(tokens, token_rows) if row >= 0
+                }
+            offset += len(tokens)
+            results.append(result)
+        return results
+
+    def score(self, keywords, include_affect_dict=True):
+        """Score a single keyword list"""
+        return self.score_batch([keywords], include_affect_dict)[0]
+
+
+@functools.lru_cache(maxsize=1)
+def get_engine():
+    """Return the process-wide engine, compiling the lexicon on first use"""
+    return NRCEngine.from_lexicon(load_nrc_lexicon())
+
+
+def ensure_compiled_lexicon(path=DEFAULT_LEXICON_PATH):
+    """Save the compiled lexicon to path unless it is already there; returns path
+
+    Delete the directory after upgrading NRCLex to recompile it.
+    """
+    if not all(os.path.exists(os.path.join(path, f'{name}.npy')) for name in ('vocab', 'matrix')):
+        get_engine().save(path)
+    return path
@@ -0,0 +1,133 @@
+"""Multiprocess NRC scoring for large lyric and keyword corpora.
+
+The lexicon is compiled once into ``.npy`` files (``EMOTIFY_NRC_LEXICON_PATH``)
+that every worker memory-maps read-only. The operating system keeps a single
+copy of those pages however many workers run, and workers never import
+NRCLex or build a word dict of their own, so adding workers adds CPU rather
+than memory. Work is sent in chunks, keeping inter-process overhead small
+next to the vectorized scoring of each chunk.
+
+Usage:
+    python nrc_parallel.py corpus.jsonl -o scores.jsonl --workers 8
+
+Each input line is a JSON object with a ``keywords`` list or a ``text``
+string (for example full lyrics). Each output line is that object plus its
+``nrc_results``, in input order.
+"""
+
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from nrc_engine import DEFAULT_LEXICON_PATH, NRCEngine, ensure_compiled_lexicon
+
+DEFAULT_CHUNK_SIZE = 256
+
+_worker_engine = None
+
+
+def _init_worker(lexicon_path):
+    global _worker_engine
+    _worker_engine = NRCEngine.load(lexicon_path)
+
+
+def _score_chunk(keyword_lists, include_affect_dict):
+    return _worker_engine.score_batch(keyword_lists, include_affect_dict)
+
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class NRCPool:
+    """Process pool scoring keyword lists against a shared memory-mapped lexicon"""
+
+    def __init__(self, workers=None, chunk_size=DEFAULT_CHUNK_SIZE, lexicon_path=DEFAULT_LEXICON_PATH):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        lexicon_path = ensure_compiled_lexicon(lexicon_path)
+        # Spawned workers start from a clean interpreter instead of inheriting the
+        # parent's heap, which copy-on-write would slowly duplicate into each of them
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(lexicon_path,)
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown()
+
+    def score(self, keyword_lists, include_affect_dict=False):
+        """Yield one result per keyword list, in input order
+
+        keyword_lists may be any iterable, such as a generator over a large
+        file; only a few chunks per worker are read ahead of the results.
+        """
+        pending = collections.deque()
+        for chunk in _chunks(keyword_lists, self.chunk_size):
+            pending.append(self.executor.submit(_score_chunk, chunk, include_affect_dict))
+            if len(pending) >= 2 * self.workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def read_records(path):
+    """Yield the JSON objects of a JSONL file, skipping blank lines"""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def record_keywords(record):
+    if 'keywords' in record:
+        return [str(keyword) for keyword in record['keywords']]
+    return [str(record.get('text', ''))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a JSONL corpus against the NRC lexicon with a process pool.")
+    parser.add_argument('input', help="JSONL file with a 'keywords' list or 'text' string per line")
+    parser.add_argument('-o', '--output', required=True, help="JSONL file to write")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="Records sent to a worker at a time")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    count = 0
+    with NRCPool(workers=max(1, args.workers), chunk_size=max(1, args.chunk_size)) as pool:
+        # Records are read twice, once for keywords and once for output, instead of being held in memory
+        results = pool.score(record_keywords(record) for record in read_records(args.input))
+        with open(args.output, 'w', encoding='utf-8') as out:
+            for record, nrc_results in zip(read_records(args.input), results):
+                record['nrc_results'] = nrc_results
+                out.write(json.dumps(record) + '\n')
+                count += 1
+
+    elapsed = time.perf_counter() - started
+    print(f"Scored {count} records in {elapsed:.1f}s ({count / elapsed if elapsed else 0:.0f} records/sec)", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,191 @@
+"""Concurrent execution of the per-song analysis pipeline.
+
+``AnalysisRun`` starts each stage as soon as its inputs exist instead of
+running them one after another. The Gemini analysis and the lyric timeline
+begin in background threads the moment the song is resolved, so they overlap
+with each other and with rendering the song card. While Genius is still
+searching, Gemini can also be started speculatively on the raw query; that
+analysis is kept when the resolved song matches the query and discarded
+otherwise.
+
+Speculation spends a Gemini call before the song's Genius id is known, so
+the analysis cache can't be checked first; it is off unless
+``EMOTIFY_SPECULATIVE_GEMINI=1``. Sessions speculating on the same query
+share one call. Set ``EMOTIFY_PIPELINE_MODE=sequential`` to run every stage
+in order on the calling thread.
+"""
+
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import emotify_core as core
+from lyrics_timeline import build_emotion_timeline
+from song_index import get_song_index, normalize
+from tracing import get_tracer
+
+PIPELINE_MODE = os.getenv('EMOTIFY_PIPELINE_MODE', 'concurrent').lower()
+SPECULATIVE_GEMINI = os.getenv('EMOTIFY_SPECULATIVE_GEMINI', '0').lower() in ('1', 'true', 'yes')
+MAX_WORKERS = int(os.getenv('EMOTIFY_PIPELINE_WORKERS', '16'))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the process-wide pool that runs background pipeline stages"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='emotify-pipeline')
+        return _executor
+
+
+def _submit(func, *args):
+    # Run in a copy of the caller's context so background spans land in the caller's trace
+    return get_executor().submit(contextvars.copy_context().run, func, *args)
+
+
+class BackgroundStream:
+    """Drain a (key, value) stream on the pipeline executor while readers replay it"""
+
+    def __init__(self, make_stream):
+        self._cond = threading.Condition()
+        self._items = []
+        self._done = False
+        self._error = None
+        self._cancelled = False
+        _submit(self._run, make_stream)
+
+    def _run(self, make_stream):
+        stream = None
+        try:
+            stream = make_stream()
+            for item in stream:
+                with self._cond:
+                    if self._cancelled:
+                        break
+                    self._items.append(item)
+                    self._cond.notify_all()
+        except Exception as e:
+            self._error = e
+        finally:
+            if stream is not None:
+                stream.close()
+            with self._cond:
+                self._done = True
+                self._cond.notify_all()
+
+    def cancel(self):
+        """Stop consuming the underlying stream"""
+        with self._cond:
+            self._cancelled = True
+
+    def replay(self):
+        """Yield every item from the start, waiting for new ones until the stream ends"""
+        position = 0
+        while True:
+            with self._cond:
+                while position == len(self._items) and not self._done:
+                    self._cond.wait()
+                items = self._items[position:]
+                done, error = self._done, self._error
+            yield from items
+            position += len(items)
+            if error is not None:
+                raise error
+            if done:
+                return
+
+    def result(self):
+        """Block until the stream ends and return its items as a dict"""
+        return dict(self.replay())
+
+
+def speculation_matches(song_info, artist, song):
+    """Whether an analysis of the raw query also describes the resolved song"""
+    return (
+        normalize(song_info['title']) == normalize(song)
+        and normalize(song_info['artist']) == normalize(artist)
+    )
+
+
+class AnalysisRun:
+    """One song's analysis, with each stage started as early as its inputs allow"""
+
+    def __init__(self, artist, song, genius_api_key, gemini_api_key, mode=PIPELINE_MODE, speculate=SPECULATIVE_GEMINI):
+        self.artist = artist
+        self.song = song
+        self.genius_api_key = genius_api_key
+        self.gemini_api_key = gemini_api_key
+        self.concurrent = mode == 'concurrent'
+        self.speculate = self.concurrent and speculate
+        self.song_info = None
+        self.from_index = False
+        # None when no speculative analysis ran, otherwise whether it was kept
+        self.speculation_kept = None
+        self._speculation = None
+        self._gemini = None
+        self._timeline = None
+
+    def resolve(self):
+        """Resolve the song, starting Gemini on the raw query while Genius searches
+
+        Returns (song_info, from_index) like ``emotify_core.resolve_song``.
+        """
+        # Indexed songs resolve instantly, so there is nothing to overlap with
+        if self.speculate and get_song_index().lookup(self.artist, self.song) is None:
+            self._speculation = BackgroundStream(
+                lambda: core.stream_speculative_analysis(self.artist, self.song, self.gemini_api_key)
+            )
+
+        try:
+            self.song_info, self.from_index = core.resolve_song(self.artist, self.song, self.genius_api_key)
+        finally:
+            if self.song_info is None:
+                self._discard_speculation()
+        return self.song_info, self.from_index
+
+    def start_analysis(self):
+        """Start the Gemini analysis and lyric timeline of the resolved song in the background"""
+        if not self.concurrent or self.song_info is None:
+            return
+
+        speculation = self._speculation
+        if speculation is not None:
+            if (speculation_matches(self.song_info, self.artist, self.song)
+                    and not core.has_cached_analysis(self.song_info)):
+                self.speculation_kept = True
+                get_tracer().incr('emotify_speculative_analyses_total', outcome='kept')
+                self._gemini = speculation
+                _submit(self._store_speculation, speculation)
+            else:
+                self._discard_speculation()
+
+        if self._gemini is None:
+            self._gemini = BackgroundStream(
+                lambda: core.stream_analysis_with_gemini(self.song_info, self.gemini_api_key)
+            )
+        self._timeline = _submit(build_emotion_timeline, self.song_info['url'])
+
+    def _store_speculation(self, speculation):
+        core.store_analysis(self.song_info, speculation.result())
+
+    def _discard_speculation(self):
+        if self._speculation is not None and self.speculation_kept is None:
+            self._speculation.cancel()
+            self.speculation_kept = False
+            get_tracer().incr('emotify_speculative_analyses_total', outcome='discarded')
+
+    def stream_analysis(self):
+        """Yield the Gemini analysis as (field, value) pairs as they complete"""
+        if self._gemini is None:
+            return core.stream_analysis_with_gemini(self.song_info, self.gemini_api_key)
+        return self._gemini.replay()
+
+    def timeline(self):
+        """Return the song's lyric emotion timeline"""
+        if self._timeline is None:
+            return build_emotion_timeline(self.song_info['url'])
+        return self._timeline.result()
@@ -0,0 +1,270 @@
+"""Cross-process token-bucket rate limiting for the Gemini and Genius quotas.
+
+Streamlit replicas, the JSON API and batch workers on the same host all draw
+on the same API keys, so the buckets live in a shared SQLite file instead of
+process memory. Each (service, API key) pair has a requests-per-minute
+bucket and, for Gemini, a tokens-per-minute bucket; a call goes ahead once
+both hold enough.
+
+Callers waiting for capacity queue in the same database, ordered by lane and
+then by arrival. A caller only takes from the buckets if they also hold
+enough for everyone queued ahead of it, so interactive page requests always
+go ahead of batch jobs that are already waiting, while uncontended calls
+never queue at all. Time spent queued is recorded as a
+``ratelimit.<service>.<lane>`` stage.
+"""
+
+import collections
+import contextlib
+import contextvars
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from tracing import get_tracer
+
+DEFAULT_RATE_LIMIT_PATH = os.getenv(
+    'EMOTIFY_RATE_LIMIT_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.emotify_cache', 'ratelimit.sqlite3')
+)
+
+# Lower numbers are served first
+LANES = {'interactive': 0, 'batch': 1}
+POLL_INTERVAL = 0.05
+# A waiter that hasn't polled for this long belongs to a process that died
+STALE_WAITER_SECONDS = 10.0
+
+Limit = collections.namedtuple('Limit', ['requests_per_minute', 'tokens_per_minute'])
+
+
+def limits_from_env():
+    """Per-service limits from the environment; 0 disables a limit"""
+    return {
+        'gemini': Limit(float(os.getenv('EMOTIFY_GEMINI_RPM', '60')), float(os.getenv('EMOTIFY_GEMINI_TPM', '1000000'))),
+        'genius': Limit(float(os.getenv('EMOTIFY_GENIUS_RPM', '300')), 0.0)
+    }
+
+
+def estimate_tokens(text):
+    """Rough token count of a prompt, about four characters per token"""
+    return len(text) // 4 + 1
+
+
+class RateLimitTimeout(TimeoutError):
+    """Raised when a call could not get through the rate limiter before its timeout"""
+
+
+class Grant:
+    """Capacity taken for one call; the token estimate is corrected with ``settle``
+
+    ``tokens`` is what was actually taken from the token bucket, which may be
+    less than the estimate asked for.
+    """
+
+    def __init__(self, service, token_bucket, tokens, waited, request_bucket=None):
+        self.service = service
+        self.token_bucket = token_bucket
+        self.tokens = tokens
+        self.waited = waited
+        self.request_bucket = request_bucket
+
+
+_lane = contextvars.ContextVar('emotify_rate_limit_lane', default='interactive')
+
+
+@contextlib.contextmanager
+def lane(name):
+    """Queue the rate-limited calls made inside this block in the given lane"""
+    if name not in LANES:
+        raise ValueError(f"Unknown lane {name!r}, expected one of {', '.join(LANES)}")
+    token = _lane.set(name)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+def current_lane():
+    return _lane.get()
+
+
+class RateLimiter:
+    """Token buckets and priority queues shared through one SQLite file
+
+    ``path`` may be None for a limiter private to this process.
+    """
+
+    def __init__(self, path=DEFAULT_RATE_LIMIT_PATH, limits=None):
+        self.path = path
+        self.limits = limits_from_env() if limits is None else limits
+        self._lock = threading.Lock()
+
+        if path is None:
+            self._conn = sqlite3.connect(':memory:', check_same_thread=False, isolation_level=None)
+        else:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS buckets (
+                name TEXT PRIMARY KEY,
+                level REAL NOT NULL,
+                updated REAL NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS waiters (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                queue TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                tokens REAL NOT NULL,
+                seen REAL NOT NULL
+            )
+        """)
+        self._conn.execute('CREATE INDEX IF NOT EXISTS waiters_order ON waiters (queue, priority, id)')
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # IMMEDIATE takes the write lock up front, so reading and updating a bucket is atomic across processes
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    def acquire(self, service, api_key, tokens=0, timeout=None):
+        """Wait until one call costing ``tokens`` fits the service's limits; returns a Grant"""
+        limit = self.limits.get(service)
+        if limit is None or not (limit.requests_per_minute or limit.tokens_per_minute):
+            return Grant(service, None, 0, 0.0)
+
+        queue = f"{service}:{hashlib.sha256((api_key or '').encode('utf-8')).hexdigest()[:16]}"
+        costs = []
+        request_bucket = None
+        if limit.requests_per_minute:
+            request_bucket = f"{queue}:requests"
+            costs.append((request_bucket, limit.requests_per_minute, 1))
+        token_bucket = None
+        charged = 0
+        if limit.tokens_per_minute and tokens:
+            token_bucket = f"{queue}:tokens"
+            # A call larger than the whole bucket could never go ahead; let it drain the bucket instead
+            charged = min(tokens, limit.tokens_per_minute)
+            costs.append((token_bucket, limit.tokens_per_minute, charged))
+
+        lane_name = current_lane()
+        started = time.time()
+        waiter = None
+        try:
+            while True:
+                delay, waiter = self._try_take(queue, waiter, LANES[lane_name], costs, token_bucket)
+                if not delay:
+                    break
+                if timeout is not None and time.time() - started + delay > timeout:
+                    raise RateLimitTimeout(f"{service} rate limit: no capacity within {timeout:.1f}s")
+                time.sleep(min(delay, 1.0))
+        except BaseException:
+            if waiter is not None:
+                with self._transaction() as conn:
+                    conn.execute('DELETE FROM waiters WHERE id = ?', (waiter,))
+            raise
+
+        waited = time.time() - started
+        get_tracer().record(f'ratelimit.{service}.{lane_name}', waited, queued_ms=round(waited * 1000, 3))
+        return Grant(service, token_bucket, charged, waited, request_bucket)
+
+    def _try_take(self, queue, waiter, priority, costs, token_bucket):
+        """Take the costs if the buckets also cover everyone queued ahead; otherwise queue and return the wait
+
+        Returns (delay, waiter); waiter is the caller's queue entry, created on its first unsuccessful try.
+        """
+        now = time.time()
+        tokens = sum(cost for name, _, cost in costs if name == token_bucket)
+        with self._transaction() as conn:
+            if waiter is None:
+                ahead = conn.execute(
+                    'SELECT COUNT(*), TOTAL(tokens) FROM waiters WHERE queue = ? AND priority <= ?', (queue, priority)
+                ).fetchone()
+            else:
+                if not conn.execute('UPDATE waiters SET seen = ? WHERE id = ?', (now, waiter)).rowcount:
+                    # Dropped as stale after a long pause (e.g. a suspended process); rejoin in the same place
+                    conn.execute(
+                        'INSERT INTO waiters (id, queue, priority, tokens, seen) VALUES (?, ?, ?, ?, ?)',
+                        (waiter, queue, priority, tokens, now)
+                    )
+                conn.execute('DELETE FROM waiters WHERE seen < ?', (now - STALE_WAITER_SECONDS,))
+                ahead = conn.execute(
+                    'SELECT COUNT(*), TOTAL(tokens) FROM waiters WHERE queue = ? AND (priority < ? OR (priority = ? AND id < ?))',
+                    (queue, priority, priority, waiter)
+                ).fetchone()
+
+            levels = []
+            delay = 0.0
+            for name, per_minute, cost in costs:
+                row = conn.execute('SELECT level, updated FROM buckets WHERE name = ?', (name,)).fetchone()
+                level = per_minute if row is None else min(per_minute, row[0] + (now - row[1]) * per_minute / 60)
+                levels.append(level)
+                # Whatever the callers ahead are waiting for stays reserved for them
+                needed = cost + (ahead[1] if name == token_bucket else ahead[0])
+                if level < needed:
+                    delay = max(delay, (needed - level) * 60 / per_minute)
+
+            if delay:
+                if waiter is None:
+                    waiter = conn.execute(
+                        'INSERT INTO waiters (queue, priority, tokens, seen) VALUES (?, ?, ?, ?)', (queue, priority, tokens, now)
+                    ).lastrowid
+                # Behind others, check back soon: they may take less time than the refill estimate
+                return (min(delay, POLL_INTERVAL) if ahead[0] else delay), waiter
+
+            for (name, _, cost), level in zip(costs, levels):
+                conn.execute(
+                    'INSERT OR REPLACE INTO buckets (name, level, updated) VALUES (?, ?, ?)', (name, level - cost, now)
+                )
+            if waiter is not None:
+                conn.execute('DELETE FROM waiters WHERE id = ?', (waiter,))
+            return 0.0, waiter
+
+    def settle(self, grant, used_tokens):
+        """Charge (or refund) the difference between the tokens a call was charged and those it used"""
+        if grant.token_bucket is None or used_tokens is None:
+            return
+        with self._transaction() as conn:
+            conn.execute('UPDATE buckets SET level = level - ? WHERE name = ?', (used_tokens - grant.tokens, grant.token_bucket))
+
+    def refund(self, grant):
+        """Give back everything a grant took, request and tokens, for a call that was never sent"""
+        with self._transaction() as conn:
+            if grant.request_bucket is not None:
+                conn.execute('UPDATE buckets SET level = level + 1 WHERE name = ?', (grant.request_bucket,))
+            if grant.token_bucket is not None:
+                conn.execute('UPDATE buckets SET level = level + ? WHERE name = ?', (grant.tokens, grant.token_bucket))
+
+    def queued(self):
+        """Number of callers currently waiting, by service and lane"""
+        lane_names = {priority: name for name, priority in LANES.items()}
+        with self._lock:
+            rows = self._conn.execute('SELECT queue, priority, COUNT(*) FROM waiters GROUP BY queue, priority').fetchall()
+        counts = {}
+        for queue, priority, count in rows:
+            key = f"{queue.split(':')[0]}.{lane_names.get(priority, priority)}"
+            counts[key] = counts.get(key, 0) + count
+        return counts
+
+
+_default_limiter = None
+_default_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """Return the process-wide rate limiter, opening it on first use"""
+    global _default_limiter
+    with _default_limiter_lock:
+        if _default_limiter is None:
+            _default_limiter = RateLimiter()
+        return _default_limiter
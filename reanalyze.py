@@ -0,0 +1,114 @@
+"""Regenerate cached analyses made by an older prompt, schema or model.
+
+Selects cached analyses that are stale under the current analysis
+fingerprint (or, with ``--older-than``, every analysis from an earlier
+``ANALYSIS_VERSION``) and regenerates them at a bounded rate. Calls run in
+the rate limiter's batch lane, so users of the app keep priority on the
+shared Gemini quota. Stale analyses keep being served until their
+replacement is stored.
+
+Usage:
+    python reanalyze.py                          # everything stale under the current version
+    python reanalyze.py --older-than 2           # only analyses from versions before 2
+    python reanalyze.py --per-minute 20 --limit 500
+    python reanalyze.py --dry-run
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+import emotify_core as core
+from analysis_cache import get_analysis_cache
+from rate_limiter import lane
+from song_index import get_song_index
+
+
+def reanalyze_one(song_info, gemini_api_key):
+    """Regenerate one song's analysis; returns 'ok' or 'error'"""
+    try:
+        with lane('batch'):
+            core.regenerate_analysis(song_info, gemini_api_key)
+        return 'ok'
+    except Exception as e:
+        print(f"Song {song_info['id']} ({song_info.get('full_title', song_info.get('title'))}) failed: "
+              f"{type(e).__name__}: {e}", file=sys.stderr)
+        return 'error'
+
+
+def run(songs, gemini_api_key, per_minute, concurrency):
+    """Regenerate songs, starting at most per_minute of them a minute with at most concurrency in flight"""
+    counts = {'ok': 0, 'error': 0}
+    counts_lock = threading.Lock()
+    slots = threading.BoundedSemaphore(concurrency)
+    interval = 60.0 / per_minute
+    started = time.perf_counter()
+
+    def finished(future):
+        with counts_lock:
+            counts[future.result()] += 1
+        slots.release()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        next_start = time.monotonic()
+        for i, song_info in enumerate(songs, 1):
+            delay = next_start - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            next_start = max(next_start, time.monotonic()) + interval
+            slots.acquire()
+            pool.submit(reanalyze_one, song_info, gemini_api_key).add_done_callback(finished)
+            if i % 10 == 0:
+                with counts_lock:
+                    print(f"{i}/{len(songs)} started | ok={counts['ok']} error={counts['error']}", file=sys.stderr)
+
+    elapsed = time.perf_counter() - started
+    print(f"Regenerated {counts['ok']} of {len(songs)} analyses in {elapsed:.1f}s ({counts['error']} errors)", file=sys.stderr)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Regenerate cached analyses from older prompt/model versions")
+    parser.add_argument('--older-than', type=int, metavar='N',
+                        help=f"Only analyses from versions before N (current version: {core.ANALYSIS_VERSION})")
+    parser.add_argument('--per-minute', type=float, default=30, help="Regenerations started per minute")
+    parser.add_argument('-c', '--concurrency', type=int, default=4, help="Regenerations in flight at once")
+    parser.add_argument('--limit', type=int, help="Regenerate at most this many, oldest first")
+    parser.add_argument('--dry-run', action='store_true', help="List what would be regenerated and exit")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    gemini_api_key = os.getenv('GEMINI_API_KEY')
+    if not gemini_api_key and not args.dry_run:
+        parser.error("GEMINI_API_KEY must be set (environment or .env file)")
+
+    entries = get_analysis_cache().stale_entries(core.analysis_fingerprint(), args.older_than, args.limit)
+    songs = []
+    skipped = 0
+    for entry in entries:
+        # Analyses cached before versioning didn't record their song; the song index usually did
+        song_info = entry.song_info or get_song_index().get(entry.song_id)
+        if song_info is None:
+            skipped += 1
+        else:
+            songs.append(song_info)
+
+    print(f"{len(songs)} analyses to regenerate ({skipped} skipped: song details unknown)", file=sys.stderr)
+    if args.dry_run:
+        for song_info in songs:
+            print(f"{song_info['id']}\t{song_info.get('full_title', song_info.get('title'))}")
+        return 0
+    if not songs:
+        return 0
+
+    counts = run(songs, gemini_api_key, max(args.per_minute, 0.1), max(1, args.concurrency))
+    return 0 if counts['error'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
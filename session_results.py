@@ -0,0 +1,106 @@
+"""Per-session memory of finished analyses.
+
+Streamlit reruns the whole script whenever a widget changes, but the Analyze
+button is only true on the run its click starts. Each finished analysis is
+therefore kept in the session's state in a compact form, holding just what
+the page draws. Reruns redraw it from memory without calling Genius or
+Gemini again. The last few analyses are kept too, so the user can switch
+between them instantly.
+"""
+
+import collections
+import os
+
+MAX_HISTORY = int(os.getenv('EMOTIFY_SESSION_HISTORY', '10'))
+
+HISTORY_KEY = 'emotify_history'
+CURRENT_KEY = 'emotify_current_song'
+
+SONG_FIELDS = ('id', 'title', 'artist', 'full_title', 'url', 'thumbnail')
+TIMELINE_FIELDS = ('position', 'section', 'repeat', 'normalized_scores')
+
+
+def compact_song_info(song_info):
+    return {key: song_info[key] for key in SONG_FIELDS if key in song_info}
+
+
+class AnalysisResult:
+    """Everything the results page draws for one song"""
+
+    __slots__ = (
+        'song_info', 'notes', 'gemini_analysis', 'cache_status', 'nrc_results',
+        'similar', 'similar_error', 'timeline', 'timeline_error', 'trace'
+    )
+
+    def __init__(self, song_info, notes=()):
+        self.song_info = compact_song_info(song_info)
+        self.notes = list(notes)
+        self.gemini_analysis = None
+        self.cache_status = None
+        self.nrc_results = None
+        self.similar = None
+        self.similar_error = None
+        self.timeline = None
+        self.timeline_error = None
+        self.trace = None
+
+    def set_nrc_results(self, nrc_results):
+        # The per-word affect dict is never drawn and is most of the result's size
+        if nrc_results is not None:
+            nrc_results = {key: value for key, value in nrc_results.items() if key != 'affect_dict'}
+        self.nrc_results = nrc_results
+
+    def set_similar(self, similar):
+        self.similar = [(compact_song_info(info), similarity) for info, similarity in similar]
+
+    def set_timeline(self, timeline):
+        self.timeline = [{key: point[key] for key in TIMELINE_FIELDS} for point in timeline]
+
+    @property
+    def label(self):
+        return f"{self.song_info['title']} · {self.song_info['artist']}"
+
+
+class ResultHistory:
+    """The session's most recent analyses, bounded, plus which one is shown"""
+
+    def __init__(self, state, max_entries=MAX_HISTORY):
+        self._state = state
+        self.max_entries = max(1, max_entries)
+        if HISTORY_KEY not in state:
+            state[HISTORY_KEY] = collections.OrderedDict()
+            state[CURRENT_KEY] = None
+
+    @property
+    def _results(self):
+        return self._state[HISTORY_KEY]
+
+    @property
+    def current_id(self):
+        return self._state[CURRENT_KEY]
+
+    def add(self, result):
+        """Remember a finished analysis and show it, forgetting the oldest beyond the bound"""
+        song_id = result.song_info['id']
+        self._results[song_id] = result
+        self._results.move_to_end(song_id)
+        while len(self._results) > self.max_entries:
+            self._results.popitem(last=False)
+        self._state[CURRENT_KEY] = song_id
+
+    def current(self):
+        """Return the analysis being shown, or None"""
+        return self._results.get(self.current_id)
+
+    def select(self, song_id):
+        """Show an earlier analysis"""
+        if song_id in self._results:
+            self._state[CURRENT_KEY] = song_id
+
+    def clear_selection(self):
+        """Stop showing any analysis, for example after a failed search"""
+        self._state[CURRENT_KEY] = None
+
+    def entries(self):
+        """Return the remembered analyses, newest first"""
+        return list(reversed(self._results.values()))
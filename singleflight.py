@@ -0,0 +1,153 @@
+"""In-process coalescing of identical upstream calls.
+
+When many sessions ask for the same song at once, only the first caller
+(the leader) runs the Genius search or Gemini analysis; everyone else with
+the same key waits for the leader and receives its result, or its exception.
+Streamed calls are shared too: waiting sessions replay the leader's stream
+item by item as it arrives.
+"""
+
+import threading
+
+from tracing import get_tracer
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.finished = False
+        self.result = None
+        self.error = None
+
+
+class _StreamCall:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.items = []
+        self.done = False
+        self.error = None
+        self.abandoned = False
+
+
+class SingleFlight:
+    """Run at most one call per key at a time, sharing its outcome with concurrent callers
+
+    ``item_key`` names each item of a streamed call. A caller that takes
+    over an abandoned stream then skips the items it already has by name,
+    since a rerun may yield them in another order; without it, they are
+    skipped by count.
+    """
+
+    def __init__(self, name, item_key=None):
+        self.name = name
+        self.item_key = item_key
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._streams = {}
+
+    def _record_shared(self):
+        get_tracer().incr('emotify_coalesced_calls_total', flight=self.name)
+
+    def do(self, key, func, *args, **kwargs):
+        """Return func(*args, **kwargs), or the result of an identical call already in flight
+
+        Returns (result, shared); shared is True when another caller did the work.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            self._record_shared()
+            with get_tracer().span(f'{self.name}.shared_wait'):
+                call.done.wait()
+            if not call.finished:
+                # The leader was interrupted rather than failing; try again ourselves
+                return self.do(key, func, *args, **kwargs)
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func(*args, **kwargs)
+            call.finished = True
+        except Exception as e:
+            call.error = e
+            call.finished = True
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stream(self, key, func, *args, **kwargs):
+        """Yield the items of func(*args, **kwargs), sharing one underlying stream per key
+
+        If the leader stops consuming before its stream finishes, a waiting
+        caller takes over and continues from where it had got to.
+        """
+        with self._lock:
+            call = self._streams.get(key)
+            leader = call is None
+            if leader:
+                call = self._streams[key] = _StreamCall()
+
+        if leader:
+            yield from self._lead_stream(key, call, func, args, kwargs)
+            return
+
+        self._record_shared()
+        position = 0
+        while True:
+            with call.cond:
+                while position == len(call.items) and not (call.done or call.abandoned):
+                    call.cond.wait()
+                items = call.items[position:]
+                done, abandoned, error = call.done, call.abandoned, call.error
+            for item in items:
+                yield item
+            position += len(items)
+
+            if error is not None:
+                raise error
+            if done:
+                return
+            if abandoned:
+                # Run the call ourselves, skipping the items already replayed
+                rerun = self.stream(key, func, *args, **kwargs)
+                if self.item_key is None:
+                    for index, item in enumerate(rerun):
+                        if index >= position:
+                            yield item
+                    return
+                seen = {self.item_key(item) for item in call.items[:position]}
+                for item in rerun:
+                    if self.item_key(item) not in seen:
+                        yield item
+                return
+
+    def _lead_stream(self, key, call, func, args, kwargs):
+        finished = False
+        try:
+            for item in func(*args, **kwargs):
+                with call.cond:
+                    call.items.append(item)
+                    call.cond.notify_all()
+                yield item
+            finished = True
+        except Exception as e:
+            call.error = e
+            finished = True
+            raise
+        finally:
+            with self._lock:
+                del self._streams[key]
+            with call.cond:
+                if finished:
+                    call.done = True
+                else:
+                    call.abandoned = True
+                call.cond.notify_all()
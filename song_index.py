@@ -0,0 +1,208 @@
+"""Local fuzzy index of previously resolved songs.
+
+Every song resolved through Genius is remembered under its canonical
+artist/title and under the query that found it. Lookups first try an exact
+match on the normalized query, then a trigram search that tolerates typos,
+so repeat searches resolve in well under a millisecond without touching the
+network. A fuzzy candidate only counts when its words line up with the
+query's one to one and every difference is a misspelling; a query with
+extra words or a different number is left to Genius, since it is most
+likely another song. The index is persisted in SQLite and rebuilt in memory on startup.
+"""
+
+import collections
+import json
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+
+DEFAULT_INDEX_PATH = os.getenv(
+    'EMOTIFY_SONG_INDEX_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.emotify_cache', 'songs.sqlite3')
+)
+
+# Minimum trigram similarity for a fuzzy hit; titles must match more closely than artists
+TITLE_THRESHOLD = 0.6
+ARTIST_THRESHOLD = 0.5
+MAX_CANDIDATES = 50
+# Words that name a different recording of a song, so they never count as typos of each other
+VERSION_WORDS = frozenset({
+    'acoustic', 'demo', 'edit', 'extended', 'instrumental', 'live', 'mix', 'part', 'pt', 'remaster',
+    'remastered', 'remix', 'reprise', 'version', 'vol'
+})
+
+
+def normalize(text):
+    """Lowercase, strip accents and punctuation, and collapse whitespace"""
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    text = re.sub(r'\(feat\..*?\)|\bfeat\..*$', ' ', text)
+    text = re.sub(r'[^a-z0-9]+', ' ', text)
+    return text.strip()
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(a, b):
+    """Dice coefficient of two trigram sets"""
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+def edit_distance(a, b, limit):
+    """Edit distance counting an adjacent swap as one edit, or limit + 1 once it exceeds limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before, previous = None, list(range(len(b) + 1))
+    for i, ch in enumerate(a, 1):
+        current = [i]
+        for j, other in enumerate(b, 1):
+            cost = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ch != other))
+            if i > 1 and j > 1 and ch == b[j - 2] and a[i - 2] == other:
+                cost = min(cost, before[j - 2] + 1)
+            current.append(cost)
+        if min(current) > limit and (before is None or min(previous) > limit):
+            return limit + 1
+        before, previous = previous, current
+    return previous[-1]
+
+
+def is_typo(query_word, known_word):
+    """Whether two differing words are plausibly one word misspelled, rather than different words"""
+    if query_word.isdigit() or known_word.isdigit() or {query_word, known_word} & VERSION_WORDS:
+        return False
+    shorter = min(len(query_word), len(known_word))
+    # Short words are too often real words a letter apart ("hell"/"hello")
+    limit = 2 if shorter >= 9 else 1 if shorter >= 5 else 0
+    return edit_distance(query_word, known_word, limit) <= limit
+
+
+def same_words(query, known):
+    """Whether a normalized query names the same thing as a known name, allowing only typos
+
+    Extra words ("remix", "again") or differing numbers ("part 1"/"part 2")
+    mean a different song, however many trigrams the names share.
+    """
+    query_words, known_words = query.split(), known.split()
+    if len(query_words) != len(known_words):
+        return False
+    return all(q == k or is_typo(q, k) for q, k in zip(query_words, known_words))
+
+
+class SongIndex:
+    """Typo-tolerant artist/title index backed by SQLite"""
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._songs = {}
+        self._exact = {}
+        self._entries = []
+        self._postings = collections.defaultdict(set)
+
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS songs (id INTEGER PRIMARY KEY, info TEXT NOT NULL)')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS aliases (
+                artist TEXT NOT NULL,
+                title TEXT NOT NULL,
+                song_id INTEGER NOT NULL,
+                PRIMARY KEY (artist, title)
+            )
+        """)
+        self._conn.commit()
+
+        for song_id, info in self._conn.execute('SELECT id, info FROM songs'):
+            self._songs[song_id] = json.loads(info)
+        for artist, title, song_id in self._conn.execute('SELECT artist, title, song_id FROM aliases'):
+            self._add_entry(artist, title, song_id)
+
+    def __len__(self):
+        return len(self._songs)
+
+    def _add_entry(self, artist, title, song_id):
+        key = (artist, title)
+        is_new = key not in self._exact
+        self._exact[key] = song_id
+        if not is_new:
+            return
+        entry_id = len(self._entries)
+        title_grams = trigrams(title)
+        self._entries.append((trigrams(artist), title_grams, key))
+        for gram in title_grams:
+            self._postings[gram].add(entry_id)
+
+    def add(self, song_info, query_artist=None, query_title=None):
+        """Remember a resolved song under its own name and the query that found it"""
+        song_id = song_info['id']
+        names = {(normalize(song_info['artist']), normalize(song_info['title']))}
+        if query_artist and query_title:
+            names.add((normalize(query_artist), normalize(query_title)))
+
+        with self._lock:
+            self._songs[song_id] = song_info
+            self._conn.execute('INSERT OR REPLACE INTO songs (id, info) VALUES (?, ?)', (song_id, json.dumps(song_info)))
+            for artist, title in names:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO aliases (artist, title, song_id) VALUES (?, ?, ?)', (artist, title, song_id)
+                )
+                self._add_entry(artist, title, song_id)
+            self._conn.commit()
+
+    def get(self, song_id):
+        """Return the song_info stored for a Genius song id, or None"""
+        with self._lock:
+            return self._songs.get(song_id)
+
+    def lookup(self, artist, title):
+        """Return the best matching song_info for an artist/title query, or None"""
+        artist, title = normalize(artist), normalize(title)
+        if not title:
+            return None
+
+        with self._lock:
+            song_id = self._exact.get((artist, title))
+            if song_id is not None:
+                return self._songs.get(song_id)
+
+            title_grams = trigrams(title)
+            shared = collections.Counter()
+            for gram in title_grams:
+                shared.update(self._postings.get(gram, ()))
+
+            artist_grams = trigrams(artist)
+            best_id, best_score = None, 0.0
+            for entry_id, _ in shared.most_common(MAX_CANDIDATES):
+                entry_artist, entry_title, key = self._entries[entry_id]
+                title_sim = similarity(title_grams, entry_title)
+                artist_sim = similarity(artist_grams, entry_artist) if artist else 1.0
+                if title_sim < TITLE_THRESHOLD or artist_sim < ARTIST_THRESHOLD:
+                    continue
+                if not same_words(title, key[1]) or (artist and not same_words(artist, key[0])):
+                    continue
+                score = 2 * title_sim + artist_sim
+                if score > best_score:
+                    best_id, best_score = self._exact[key], score
+            return self._songs.get(best_id)
+
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+def get_song_index():
+    """Return the process-wide song index, loading it on first use"""
+    global _default_index
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = SongIndex()
+        return _default_index
@@ -0,0 +1,196 @@
+"""Local cache of resized album art for the song cards.
+
+Each Genius thumbnail URL is fetched once, shrunk to the size the card
+actually displays and stored on disk, so result pages no longer make every
+browser download the full-size image from Genius's CDN. Recently used
+images are also kept in memory. The disk cache is bounded in bytes and
+evicts the least recently used images; file modification times record use,
+so the order survives restarts.
+"""
+
+import collections
+import hashlib
+import io
+import os
+import threading
+import time
+
+import http_client
+from singleflight import SingleFlight
+from tracing import get_tracer
+
+DEFAULT_THUMBNAIL_PATH = os.getenv(
+    'EMOTIFY_THUMBNAIL_CACHE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.emotify_cache', 'thumbnails')
+)
+DEFAULT_MAX_BYTES = int(float(os.getenv('EMOTIFY_THUMBNAIL_CACHE_MB', '50')) * 1024 * 1024)
+DEFAULT_MEMORY_ENTRIES = 128
+THUMBNAIL_SIZE = 200
+JPEG_QUALITY = 85
+# Images that failed to fetch aren't retried on every rerun of the page showing them
+FAILURE_TTL_SECONDS = 300
+MAX_FAILURES = 1024
+
+
+class ThumbnailUnavailable(Exception):
+    """Raised for an image whose fetch failed recently and is not retried yet"""
+
+
+def resize_image(data, size=THUMBNAIL_SIZE):
+    """Shrink an image to fit a size x size box and encode it as JPEG (PNG if it has transparency)"""
+    # Pillow ships with Streamlit, but only thumbnail misses need it
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        image.thumbnail((size, size), Image.LANCZOS)
+        out = io.BytesIO()
+        if image.mode in ('RGBA', 'LA') or 'transparency' in image.info:
+            image.save(out, format='PNG', optimize=True)
+        else:
+            image.convert('RGB').save(out, format='JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+        return out.getvalue()
+
+
+class ThumbnailCache:
+    """Resized thumbnails in a bounded in-memory LRU backed by a bounded on-disk LRU"""
+
+    def __init__(self, path=DEFAULT_THUMBNAIL_PATH, max_bytes=DEFAULT_MAX_BYTES,
+                 memory_entries=DEFAULT_MEMORY_ENTRIES, size=THUMBNAIL_SIZE):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self.size = size
+        self._lock = threading.Lock()
+        self._memory = collections.OrderedDict()
+        self._flights = SingleFlight('thumbnail')
+        # Image name -> (monotonic time of the failure, its message), oldest first
+        self._failures = collections.OrderedDict()
+
+        os.makedirs(path, exist_ok=True)
+        # Oldest first, matching the eviction order
+        files = []
+        for entry in os.scandir(path):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        self._disk = collections.OrderedDict((name, size) for _, name, size in sorted(files))
+        self._disk_bytes = sum(self._disk.values())
+
+    def _name(self, url):
+        return f"{hashlib.sha256(f'{self.size}:{url}'.encode('utf-8')).hexdigest()}.img"
+
+    def get(self, url):
+        """Return the resized image bytes for url, fetching and resizing it on a miss"""
+        name = self._name(url)
+        tracer = get_tracer()
+        with self._lock:
+            data = self._memory.get(name)
+            if data is not None:
+                self._memory.move_to_end(name)
+        if data is not None:
+            tracer.incr('emotify_cache_events_total', cache='thumbnail', result='memory')
+            return data
+
+        data = self._read_disk(name)
+        if data is not None:
+            tracer.incr('emotify_cache_events_total', cache='thumbnail', result='disk')
+        else:
+            with self._lock:
+                failed_at, message = self._failures.get(name, (None, None))
+            if failed_at is not None and time.monotonic() - failed_at < FAILURE_TTL_SECONDS:
+                tracer.incr('emotify_cache_events_total', cache='thumbnail', result='failed')
+                raise ThumbnailUnavailable(f"Fetch failed {time.monotonic() - failed_at:.0f}s ago: {message}")
+            tracer.incr('emotify_cache_events_total', cache='thumbnail', result='miss')
+            try:
+                data, _ = self._flights.do(name, self._fetch, url, name)
+            except Exception as e:
+                self._record_failure(name, f"{type(e).__name__}: {e}")
+                raise
+        self._remember(name, data)
+        return data
+
+    def _record_failure(self, name, message):
+        now = time.monotonic()
+        with self._lock:
+            self._failures[name] = (now, message)
+            self._failures.move_to_end(name)
+            # Oldest first, so expired entries and any past the cap are at the front
+            while self._failures:
+                failed_at, _ = next(iter(self._failures.values()))
+                if now - failed_at < FAILURE_TTL_SECONDS and len(self._failures) <= MAX_FAILURES:
+                    break
+                self._failures.popitem(last=False)
+
+    def _read_disk(self, name):
+        file_path = os.path.join(self.path, name)
+        try:
+            with open(file_path, 'rb') as f:
+                data = f.read()
+            os.utime(file_path)
+        except FileNotFoundError:
+            # Evicted by another process sharing the directory
+            with self._lock:
+                self._disk_bytes -= self._disk.pop(name, 0)
+            return None
+        with self._lock:
+            if name in self._disk:
+                self._disk.move_to_end(name)
+            else:
+                self._disk[name] = len(data)
+                self._disk_bytes += len(data)
+        return data
+
+    def _fetch(self, url, name):
+        tracer = get_tracer()
+        with tracer.span('thumbnail.fetch') as span:
+            response = http_client.get(url)
+            response.raise_for_status()
+            data = resize_image(response.content, self.size)
+            span.set(original_bytes=len(response.content), resized_bytes=len(data))
+        tracer.incr('emotify_payload_bytes_total', len(response.content), stage='thumbnail.fetch')
+
+        tmp_path = os.path.join(self.path, f'{name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, os.path.join(self.path, name))
+        self._add_disk(name, len(data))
+        return data
+
+    def _add_disk(self, name, size):
+        evicted = []
+        with self._lock:
+            self._disk_bytes += size - self._disk.pop(name, 0)
+            self._disk[name] = size
+            while self._disk_bytes > self.max_bytes and len(self._disk) > 1:
+                old_name, old_size = self._disk.popitem(last=False)
+                self._disk_bytes -= old_size
+                evicted.append(old_name)
+        for old_name in evicted:
+            try:
+                os.remove(os.path.join(self.path, old_name))
+            except FileNotFoundError:
+                pass
+
+    def _remember(self, name, data):
+        with self._lock:
+            self._memory[name] = data
+            self._memory.move_to_end(name)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {'memory_entries': len(self._memory), 'disk_entries': len(self._disk), 'disk_bytes': self._disk_bytes}
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_thumbnail_cache():
+    """Return the process-wide thumbnail cache, creating it on first use"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ThumbnailCache()
+        return _default_cache
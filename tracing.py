@@ -0,0 +1,252 @@
+"""Per-stage timing for the analysis pipeline.
+
+Each analysis runs inside a trace, and each pipeline stage (Genius search,
+Gemini call, JSON parse, NRC scoring, chart rendering and so on) records a
+span with its duration and attributes such as payload sizes or cache hits.
+Finished traces are kept for the debug panel and can be appended to a JSONL
+file. All spans also feed process-wide histograms and counters that can be
+exported in the Prometheus text format, for example to a node_exporter
+textfile collector.
+"""
+
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+DEFAULT_TRACE_PATH = os.getenv('EMOTIFY_TRACE_PATH')
+DEFAULT_METRICS_PATH = os.getenv('EMOTIFY_METRICS_PATH')
+
+# Histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+COUNTERS = {
+    'emotify_analysis_refreshes_total': "Stale cached analyses regenerated in the background, by result",
+    'emotify_cache_events_total': "Cache lookups by cache and result",
+    'emotify_coalesced_calls_total': "Calls that joined an identical in-flight upstream call",
+    'emotify_gemini_field_repairs_total': "Missing or malformed analysis fields re-requested from Gemini, by result",
+    'emotify_gemini_hedge_wins_total': "Hedged Gemini calls answered first by the duplicate request",
+    'emotify_gemini_hedges_total': "Duplicate Gemini requests for slow calls, by result (fired, or skipped for no_quota or no_worker)",
+    'emotify_gemini_rejected_total': "Gemini calls refused because every call worker was busy",
+    'emotify_gemini_timeouts_total': "Gemini calls abandoned at their adaptive timeout or the request's deadline",
+    'emotify_payload_bytes_total': "Bytes received or produced by each stage",
+    'emotify_speculative_analyses_total': "Gemini analyses started from the raw query, by outcome"
+}
+
+logger = logging.getLogger("emotify.tracing")
+
+_current_trace = contextvars.ContextVar('emotify_trace', default=None)
+_current_span = contextvars.ContextVar('emotify_span', default=None)
+
+
+class Span:
+    """One timed stage; attributes can be added while it runs with ``set``"""
+
+    def __init__(self, name, parent=None, attrs=None):
+        self.name = name
+        self.parent = parent
+        self.attrs = dict(attrs or {})
+        self.started_at = time.time()
+        self.duration = 0.0
+        self.error = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'parent': self.parent,
+            'started_at': self.started_at,
+            'duration_ms': round(self.duration * 1000, 3),
+            'error': self.error,
+            'attrs': self.attrs
+        }
+
+
+class Trace:
+    """The spans recorded for one analysis run"""
+
+    def __init__(self, name, attrs=None):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.attrs = dict(attrs or {})
+        self.spans = []
+        self.started_at = time.time()
+        self.duration = None
+        self._started = time.perf_counter()
+        self._tokens = None
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'name': self.name,
+            'started_at': self.started_at,
+            'duration_ms': round(self.duration * 1000, 3) if self.duration is not None else None,
+            'attrs': self.attrs,
+            'spans': [span.to_dict() for span in self.spans]
+        }
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels
+    )
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+
+class Tracer:
+    """Records spans into the current trace and aggregates them into metrics"""
+
+    def __init__(self, trace_path=DEFAULT_TRACE_PATH, metrics_path=DEFAULT_METRICS_PATH):
+        self.trace_path = trace_path
+        self.metrics_path = metrics_path
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._errors = {}
+        self._counters = {}
+
+    def start_trace(self, name, **attrs):
+        """Begin a trace that collects every span recorded in this context"""
+        trace = Trace(name, attrs)
+        trace._tokens = (_current_trace.set(trace), _current_span.set(None))
+        return trace
+
+    def finish_trace(self, trace):
+        """Close a trace and export it and the current metrics, if configured"""
+        if trace.duration is not None:
+            return trace
+        trace.duration = time.perf_counter() - trace._started
+        if _current_trace.get() is trace:
+            _current_trace.reset(trace._tokens[0])
+            _current_span.reset(trace._tokens[1])
+
+        # A failed export must never fail the analysis it describes
+        try:
+            if self.trace_path:
+                with self._lock, open(self.trace_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(trace.to_dict()) + '\n')
+            if self.metrics_path:
+                self.write_prometheus(self.metrics_path)
+        except OSError as e:
+            logger.warning("Could not export trace %s: %s", trace.trace_id, e)
+        return trace
+
+    @contextlib.contextmanager
+    def trace(self, name, **attrs):
+        trace = self.start_trace(name, **attrs)
+        try:
+            yield trace
+        finally:
+            self.finish_trace(trace)
+
+    @contextlib.contextmanager
+    def span(self, name, **attrs):
+        """Time a block as a pipeline stage; exceptions are recorded and re-raised"""
+        span = Span(name, _current_span.get(), attrs)
+        token = _current_span.set(name)
+        started = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = type(e).__name__
+            raise
+        finally:
+            span.duration = time.perf_counter() - started
+            _current_span.reset(token)
+            self._finish_span(span)
+
+    def record(self, name, duration, **attrs):
+        """Record a stage whose duration was measured by the caller"""
+        span = Span(name, _current_span.get(), attrs)
+        span.started_at -= duration
+        span.duration = duration
+        self._finish_span(span)
+        return span
+
+    def incr(self, metric, value=1, **labels):
+        """Add to one of the COUNTERS"""
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def _finish_span(self, span):
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.spans.append(span)
+
+        with self._lock:
+            histogram = self._histograms.get(span.name)
+            if histogram is None:
+                histogram = self._histograms[span.name] = [[0] * len(LATENCY_BUCKETS), 0.0, 0]
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if span.duration <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += span.duration
+            histogram[2] += 1
+            if span.error:
+                key = (span.name, span.error)
+                self._errors[key] = self._errors.get(key, 0) + 1
+
+    def prometheus_text(self):
+        """Render every metric in the Prometheus text exposition format"""
+        with self._lock:
+            histograms = {name: (list(h[0]), h[1], h[2]) for name, h in self._histograms.items()}
+            errors = dict(self._errors)
+            counters = dict(self._counters)
+
+        lines = [
+            '# HELP emotify_stage_duration_seconds Time spent in each pipeline stage',
+            '# TYPE emotify_stage_duration_seconds histogram'
+        ]
+        for stage in sorted(histograms):
+            buckets, total, count = histograms[stage]
+            for bound, bucket_count in zip(LATENCY_BUCKETS, buckets):
+                labels = _format_labels([('stage', stage), ('le', repr(bound))])
+                lines.append(f'emotify_stage_duration_seconds_bucket{labels} {bucket_count}')
+            labels = _format_labels([('stage', stage), ('le', '+Inf')])
+            lines.append(f'emotify_stage_duration_seconds_bucket{labels} {count}')
+            labels = _format_labels([('stage', stage)])
+            lines.append(f'emotify_stage_duration_seconds_sum{labels} {total!r}')
+            lines.append(f'emotify_stage_duration_seconds_count{labels} {count}')
+
+        lines.append('# HELP emotify_stage_errors_total Stages that raised, by exception type')
+        lines.append('# TYPE emotify_stage_errors_total counter')
+        for (stage, error), count in sorted(errors.items()):
+            lines.append(f'emotify_stage_errors_total{_format_labels([("stage", stage), ("error", error)])} {count}')
+
+        for metric, help_text in COUNTERS.items():
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} counter')
+            for (name, labels), value in sorted(counters.items()):
+                if name == metric:
+                    lines.append(f'{metric}{_format_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        """Atomically write the metrics to a file, as the textfile collector expects"""
+        # One temp file per thread, so concurrent traces never rename each other's file away
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+
+_default_tracer = None
+_default_tracer_lock = threading.Lock()
+
+
+def get_tracer():
+    """Return the process-wide tracer"""
+    global _default_tracer
+    with _default_tracer_lock:
+        if _default_tracer is None:
+            _default_tracer = Tracer()
+        return _default_tracer